@@ -0,0 +1,145 @@
+"""Measure how the stages of plan processing scale with plan size.
+
+Each stage is run on synthetic plans of each size, and its time and peak
+memory (as traced by tracemalloc) are reported. Results can be saved as a
+baseline, and later runs compared against it. Run it from the top of the
+repository, with `powerplan` importable (as `make bench` does):
+
+    PYTHONPATH=. python benchmarks/bench.py --save baseline.json
+    PYTHONPATH=. python benchmarks/bench.py --compare baseline.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import gc
+import io
+import json
+import os.path
+import sys
+import time
+import tracemalloc
+from collections.abc import Callable
+from functools import partial
+
+from powerplan import EquipmentSpec, Plan
+from powerplan.bom import generate_bom
+from powerplan.diagram import _final_circuit_lengths, to_dot, write_dot
+from powerplan.synthetic import sized_plan
+from powerplan.test_schedules import generate_schedule
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "..", "tests", "fixtures")
+SIZES = [10, 100, 1000, 10000]
+
+
+def _write_dot(plan: Plan):
+    write_dot(plan, io.StringIO())
+
+
+# Stages, in the order they're run. `generate` is run on a new plan each time, and the
+# other stages on a generated plan whose cached calculations have been discarded.
+STAGES: dict[str, Callable[[Plan], object]] = {
+    "generate": Plan.generate,
+    "validate": Plan.validate,
+    "grids": Plan.grids,
+    "to_dot": lambda plan: to_dot(plan).to_string(),
+    "write_dot": _write_dot,
+    "generate_bom": generate_bom,
+    "generate_schedule": generate_schedule,
+}
+
+
+def measure(func: Callable[[Plan], object], setup: Callable[[], Plan], repeat: int) -> tuple[float, int]:
+    """The best time of `repeat` runs of `func` in seconds, and the peak memory of the first in bytes.
+
+    `setup` returns the plan for each run, and isn't timed.
+    """
+    plan = setup()
+    gc.collect()
+    tracemalloc.start()
+    func(plan)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    best = float("inf")
+    for _ in range(repeat):
+        plan = setup()
+        start = time.perf_counter()
+        func(plan)
+        best = min(best, time.perf_counter() - start)
+    return best, peak
+
+
+def run(spec: EquipmentSpec, sizes: list[int], stages: list[str], repeat: int) -> dict:
+    results: dict[str, dict[str, dict[str, float]]] = {}
+    for size in sizes:
+        plan = sized_plan(spec, size)
+        plan.generate()
+        nodes = len(list(plan.nodes(include_virtual=True)))
+        results[str(size)] = size_results = {}
+
+        def generated(plan: Plan = plan) -> Plan:
+            # Measure the cold path, rather than the grids and solution cached by the last run
+            plan.invalidate()
+            _final_circuit_lengths.cache_clear()
+            return plan
+
+        for stage in stages:
+            setup = partial(sized_plan, spec, size) if stage == "generate" else generated
+            seconds, peak = measure(STAGES[stage], setup, repeat)
+            size_results[stage] = {"seconds": seconds, "peak_bytes": peak}
+            print(
+                f"{size:>6} ({nodes:>6} nodes)  {stage:<18} "
+                f"{seconds * 1000:>10.2f} ms {peak / 1e6:>10.2f} MB"
+            )
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list[str]:
+    "Stages which are slower than the baseline by more than `threshold` times."
+    regressions = []
+    for size, size_results in results.items():
+        for stage, result in size_results.items():
+            base = baseline.get(size, {}).get(stage)
+            if base is None or base["seconds"] == 0:
+                continue
+            ratio = result["seconds"] / base["seconds"]
+            if ratio > threshold:
+                regressions.append(
+                    f"{stage} at size {size}: {result['seconds'] * 1000:.2f} ms, "
+                    f"{ratio:.2f}x baseline ({base['seconds'] * 1000:.2f} ms)"
+                )
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES, help="plan sizes, in nodes")
+    parser.add_argument("--stages", nargs="+", default=list(STAGES), choices=list(STAGES))
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs of each stage")
+    parser.add_argument("--spec", default=FIXTURES, help="equipment spec directory")
+    parser.add_argument("--save", help="save results to this file")
+    parser.add_argument("--compare", help="compare results against a baseline saved with --save")
+    parser.add_argument(
+        "--threshold", type=float, default=1.25, help="slowdown relative to the baseline to report"
+    )
+    args = parser.parse_args()
+
+    results = run(EquipmentSpec(args.spec), args.sizes, args.stages, args.repeat)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for regression in regressions:
+            print(f"Regression: {regression}")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
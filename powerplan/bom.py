@@ -50,10 +50,10 @@ def generate_bom(plan: Plan):
     edge_types = defaultdict(list)
 
     for u, v, data in plan.edges():
-        if data.get("logical"):
+        if data.logical:
             continue
-        for length in data.get("cable_lengths", []):
-            edge_types[(data["current"], data["phases"], length)].append(
+        for length in data.cable_lengths or []:
+            edge_types[(data.current, data.phases, length)].append(
                 f"{u.name} -> {v.name}"
             )
 
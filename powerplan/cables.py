@@ -1,4 +1,8 @@
+from __future__ import annotations
+
+from bisect import bisect_left
 from enum import Enum
+from typing import NamedTuple
 
 from .cable_data import cable_data
 
@@ -9,46 +13,95 @@ class CableConfiguration(Enum):
     TWO_SINGLE = 3  # two single-core cables, laid touching
 
 
+class CableRating(NamedTuple):
+    """The current rating and voltage drop of a cable.
+
+    `voltage_drop` is the value from the table, which is either a scalar or
+    an `(r, x, z)` tuple. `r`, `x` and `z` are its resistive, reactive and
+    scalar components in mV/A/m. Reactance isn't tabulated for smaller cables,
+    so for scalar values `r` and `z` are the value and `x` is zero.
+    """
+
+    csa: float
+    rating: int
+    voltage_drop: float | tuple[float, float, float]
+    r: float
+    x: float
+    z: float
+
+
+# Column of the voltage drop table for each configuration
+VOLTAGE_DROP_COLUMNS = {
+    CableConfiguration.TWO_CORE: 2,  # Two-core cable, single phase AC
+    CableConfiguration.MULTI_CORE: 3,
+    CableConfiguration.TWO_SINGLE: 5,  # Two single-core cables, touching, 1ph AC
+}
+
+
+def _compile_tables() -> tuple[
+    dict[tuple[str, float, CableConfiguration], CableRating],
+    dict[tuple[str, CableConfiguration], tuple[list[int], list[float]]],
+]:
+    """Index the tables in `cable_data`.
+
+    Returns a dict of cable ratings keyed by `(methodology, csa, configuration)`,
+    and for each `(methodology, configuration)` the ratings and CSAs of cables
+    with a rating, in order of CSA.
+    """
+    ratings = {}
+    sizes = {}
+    for methodology, data in cable_data.items():
+        voltage_drops = {row[0]: row for row in data["voltage_drop"]}
+        for configuration in CableConfiguration:
+            rows = [row for row in data["ratings"] if row[configuration.value] is not None]
+            currents = [row[configuration.value] for row in rows]
+            if currents != sorted(currents):
+                raise ValueError(f"Cable ratings for {methodology}, {configuration} don't increase with CSA")
+            sizes[methodology, configuration] = (currents, [row[0] for row in rows])
+
+            for row in rows:
+                csa = row[0]
+                drop_row = voltage_drops.get(csa)
+                if drop_row is None or drop_row[VOLTAGE_DROP_COLUMNS[configuration]] is None:
+                    continue
+                drop = drop_row[VOLTAGE_DROP_COLUMNS[configuration]]
+                r, x, z = drop if isinstance(drop, tuple) else (drop, 0.0, drop)
+                ratings[methodology, csa, configuration] = CableRating(
+                    csa, row[configuration.value], drop, r, x, z
+                )
+    return ratings, sizes
+
+
+CABLE_RATINGS, CABLE_SIZES = _compile_tables()
+
+
 def select_cable_size(
     current: int, methodology: str, configuration: CableConfiguration
-) -> int | None:
+) -> float | None:
     """Return the cross sectional area for a cable at the
     provided current."""
-    ratings = cable_data[methodology]["ratings"]
-    col = configuration.value
+    currents, csas = CABLE_SIZES[methodology, configuration]
+    i = bisect_left(currents, current)
+    if i == len(csas):
+        return None
+    return csas[i]
+
 
-    for row in ratings:
-        if row[col] is not None and row[col] >= current:
-            return row[0]
-    return None
+def get_cable_rating(
+    csa: float, methodology: str, configuration: CableConfiguration
+) -> CableRating | None:
+    "The rating and voltage drop of a cable, or None if it isn't in the tables."
+    return CABLE_RATINGS.get((methodology, csa, configuration))
 
 
 def get_cable_ratings(
     csa: float, methodology: str, configuration: CableConfiguration
 ) -> dict | None:
-    data = cable_data[methodology]
-
-    voltage_drop = None
-    rating = None
-    for row in data["ratings"]:
-        if csa == row[0]:
-            rating = row[configuration.value]
-
-    if configuration == CableConfiguration.TWO_CORE:
-        col = 2  # Two-core cable, single phase AC
-    elif configuration == CableConfiguration.MULTI_CORE:
-        col = 3
-    elif configuration == CableConfiguration.TWO_SINGLE:
-        col = 5  # Two single-core cables, touching, 1ph AC
-
-    for row in data["voltage_drop"]:
-        if csa == row[0]:
-            voltage_drop = row[col]
-
-    if rating is None or voltage_drop is None:
+    rating = CABLE_RATINGS.get((methodology, csa, configuration))
+    if rating is None:
         return None
 
-    return {"rating": rating, "voltage_drop": voltage_drop}
+    return {"rating": rating.rating, "voltage_drop": rating.voltage_drop}
 
 
 def get_cable_config(connector: str, phases: int) -> CableConfiguration:
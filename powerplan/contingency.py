@@ -0,0 +1,233 @@
+"""N-1 contingency analysis.
+
+Each outage (the failure of one generator, one cable, or one input of an AMF)
+is applied to the plan's solver, which is then solved again. Nodes which are no
+longer connected to a source are reported as unsupplied, and the load, voltage
+drop and fault current of the surviving network are checked against limits.
+
+Scenarios are independent, so they're evaluated on a pool of worker
+processes, each of which is sent the solver and the limits once, as arrays.
+"""
+
+from __future__ import annotations
+
+import math
+from concurrent.futures import ProcessPoolExecutor
+from math import sqrt
+from typing import TYPE_CHECKING, NamedTuple
+
+import numpy as np
+
+from . import ureg
+from .data import AMF, Generator, PowerNode, VirtualNode
+
+if TYPE_CHECKING:
+    from .plan import Plan
+    from .solver import PlanSolver
+
+# Prospective fault current must be at least this multiple of the breaker rating
+# to ensure disconnection (type C breakers)
+TRIP_RATIO = 5.5
+
+
+class Outage(NamedTuple):
+    """A failure to analyse.
+
+    `kind` is "generator", "cable" or "amf_input". `node` is the failed
+    generator, or the downstream node of the failed cable, and `upstream` is
+    the upstream node of the cable. Nodes are given as indices into the plan
+    solver's nodes, so outages can be sent to worker processes.
+    """
+
+    kind: str
+    node: int
+    upstream: int | None = None
+
+
+class Violation(NamedTuple):
+    """A limit which is exceeded when an outage occurs.
+
+    `kind` is one of:
+      - "unsupplied": the node isn't connected to a source.
+      - "overload": the load on the node's input cable from `upstream`, or on a
+        generator, exceeds its rating. `value` and `limit` are in amps, as the
+        solver calculates a cable's current, or VA for generators.
+      - "voltage_drop": the voltage drop at the node, as a ratio of the nominal
+        L-N voltage, exceeds the limit.
+      - "fault_current": the prospective fault current at the node is too low
+        to trip its input breaker. `value` and `limit` are in amps.
+    """
+
+    scenario: str
+    node: PowerNode
+    kind: str
+    value: float | None = None
+    limit: float | None = None
+    upstream: PowerNode | None = None
+
+
+def outages(plan: Plan) -> list[Outage]:
+    "Enumerate the single failures of a plan's generators, cables and AMF inputs."
+    solver = plan.solver()
+    result = [Outage("generator", i) for i, node in enumerate(solver.nodes) if isinstance(node, Generator)]
+    for u, v, data in plan.edges():
+        if data.logical:
+            continue
+        result.append(
+            Outage("amf_input" if isinstance(v, AMF) else "cable", solver.index[v], solver.index[u])
+        )
+    return result
+
+
+def describe(plan: Plan, outage: Outage) -> str:
+    "A description of an outage, such as `cable A1 -> A2`."
+    nodes = plan.solver().nodes
+    if outage.upstream is None:
+        return f"{outage.kind} {nodes[outage.node].name}"
+    return f"{outage.kind} {nodes[outage.upstream].name} -> {nodes[outage.node].name}"
+
+
+class Limits:
+    """The limits which are checked in each scenario, as arrays indexed like the solver.
+
+    `power` is the rated power of each generator in VA, and is NaN for other
+    nodes. `rating` is the current rating of each edge, or NaN if it has none.
+    """
+
+    def __init__(self, plan: Plan, max_v_drop: float):
+        solver = plan.solver()
+        graph = plan.graph
+        self.max_v_drop = max_v_drop
+        self.virtual = np.array([isinstance(node, VirtualNode) for node in solver.nodes], dtype=bool)
+        self.power = np.full(len(solver.nodes), np.nan)
+        for i, node in enumerate(solver.nodes):
+            if isinstance(node, Generator):
+                self.power[i] = node.power.to(ureg.VA).magnitude
+
+        self.rating = np.full(len(solver.parent), np.nan)
+        for e, (u, v) in enumerate(zip(solver.parent, solver.child, strict=True)):
+            data = graph[solver.nodes[u]][solver.nodes[v]]
+            if data.current and not self.virtual[v]:
+                self.rating[e] = data.current
+
+
+def evaluate(
+    solver: PlanSolver, limits: Limits, outage: Outage | None
+) -> list[tuple[int, int | None, str, float | None, float | None]]:
+    """Apply an outage (or none) to the plan's solver, and check the surviving network.
+
+    Returns violations as `(node index, edge index, kind, value, limit)` tuples,
+    where the edge is the overloaded cable, or None for other violations.
+    """
+    # Nodes which are checked, which doesn't include a failed generator
+    checked = ~limits.virtual
+    if outage is None:
+        solver = solver.outage()
+    elif outage.upstream is None:
+        solver = solver.outage(np.flatnonzero(solver.parent == outage.node), [outage.node])
+        checked[outage.node] = False
+    else:
+        edge = (solver.parent == outage.upstream) & (solver.child == outage.node)
+        solver = solver.outage(np.flatnonzero(edge))
+
+    violations: list[tuple[int, int | None, str, float | None, float | None]] = [
+        (int(i), None, "unsupplied", None, None) for i in np.flatnonzero(checked & ~solver.supplied)
+    ]
+
+    solution = solver.solve()
+    active = solver.active
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # Apparent power on each edge, from the current the solver calculates
+        apparent = solution.current * solver.voltage[solver.child]
+        v_drop_ratio = solution.v_drop / (solver.voltage / sqrt(3))
+    generator_load = np.bincount(
+        solver.parent[active], weights=apparent[active], minlength=len(solver.own_load)
+    )
+
+    # The fault current needed to trip each node's input breaker, which is the largest of its inputs
+    trip = np.zeros(len(solver.own_load))
+    rated = active & ~np.isnan(limits.rating)
+    np.maximum.at(trip, solver.child[rated], limits.rating[rated] * TRIP_RATIO)
+
+    for i in np.flatnonzero(checked & solver.supplied):
+        if not np.isnan(limits.power[i]):
+            if generator_load[i] > limits.power[i]:
+                violations.append(
+                    (int(i), None, "overload", float(generator_load[i]), float(limits.power[i]))
+                )
+            continue
+
+        if solver.defined[i] and v_drop_ratio[i] > limits.max_v_drop:
+            violations.append((int(i), None, "voltage_drop", float(v_drop_ratio[i]), limits.max_v_drop))
+
+        if trip[i] and solver.defined[i] and solver.i_pf[i] < trip[i]:
+            violations.append((int(i), None, "fault_current", float(solver.i_pf[i]), float(trip[i])))
+
+    current = solution.current
+    for e in np.flatnonzero(rated & (current > limits.rating)):
+        violations.append(
+            (int(solver.child[e]), int(e), "overload", float(current[e]), float(limits.rating[e]))
+        )
+
+    return violations
+
+
+# The solver and limits being analysed by a worker process
+_worker_state: tuple[PlanSolver, Limits] | None = None
+
+
+def _init_worker(solver: PlanSolver, limits: Limits) -> None:
+    global _worker_state
+    _worker_state = (solver, limits)
+
+
+def _evaluate_worker(outage: Outage):
+    assert _worker_state is not None
+    return evaluate(*_worker_state, outage)
+
+
+def _worse(kind: str, value: float | None, base: float | None) -> bool:
+    "Whether the value of a violation in a scenario is worse than with no outage."
+    if value is None or base is None or math.isclose(value, base):
+        return False
+    if kind == "fault_current":
+        return value < base
+    return value > base
+
+
+def analyse(plan: Plan, processes: int | None = None, max_v_drop: float = 0.05) -> list[Violation]:
+    """Evaluate every single outage of a plan, and return the violations.
+
+    Violations which occur with no outage are reported under the scenario
+    "none", and are only repeated for an outage which makes them worse. The
+    plan's cables must have been assigned by `Plan.generate`.
+    """
+    solver = plan.solver()
+    limits = Limits(plan, max_v_drop)
+    scenarios = outages(plan)
+    base = evaluate(solver, limits, None)
+    if processes == 1 or len(scenarios) < 2:
+        results = [evaluate(solver, limits, outage) for outage in scenarios]
+    else:
+        with ProcessPoolExecutor(
+            max_workers=processes, initializer=_init_worker, initargs=(solver, limits)
+        ) as pool:
+            results = list(pool.map(_evaluate_worker, scenarios))
+
+    nodes = solver.nodes
+
+    def violation(scenario: str, i: int, e: int | None, kind: str, value, limit) -> Violation:
+        upstream = None if e is None else nodes[solver.parent[e]]
+        return Violation(scenario, nodes[i], kind, value, limit, upstream)
+
+    table = [violation("none", *v) for v in base]
+    # Violations are matched by node, and by edge for cables, so the inputs of an AMF are kept apart
+    base_values = {(i, e, kind, limit): value for i, e, kind, value, limit in base}
+    for outage, violations in zip(scenarios, results, strict=True):
+        scenario = describe(plan, outage)
+        table.extend(
+            violation(scenario, i, e, kind, value, limit)
+            for i, e, kind, value, limit in violations
+            if (key := (i, e, kind, limit)) not in base_values or _worse(kind, value, base_values[key])
+        )
+    return table
@@ -1,8 +1,10 @@
 from __future__ import annotations
 
+from collections.abc import MutableMapping
 from math import sqrt
 from typing import TYPE_CHECKING, Any, Iterable  # noqa
 
+import numpy as np
 from pint import Quantity
 
 from . import ureg
@@ -10,19 +12,176 @@ from . import ureg
 if TYPE_CHECKING:
     from .plan import Plan
 
+# Marker for a value which hasn't been calculated by `Plan.calculate_upstream`
+MISSING = object()
+
+
+def _quantity(value: float | None, unit) -> Quantity | None:
+    "Attach units to a value which the plan has calculated in SI units."
+    if value is None:
+        return None
+    return value * unit
+
+
+# The attributes of a connection, in the order they're listed
+CONNECTION_FIELDS = (
+    "current",
+    "phases",
+    "length",
+    "logical",
+    "extra_length",
+    "out_port",
+    "in_port",
+    "connector",
+    "rcd",
+    "adaptor",
+    "phase",
+    "csa",
+    "cable_lengths",
+    "impedance",
+    "resistance",
+    "reactance",
+    "voltage_drop",
+)
+_CONNECTION_FIELDS = frozenset(CONNECTION_FIELDS)
+
+
+class Connection(MutableMapping):
+    """The attributes of a connection (a cable) between two nodes.
+
+    This is the edge data stored on the plan graph. Its attributes can be
+    accessed directly, but it also behaves like the dict networkx would
+    normally use. Unset attributes are None, and aren't included when
+    iterating over the connection. Any other keys are stored in `extra`.
+    """
+
+    __slots__ = CONNECTION_FIELDS + ("extra",)
+
+    current: int | None
+    phases: int | None
+    length: float | None
+    logical: bool | None
+    extra_length: float | None
+    # Assigned by `Plan.assign_ports`
+    out_port: int | None
+    in_port: int | None
+    connector: str | None
+    rcd: str | None
+    adaptor: bool | None
+    # The supply phase (1-3, for L1-L3) of a single-phase connection
+    phase: int | None
+    # Assigned by `Plan.assign_cables`, in mm², metres, ohms/metre and volts
+    csa: float | None
+    cable_lengths: list[int] | None
+    impedance: float | None
+    resistance: float | None
+    reactance: float | None
+    voltage_drop: float | None
+    extra: dict[str, Any] | None
+
+    def __init__(self, **attrs) -> None:
+        for field in CONNECTION_FIELDS:
+            setattr(self, field, None)
+        self.extra = None
+        self.update(attrs)
+
+    def __getitem__(self, key: str) -> Any:
+        if key in _CONNECTION_FIELDS:
+            return getattr(self, key)
+        if self.extra is None:
+            raise KeyError(key)
+        return self.extra[key]
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        if key in _CONNECTION_FIELDS:
+            setattr(self, key, value)
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+
+    def __delitem__(self, key: str) -> None:
+        if key in _CONNECTION_FIELDS:
+            if getattr(self, key) is None:
+                raise KeyError(key)
+            setattr(self, key, None)
+        elif self.extra is None:
+            raise KeyError(key)
+        else:
+            del self.extra[key]
+
+    def __contains__(self, key: object) -> bool:
+        if key in _CONNECTION_FIELDS:
+            return getattr(self, key) is not None  # type: ignore[arg-type]
+        return self.extra is not None and key in self.extra
+
+    def __iter__(self):
+        for field in CONNECTION_FIELDS:
+            if getattr(self, field) is not None:
+                yield field
+        if self.extra is not None:
+            yield from self.extra
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        if key in _CONNECTION_FIELDS:
+            value = getattr(self, key)
+            return default if value is None else value
+        if self.extra is None:
+            return default
+        return self.extra.get(key, default)
+
+    def pop(self, key: str, *default: Any) -> Any:
+        if key in self:
+            value = self[key]
+            del self[key]
+            return value
+        if default:
+            return default[0]
+        raise KeyError(key)
+
+    def copy(self) -> Connection:
+        copy = Connection()
+        for field in CONNECTION_FIELDS:
+            setattr(copy, field, getattr(self, field))
+        if self.extra is not None:
+            copy.extra = dict(self.extra)
+        return copy
+
+    def __repr__(self) -> str:
+        return f"Connection({dict(self)})"
+
 
 class PowerNode:
+    __slots__ = ("name", "_type", "id", "geom", "plan", "inputs_allocated", "outputs_allocated")
+
     def __init__(
         self, name: str | None = None, type: str | None = None, id: Any | None = None, geom: str | None = None
     ) -> None:
+        self.plan: Plan | None = None
+        self._type: str | None = None
         self.name = name
         self.type = type
         self.id = id
         self.geom = geom
-        self.plan: Plan | None = None
         self.inputs_allocated: set[int] = set()
         self.outputs_allocated: set[int] = set()
 
+    @property
+    def type(self) -> str | None:
+        "The equipment reference of this node in the spec."
+        return self._type
+
+    @type.setter
+    def type(self, value: str | None) -> None:
+        if value == self._type:
+            return
+        self._type = value
+        if self.plan is not None:
+            self.plan._node_changed(self)
+
     def __repr__(self) -> str:
         cls_name = self.__class__.__name__
         if self.name:
@@ -32,7 +191,7 @@ class PowerNode:
         else:
             return f"{cls_name}({id(self)})"
 
-    def inputs(self, include_virtual: bool = False) -> Iterable[tuple[PowerNode, dict]]:
+    def inputs(self, include_virtual: bool = False) -> Iterable[tuple[PowerNode, Connection]]:
         if self.plan is None:
             raise Exception("Node is not associated with a plan")
         for node, _, data in self.plan.graph.in_edges([self], data=True):
@@ -42,7 +201,7 @@ class PowerNode:
 
     def outputs(
         self, include_virtual: bool = False
-    ) -> Iterable[tuple[PowerNode, dict]]:
+    ) -> Iterable[tuple[PowerNode, Connection]]:
         if self.plan is None:
             raise Exception("Node is not associated with a plan")
         for _, node, data in self.plan.graph.out_edges([self], data=True):
@@ -51,15 +210,29 @@ class PowerNode:
             yield (node, data)
 
     def load(self) -> Quantity:
+        "Total load downstream of this node."
+        if self.plan is not None:
+            load = self.plan.node_load(self)
+            if load is not None:
+                return load * ureg.W
         s = sum((node.load() for node, _ in self.outputs(True)), start=0 * ureg.W)
         return s
 
+    def _upstream(self, field: str, direction: PowerNode | None = None):
+        if self.plan is None:
+            return MISSING
+        return self.plan.upstream_value(field, self, direction)
+
     def source(self, ipt: PowerNode | None = None) -> PowerNode:
         """Return the power source for this node.
 
         If the node has multiple inputs you must specify which upstream node to
         look via.
         """
+        source = self._upstream("source", ipt)
+        if source is not MISSING:
+            return source
+
         if ipt is None:
             inputs = list(self.inputs())
             if len(inputs) > 1:
@@ -79,17 +252,24 @@ class PowerNode:
     @property
     def voltage(self) -> Quantity:
         "Nominal voltage L-L"
+        if self.plan is not None:
+            voltage = self.plan.node_voltage(self)
+            if voltage is not None:
+                return voltage * ureg.V
         voltages = set(ipt.voltage for ipt, _ in self.inputs())
         if len(voltages) > 1:
             raise Exception(f"Nominal voltages differ between sources: {voltages}")
         return list(voltages)[0]
 
     @property
-    def voltage_ln(self) -> int:
+    def voltage_ln(self) -> Quantity:
         "Nominal Voltage L-N"
         return self.voltage / sqrt(3)
 
     def z_e(self):
+        z_e = self._upstream("z_e")
+        if z_e is not MISSING:
+            return _quantity(z_e, ureg.ohm)
         return max(ipt.z_e() for ipt, _ in self.inputs())
 
     def i_pf(self, direction=None) -> Quantity:
@@ -103,7 +283,7 @@ class PowerNode:
         if "rating" in input_port:
             rating = input_port["rating"]
         else:
-            rating = input_port["current"]
+            rating = input_port.current
         return rating * ureg("A")
 
     def v_drop_ratio(self, direction=None):
@@ -131,6 +311,8 @@ class PowerNode:
 
 
 class PowerSource(PowerNode):
+    __slots__ = ()
+
     def r1(self):
         return 0 * ureg.ohm
 
@@ -139,10 +321,12 @@ class PowerSource(PowerNode):
 
 
 class VirtualNode(PowerNode):
-    pass
+    __slots__ = ()
 
 
 class Generator(PowerSource):
+    __slots__ = ()
+
     def get_spec(self):
         return self.plan.spec.generator.get(self.type)
 
@@ -175,10 +359,12 @@ class Generator(PowerSource):
         return (z).to(ureg.ohm)
 
     def cable_length_from_source(self, direction=None) -> Quantity | None:
-        return ureg("0m")
+        return 0 * ureg.m
 
 
 class Distro(PowerNode):
+    __slots__ = ()
+
     def _input_attrs(self, source):
         if source is None:
             inputs = list(self.inputs())
@@ -192,23 +378,30 @@ class Distro(PowerNode):
 
     def r1(self, direction=None) -> Quantity | None:
         """The phase conductor impedance from the power source to this node, in ohms."""
+        r1 = self._upstream("r1", direction)
+        if r1 is not MISSING:
+            return _quantity(r1, ureg.ohm)
+
         ipt, attrs = self._input_attrs(direction)
 
-        if not attrs.get("impedance") or not attrs.get("cable_lengths"):
+        if not attrs.impedance or not attrs.cable_lengths:
             return None
 
         if ipt.r1() is None:
             return None
 
-        # Voltage drop is quoted as r1 + r2 in mV/A/m (milliohms/m) although unit conversion
-        # is handled by pint. We need to divide by 2 to get single-leg ohms/m, then multiply
-        # by cable length
-        length = sum(attrs["cable_lengths"]) * ureg.m
-        Z = length * (attrs["impedance"] / 2) + ipt.r1()
+        # Voltage drop is quoted as r1 + r2 in mV/A/m, and stored on the cable in ohms/m.
+        # We need to divide by 2 to get single-leg ohms/m, then multiply by cable length
+        length = sum(attrs.cable_lengths)
+        Z = (length * (attrs.impedance / 2)) * ureg.ohm + ipt.r1()
         return Z
 
     def z_s(self, direction=None) -> Quantity | None:
         "Earth fault loop impedance (ohms)"
+        z_s = self._upstream("z_s", direction)
+        if z_s is not MISSING:
+            return _quantity(z_s, ureg.ohm)
+
         z_e = self.z_e()
         if z_e is None:
             return None
@@ -219,40 +412,121 @@ class Distro(PowerNode):
 
     def v_drop(self, direction=None) -> Quantity | None:
         "Voltage drop L-N (volts)"
+        v_drop = self._upstream("v_drop", direction)
+        if v_drop is not MISSING:
+            return _quantity(v_drop, ureg.V)
+
         ipt, attrs = self._input_attrs(direction)
-        if attrs.get("voltage_drop") is None:
+        if attrs.voltage_drop is None:
             return None
 
         v_drop = ipt.v_drop()
         if v_drop is None:
             return None
-        return v_drop + attrs["voltage_drop"]
+        return v_drop + attrs.voltage_drop * ureg.V
 
     def cable_length_from_source(self, direction=None) -> Quantity | None:
         "Distance from source (meters)"
+        length = self._upstream("length", direction)
+        if length is not MISSING:
+            return _quantity(length, ureg.m)
+
         ipt, attrs = self._input_attrs(direction)
-        if attrs.get("cable_lengths") is None:
+        if attrs.cable_lengths is None:
             return None
 
         cable_length_from_source = ipt.cable_length_from_source()
         if cable_length_from_source is None:
             return None
-        return cable_length_from_source + sum(attrs["cable_lengths"]) * ureg("meter")
+        return cable_length_from_source + sum(attrs.cable_lengths) * ureg.m
 
     def get_spec(self):
         return self.plan.spec.distro.get(self.type)
 
 
 class Load(VirtualNode):
-    def __init__(self, name, load):
-        self.name = name
+    """A load, which is either a single value, or a profile of values over time.
+
+    A profile is a sequence of loads in watts, one for each time slot of the
+    event. Every profile in a plan must have the same number of slots. If no
+    static `load` is given, the peak of the profile is used.
+
+    If a `power_factor` is given (or the plan has one), voltage drops are
+    calculated with the cables' complex impedance. Otherwise the scalar
+    impedance is used.
+    """
+
+    __slots__ = ("_load_value", "_watts", "_profile", "_power_factor")
+
+    def __init__(self, name, load=None, profile=None, power_factor=None):
+        super().__init__(name=name)
+        if load is None and profile is None:
+            raise ValueError(f"Load {name} needs a load or a profile")
+        self._profile: np.ndarray | None = None
         self.load_value = load
+        self.profile = profile
+        self.power_factor = power_factor
+
+    @property
+    def load_value(self):
+        "The declared load, either a number of watts or a string with units."
+        return self._load_value
+
+    @load_value.setter
+    def load_value(self, value) -> None:
+        self._load_value = value
+        self._watts: float | None = None
+        if self.plan is not None:
+            self.plan._load_changed(self)
+
+    @property
+    def profile(self) -> np.ndarray | None:
+        "The load in watts in each time slot, or None."
+        return self._profile
+
+    @profile.setter
+    def profile(self, value) -> None:
+        if value is not None:
+            value = np.array(value, dtype=float)
+            if value.ndim != 1 or len(value) == 0:
+                raise ValueError(f"Load profile for {self.name} must be a non-empty sequence of values")
+            value.flags.writeable = False
+        self._profile = value
+        self._watts = None
+        if self.plan is not None:
+            self.plan._load_changed(self)
+
+    @property
+    def power_factor(self) -> float | None:
+        "The lagging power factor of the load (0-1), or None to use the plan's."
+        return self._power_factor
+
+    @power_factor.setter
+    def power_factor(self, value: float | None) -> None:
+        if value is not None and not 0 < value <= 1:
+            raise ValueError(f"Power factor for {self.name} must be between 0 and 1")
+        self._power_factor = value
+        if self.plan is not None:
+            self.plan._load_changed(self)
+
+    @property
+    def watts(self) -> float:
+        "The declared load in watts, parsed once."
+        if self._watts is None:
+            if self._load_value is None:
+                assert self._profile is not None
+                self._watts = float(self._profile.max())
+            elif isinstance(self._load_value, int | float):
+                self._watts = float(self._load_value)
+            else:
+                load: Quantity = ureg.Quantity(str(self._load_value))
+                if load.dimensionless:
+                    load *= ureg.W
+                self._watts = float(load.to(ureg.W).magnitude)
+        return self._watts
 
     def load(self) -> Quantity:
-        load: Quantity = ureg.Quantity(str(self.load_value))
-        if load.dimensionless:
-            load *= ureg.W
-        return load
+        return self.watts * ureg.W
 
 
 class AMF(Distro):
@@ -261,6 +535,8 @@ class AMF(Distro):
     This has two inputs and switches between them if the supply fails.
     """
 
+    __slots__ = ()
+
     def r1(self, source=None):
         "Return the highest R1 from each input"
         if source is not None:
@@ -307,12 +583,11 @@ class LogicalSource(PowerSource):
     position in the upstream grid.
     """
 
+    __slots__ = ("_voltage", "_v_drop", "_z_s", "spec")
+
     def __init__(self, name, voltage, v_drop, z_s, current, phases, geom):
-        self.name = name
-        self.id = None
-        self.type = "Link"
+        super().__init__(name=name, type="Link", geom=geom)
         self._voltage = voltage
-        self.geom = geom
         self._v_drop = v_drop
         self._z_s = z_s
         self.spec = {"outputs": [{"current": current, "phases": phases}], "inputs": []}
@@ -341,10 +616,10 @@ class LogicalSink(PowerNode):
     This sink replicates the load from the downstream grid.
     """
 
+    __slots__ = ("_load", "spec")
+
     def __init__(self, name, load, current, phases):
-        self.name = name
-        self.id = None
-        self.type = "Link"
+        super().__init__(name=name, type="Link")
         self._load = load
         self.spec = {"inputs": [{"current": current, "phases": phases}], "outputs": []}
 
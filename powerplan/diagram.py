@@ -1,14 +1,22 @@
 from __future__ import annotations
 
+import hashlib
+import io
+import os
+import re
+import subprocess
 from collections import OrderedDict, defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from datetime import date
-from typing import TYPE_CHECKING
+from functools import lru_cache
+from math import sqrt
+from typing import TYPE_CHECKING, TextIO
 
 import pydotplus as pydot  # type: ignore
 
 from . import ureg
-from .cables import CableConfiguration, get_cable_ratings, select_cable_size
-from .data import AMF, Distro, Generator, LogicalSource, PowerNode
+from .cables import CableConfiguration, get_cable_rating, select_cable_size
+from .data import AMF, MISSING, Connection, Distro, Generator, LogicalSource, PowerNode
 
 if TYPE_CHECKING:
     from .plan import Plan
@@ -17,6 +25,11 @@ COLOUR_THREEPHASE = "firebrick3"
 COLOUR_SINGLEPHASE = "blue4"
 COLOUR_HEADER = "lightcyan1"
 
+GRAPH_ATTRS = {"rankdir": "LR", "fontname": "Arial", "nodesep": 0.3}
+NODE_DEFAULTS = {"shape": "none", "fontsize": 14, "margin": 0, "fontname": "Arial"}
+EDGE_DEFAULTS = {"fontsize": 13, "fontname": "Arial"}
+GRID_ATTRS = {"color": "gray80", "style": "dashed", "labeljust": "l"}
+
 
 def _sanitise_name(name):
     return name.lower().replace(" ", "_").replace("-", "_")
@@ -45,12 +58,12 @@ def calculate_max_length(
     cable_config: CableConfiguration = CableConfiguration.TWO_CORE,
 ):
     """Calculate maximum length of a cable which will still satisfy the fault current requirement."""
-    ratings = get_cable_ratings(csa, methodology, cable_config)
-    if ratings is None:
+    rating = get_cable_rating(csa, methodology, cable_config)
+    if rating is None:
         raise ValueError(
             f"No ratings found for CSA: {csa}mm², methodology {methodology}, configuration {cable_config}"
         )
-    cable_r1 = (ratings["voltage_drop"] / 1000) * (ureg.ohm / ureg.meter)
+    cable_r1 = (rating.z / 1000) * (ureg.ohm / ureg.meter)
     max_z_s = (V / (5.5 * I_n)).to(ureg.ohm)
 
     max_length = (max_z_s - Z_s) / (cable_r1 * 2)
@@ -71,79 +84,126 @@ def _unique_outputs(spec):
     return result
 
 
+@lru_cache(maxsize=1024)
+def _final_circuit_lengths(ratings: tuple[int, ...], v_ln: float, z_s: float) -> tuple[str, ...]:
+    """The longest final circuit which will provide an acceptable prospective fault
+    current from each of a node's single-phase output `ratings`.
+
+    `v_ln` and `z_s` are the node's L-N voltage in volts and Zs in ohms.
+    """
+    circuit_length_params: list[tuple] = []
+    for current in sorted(ratings, reverse=True):
+        i_n = current * ureg.A
+        csa = select_cable_size(current, "4F3A", CableConfiguration.TWO_CORE)
+        if csa is None:
+            continue
+        circuit_length_params.append((i_n, float(csa)))
+
+        if i_n == 16 * ureg.A:
+            # For 16A also include a worst-case 1.25 mm^2 CSA as these
+            # cables are sometimes seen.
+            circuit_length_params.append((i_n, 1.25))
+
+    final_circuit_lengths = []
+    for i_n, c_csa in circuit_length_params:
+        # Calculate final circuit lengths using BS7671 table 4F3A (flexible, non-armoured)
+        max_length = calculate_max_length(
+            v_ln * ureg.V, z_s * ureg.ohm, i_n, c_csa, methodology="4F3A"
+        )
+        if max_length < 25 * ureg.m:
+            length_text = f'<font color="orange">{max_length:.4~H}</font>'
+        elif max_length < 10 * ureg.m:
+            length_text = f'<font color="red">{max_length:.4~H}</font>'
+        else:
+            length_text = f"{max_length:.4~H}"
+
+        length_text += f" @ {i_n:~H} ({c_csa} mm<sup>2</sup>)"
+        final_circuit_lengths.append(length_text)
+
+        # Adiabatic equation:
+        # k = 115
+        # print(i_n, (k**2 * csa**2) / (5.5 * i_n.magnitude) ** 2)
+
+    return tuple(final_circuit_lengths)
+
+
+def _node_value(node: PowerNode, field: str, unit: str) -> float | None:
+    """A calculated value of a node, as a float in `unit`.
+
+    This is read from the solution of the node's plan, falling back to the
+    node itself for nodes which aren't in it, such as logical sources.
+    """
+    if node.plan is not None:
+        value = node.plan.solve().value(field, node)
+        if value is not MISSING:
+            return value
+    if field == "voltage":
+        quantity = node.voltage
+    else:
+        quantity = getattr(node, field)()
+    return None if quantity is None else quantity.to(unit).magnitude
+
+
+def _input_rating(node: PowerNode) -> float:
+    "Nominal breaker current at the input of a node, in amps."
+    if isinstance(node, LogicalSource):
+        return node.spec["outputs"][0]["current"]
+    input_port = next(iter(node.inputs()))[1]
+    rating = input_port["rating"] if "rating" in input_port else input_port.current
+    if rating is None:
+        raise Exception(f"Node {node}: input has no current rating")
+    return rating
+
+
+def _voltage_ln(node: PowerNode) -> float:
+    "Nominal L-N voltage of a node, in volts."
+    voltage = _node_value(node, "voltage", "V")
+    if voltage is None:
+        raise Exception(f"Node {node}: nominal voltage can't be determined")
+    return voltage / sqrt(3)
+
+
 def _node_additional(node: PowerNode) -> dict:
-    "Additional detail for a node"
+    """Additional detail for a node.
+
+    This is called for every node in a diagram, so values are read from the
+    plan's solution as floats, and units are only added to the text.
+    """
     additional = OrderedDict()
 
     final_circuit_lengths = None
     if isinstance(node, Distro | LogicalSource | AMF):
-        z_s = node.z_s()
+        z_s = _node_value(node, "z_s", "ohm")
         if z_s:
             # Calculate Zs and prospective fault current at the input breaker of this distro.
-            additional["Z<sub>s</sub>"] = f"{z_s:.4~H}"
-            i_pf = node.i_pf()
-            i_n = node.i_n()
-            trip_ratio = (i_pf / i_n).magnitude
+            additional["Z<sub>s</sub>"] = f"{z_s:.4} Ω"
+            v_ln = _voltage_ln(node)
+            i_pf = v_ln / z_s
+            trip_ratio = i_pf / _input_rating(node)
             trip_text = f"({trip_ratio:.1f}I<sub>n</sub>)"
 
             threshold = 5.5
             if trip_ratio < threshold:
                 trip_text = f'<font color="red">{trip_text}</font>'
-            additional["I<sub>pf (L-N)</sub>"] = f"{i_pf:.5~H} {trip_text}"
-
-            # Select all single-phase outputs and calculate the longest cable length which will
-            # provide an acceptable prospective fault current.
-            #
-            output_ratings = set(
-                out["current"] * ureg.ampere
-                for out in node.get_spec()["outputs"]
-                if out["phases"] == 1
+            additional["I<sub>pf (L-N)</sub>"] = f"{i_pf:.5} A {trip_text}"
+
+            # Maximum final circuit lengths depend only on the node's single-phase output
+            # ratings and its Zs, so they're shared between nodes.
+            ratings = tuple(
+                sorted({out["current"] for out in node.get_spec()["outputs"] if out["phases"] == 1})
             )
+            final_circuit_lengths = _final_circuit_lengths(ratings, v_ln, z_s)
 
-            circuit_length_params: list[tuple[int, float]] = []
-            for i_n in sorted(output_ratings, reverse=True):
-                csa = select_cable_size(
-                    i_n.magnitude, "4F3A", CableConfiguration.TWO_CORE
-                )
-                if csa is None:
-                    continue
-                circuit_length_params.append((i_n, float(csa)))
-
-                if i_n == 16 * ureg.A:
-                    # For 16A also include a worst-case 1.25 mm^2 CSA as these
-                    # cables are sometimes seen.
-                    circuit_length_params.append((i_n, 1.25))
-
-            final_circuit_lengths = []
-            for i_n, c_csa in circuit_length_params:
-                # Calculate final circuit lengths using BS7671 table 4F3A (flexible, non-armoured)
-                max_length = calculate_max_length(
-                    node.voltage_ln, z_s, i_n, c_csa, methodology="4F3A"
-                )
-                if max_length < 25 * ureg.m:
-                    length_text = f'<font color="orange">{max_length:.4~H}</font>'
-                elif max_length < 10 * ureg.m:
-                    length_text = f'<font color="red">{max_length:.4~H}</font>'
-                else:
-                    length_text = f"{max_length:.4~H}"
-
-                length_text += f" @ {i_n:~H} ({c_csa} mm<sup>2</sup>)"
-                final_circuit_lengths.append(length_text)
-
-                # Adiabatic equation:
-                # k = 115
-                # print(i_n, (k**2 * csa**2) / (5.5 * i_n.magnitude) ** 2)
-
-        v_drop = node.v_drop()
+        v_drop = _node_value(node, "v_drop", "V")
         if v_drop:
-            abs_voltage = node.v_after_drop()
+            abs_voltage = _voltage_ln(node) - v_drop
             drop_text = f"({abs_voltage:.1f} V)"
 
             if abs_voltage < 220:
                 drop_text = f'<font color="red">{drop_text}</font>'
             elif abs_voltage <= 230:
                 drop_text = f'<font color="orange">{drop_text}</font>'
-            additional["V<sub>drop</sub>"] = f"{v_drop:.3~H} {drop_text}"
+            additional["V<sub>drop</sub>"] = f"{v_drop:.3} V {drop_text}"
 
     elif type(node) == Generator:
         additional["P<sub>o</sub>"] = f"{node.power:~H}"
@@ -152,9 +212,9 @@ def _node_additional(node: PowerNode) -> dict:
             node.z_e(), node.get_spec().get("transient_reactance")
         )
 
-    load = node.load()
-    if load.magnitude > 0:
-        additional["Load"] = "{:~H}".format(load.to(ureg("kW")))
+    load = _node_value(node, "load", "W")
+    if load is not None and load > 0:
+        additional["Load"] = f"{load / 1000} kW"
 
     if final_circuit_lengths:
         additional["Max final<br/>circuit length"] = "<br/>".join(final_circuit_lengths)
@@ -166,43 +226,38 @@ def _node_label(node: PowerNode) -> str:
     "Label format for a node. Using graphviz's HTML table support"
     spec = node.get_spec()
 
-    label = '<<table border="0" cellborder="1" cellspacing="0" cellpadding="4" color="grey30">\n'
-    label += """<tr><td bgcolor="{colour}"><font point-size="16"><b>{name}</b></font></td>
-                    <td bgcolor="{colour}"><font point-size="16">{type}</font></td></tr>""".format(
-        name=node.name, type=node.type or "No type assigned", colour=COLOUR_HEADER
-    )
+    node_type = node.type or "No type assigned"
+    parts = [
+        '<<table border="0" cellborder="1" cellspacing="0" cellpadding="4" color="grey30">\n',
+        f"""<tr><td bgcolor="{COLOUR_HEADER}"><font point-size="16"><b>{node.name}</b></font></td>
+                    <td bgcolor="{COLOUR_HEADER}"><font point-size="16">{node_type}</font></td></tr>""",
+    ]
     if spec is None:
-        label += '<tr><td port="input"></td></tr></table>>'
-        return label
+        parts.append('<tr><td port="input"></td></tr></table>>')
+        return "".join(parts)
 
     num_inputs = len(spec["inputs"])
     unique_outputs = _unique_outputs(spec)
-    label += (
-        f'<tr><td port="input" rowspan="{max(len(unique_outputs), 1)}" align="left">'
-    )
+    parts.append(f'<tr><td port="input" rowspan="{max(len(unique_outputs), 1)}" align="left">')
     if num_inputs > 0:
-        label += _render_port(spec["inputs"][0]["current"], spec["inputs"][0]["phases"])
-    label += "</td>"
+        parts.append(_render_port(spec["inputs"][0]["current"], spec["inputs"][0]["phases"]))
+    parts.append("</td>")
 
-    first = True
-    for current, phases, count in unique_outputs:
-        if not first:
-            label += "<tr>"
-        else:
-            first = False
-
-        label += f'<td port="{current}-{phases}" align="right">'
-        label += _render_port(current, phases, count)
-        label += "</td></tr>\n"
+    for i, (current, phases, count) in enumerate(unique_outputs):
+        if i > 0:
+            parts.append("<tr>")
+        parts.append(f'<td port="{current}-{phases}" align="right">')
+        parts.append(_render_port(current, phases, count))
+        parts.append("</td></tr>\n")
 
     if len(unique_outputs) == 0:
-        label += "<td>-</td></tr>"
+        parts.append("<td>-</td></tr>")
 
     for k, v in _node_additional(node).items():
-        label += f'<tr><td align="right">{k}</td><td align="left">{v}</td></tr>'
+        parts.append(f'<tr><td align="right">{k}</td><td align="left">{v}</td></tr>')
 
-    label += "</table>>"
-    return label
+    parts.append("</table>>")
+    return "".join(parts)
 
 
 def _title_label(name: str) -> str:
@@ -214,6 +269,44 @@ def _title_label(name: str) -> str:
     return label
 
 
+def _edge_attrs(edge_data: Connection) -> dict[str, str]:
+    "Graphviz attributes of the edge for a connection."
+    attrs = {}
+    label = f"<{edge_data.current}A"  # add html string to start
+
+    if edge_data.phases == 3:
+        colour = COLOUR_THREEPHASE
+        label += " 3ϕ"
+    else:
+        colour = COLOUR_SINGLEPHASE
+
+    if edge_data.csa:
+        label += f" {edge_data.csa}mm²"
+
+    if edge_data.cable_lengths:
+        label += "<br/>{}".format(" + ".join(str(length) + "m" for length in edge_data.cable_lengths))
+
+        spare = sum(edge_data.cable_lengths) - (edge_data.length or 0)
+        label += f" ({spare}m spare)"
+
+        if (edge_data.extra_length or 0) > 0:
+            # If we manually added extra, put an indicator of how much we added on the plan
+            label += f"<br/><FONT COLOR='darkgreen'>({edge_data.extra_length}m extra added)</FONT>"
+        elif spare > edge_data.cable_lengths[-1] * 0.8:
+            # If no extra added, highlight in red if we've got too much spare
+            attrs["fontcolor"] = "red"
+
+    label += ">"  # end html string
+
+    if not edge_data.logical:
+        attrs["label"] = label
+
+    attrs["tailport"] = f"{edge_data.current}-{edge_data.phases}"
+    attrs["headport"] = "input"
+    attrs["color"] = colour
+    return attrs
+
+
 def _get_subgraph(plan: Plan):
     dot = pydot.Cluster(_sanitise_name(plan.name), label="Grid %s" % plan.name)
     for n in plan.nodes():
@@ -223,45 +316,28 @@ def _get_subgraph(plan: Plan):
         dot.add_node(node)
 
     for u, v, edge_data in plan.edges():
-        edge = pydot.Edge(u.name, v.name)
-
-        label = "<{}A".format(edge_data["current"]) # add html string to start
-
-        if edge_data["phases"] == 3:
-            colour = COLOUR_THREEPHASE
-            label += " 3ϕ"
-        else:
-            colour = COLOUR_SINGLEPHASE
-
-        if edge_data.get("csa"):
-            label += " {}mm²".format(edge_data["csa"])
-
-        if edge_data.get("cable_lengths"):
-            label += "<br/>{}".format(
-                " + ".join(str(length) + "m" for length in edge_data["cable_lengths"])
-            )
-
-            spare = sum(edge_data["cable_lengths"]) - edge_data["length"]
-            label += f" ({spare}m spare)"
+        dot.add_edge(pydot.Edge(u.name, v.name, **_edge_attrs(edge_data)))
 
-            if edge_data['extra_length'] > 0: 
-                # If we manually added extra, put an indicator of how much we added on the plan
-                label += f"<br/><FONT COLOR='darkgreen'>({edge_data['extra_length']}m extra added)</FONT>"
-            elif spare > edge_data["cable_lengths"][-1] * 0.8:
-                # If no extra added, highlight in red if we've got too much spare
-                edge.set_fontcolor("red") 
+    return dot
 
-        label += ">" # end html string
 
-        if not edge_data.get("logical"):
-            edge.set_label(label)
+def _new_dot(name: str | None):
+    dot = pydot.Dot(name or None, graph_type="digraph", strict=True)
+    dot.set_node_defaults(**NODE_DEFAULTS)
+    dot.set_edge_defaults(**EDGE_DEFAULTS)
+    # dot.set_page('11.7,8.3!')
+    # dot.set_margin(0.5)
+    # dot.set_ratio('fill')
+    for key, value in GRAPH_ATTRS.items():
+        dot.set(key, value)
+    return dot
 
-        edge.set_tailport("{}-{}".format(edge_data["current"], edge_data["phases"]))
-        edge.set_headport("input")
-        edge.set_color(colour)
-        dot.add_edge(edge)
 
-    return dot
+def _add_grid(dot, grid: Plan) -> None:
+    sg = _get_subgraph(grid)
+    for key, value in GRID_ATTRS.items():
+        sg.set(key, value)
+    dot.add_subgraph(sg)
 
 
 def to_dot(plan: Plan, split_subplans: bool = True):
@@ -270,15 +346,7 @@ def to_dot(plan: Plan, split_subplans: bool = True):
             "Diagrams can only be drawn of plans which have a spec assigned"
         )
 
-    dot = pydot.Dot(plan.name or None, graph_type="digraph", strict=True)
-    dot.set_node_defaults(shape="none", fontsize=14, margin=0, fontname="Arial")
-    dot.set_edge_defaults(fontsize=13, fontname="Arial")
-    # dot.set_page('11.7,8.3!')
-    # dot.set_margin(0.5)
-    # dot.set_ratio('fill')
-    dot.set_rankdir("LR")
-    dot.set_fontname("Arial")
-    dot.set_nodesep(0.3)
+    dot = _new_dot(plan.name)
 
     if split_subplans:
         grids = plan.grids()
@@ -286,11 +354,7 @@ def to_dot(plan: Plan, split_subplans: bool = True):
         grids = [plan]
 
     for grid in grids:
-        sg = _get_subgraph(grid)
-        sg.set_color("gray80")
-        sg.set_style("dashed")
-        sg.set_labeljust("l")
-        dot.add_subgraph(sg)
+        _add_grid(dot, grid)
 
     title = pydot.Node(
         "title", shape="none", label=_title_label(plan.name or "[UNNAMED]")
@@ -300,3 +364,283 @@ def to_dot(plan: Plan, split_subplans: bool = True):
     dot.add_node(title)
 
     return dot
+
+
+def _quote(value) -> str:
+    "Quote a DOT ID, unless it's an HTML string."
+    value = str(value)
+    if value.startswith("<") and value.endswith(">"):
+        return value
+    return '"' + value.replace('"', '\\"') + '"'
+
+
+def _attr_list(attrs: dict) -> str:
+    return ", ".join(f"{key}={_quote(value)}" for key, value in attrs.items())
+
+
+def _write_dot(out: TextIO, name: str | None, grids: list[Plan], title: str | None = None) -> None:
+    out.write(f"strict digraph {_quote(name or 'G')} {{\n")
+    out.write(f"graph [{_attr_list(GRAPH_ATTRS)}];\n")
+    out.write(f"node [{_attr_list(NODE_DEFAULTS)}];\n")
+    out.write(f"edge [{_attr_list(EDGE_DEFAULTS)}];\n")
+
+    for grid in grids:
+        out.write(f"subgraph {_quote('cluster_' + _sanitise_name(grid.name))} {{\n")
+        out.write(f"graph [{_attr_list({'label': f'Grid {grid.name}', **GRID_ATTRS})}];\n")
+        for n in grid.nodes():
+            if n.name is None:
+                raise Exception(f"Nodes must all be named! {n} is missing a name")
+            out.write(f"{_quote(n.name)} [label={_node_label(n)}];\n")
+        for u, v, edge_data in grid.edges():
+            out.write(f"{_quote(u.name)} -> {_quote(v.name)} [{_attr_list(_edge_attrs(edge_data))}];\n")
+        out.write("}\n")
+
+    if title is not None:
+        out.write(f'"title" [shape=none, label={_title_label(title)}, pos="0,0!", fontsize=18];\n')
+    out.write("}\n")
+
+
+def write_dot(plan: Plan, out: TextIO, split_subplans: bool = True) -> None:
+    """Write the DOT source of a plan's diagram to a file-like object.
+
+    This produces the same diagram as `to_dot`, but writes the source
+    directly rather than building a pydot graph, which is much faster for
+    large plans.
+    """
+    if not plan.spec:
+        raise ValueError(
+            "Diagrams can only be drawn of plans which have a spec assigned"
+        )
+
+    grids = plan.grids() if split_subplans else [plan]
+    _write_dot(out, plan.name, grids, plan.name or "[UNNAMED]")
+
+
+def grid_sources(plan: Plan) -> list[tuple[str | None, str]]:
+    "The DOT source of a standalone diagram of each of the plan's grids."
+    if not plan.spec:
+        raise ValueError(
+            "Diagrams can only be drawn of plans which have a spec assigned"
+        )
+
+    sources = []
+    for grid in plan.grids():
+        out = io.StringIO()
+        _write_dot(out, grid.name, [grid])
+        sources.append((grid.name, out.getvalue()))
+    return sources
+
+
+def _layout(prog: str, source: str, format: str) -> bytes:
+    "Lay out and render a DOT source with graphviz. This runs in a worker process."
+    result = subprocess.run([prog, f"-T{format}"], input=source.encode("utf-8"), capture_output=True)
+    if result.returncode != 0:
+        raise pydot.InvocationException(
+            f"Program terminated with status: {result.returncode}. stderr follows: "
+            f"{result.stderr.decode('utf-8', 'replace')}"
+        )
+    return result.stdout
+
+
+def render_grids(
+    plan: Plan,
+    format: str = "svg",
+    cache_dir: str | None = None,
+    processes: int | None = None,
+    prog: str = "dot",
+) -> list[tuple[str | None, bytes]]:
+    """Lay out and render each of the plan's grids separately.
+
+    Grids are laid out in parallel on a pool of `processes` worker processes.
+    If `cache_dir` is given, each rendered grid is stored there under a hash of
+    its DOT source, and grids which haven't changed aren't laid out again.
+
+    Returns a list of `(grid name, output)` tuples.
+    """
+    sources = grid_sources(plan)
+    outputs: list[bytes | None] = [None] * len(sources)
+    paths: list[str | None] = [None] * len(sources)
+    pending = []
+    for i, (_name, source) in enumerate(sources):
+        if cache_dir is not None:
+            digest = hashlib.sha256(f"{prog}\0{format}\0{source}".encode()).hexdigest()
+            path = paths[i] = os.path.join(cache_dir, f"{digest}.{format}")
+            if os.path.exists(path):
+                with open(path, "rb") as f:
+                    outputs[i] = f.read()
+                continue
+        pending.append(i)
+
+    if pending:
+        progs = pydot.find_graphviz()
+        if progs is None or prog not in progs:
+            raise pydot.InvocationException("GraphViz's executables not found")
+
+        if len(pending) == 1 or processes == 1:
+            results = [_layout(progs[prog], sources[i][1], format) for i in pending]
+        else:
+            with ProcessPoolExecutor(max_workers=processes) as pool:
+                futures = [pool.submit(_layout, progs[prog], sources[i][1], format) for i in pending]
+                results = [future.result() for future in futures]
+
+        for i, output in zip(pending, results, strict=True):
+            outputs[i] = output
+            cache_path = paths[i]
+            if cache_path is not None:
+                os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+                tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+                with open(tmp_path, "wb") as f:
+                    f.write(output)
+                os.replace(tmp_path, cache_path)
+
+    return [(name, output) for (name, _), output in zip(sources, outputs, strict=True) if output is not None]
+
+
+def _svg_size(svg: str) -> tuple[float, float]:
+    "The width and height of an SVG rendered by graphviz, in points."
+    match = re.search(r'<svg[^>]*?width="([\d.]+)pt"[^>]*?height="([\d.]+)pt"', svg)
+    if match is None:
+        raise ValueError("Unable to find the size of SVG")
+    return float(match.group(1)), float(match.group(2))
+
+
+def assemble_svg(rendered: list[tuple[str | None, bytes]]) -> str:
+    "Stack the SVGs of each grid, as returned by `render_grids`, into one document."
+    parts = []
+    width = height = 0.0
+    for _name, output in rendered:
+        svg = output.decode("utf-8")
+        svg = svg[svg.index("<svg") :]
+        grid_width, grid_height = _svg_size(svg)
+        parts.append(svg.replace("<svg", f'<svg x="0" y="{height}pt"', 1))
+        width = max(width, grid_width)
+        height += grid_height
+
+    return (
+        '<?xml version="1.0" encoding="UTF-8" standalone="no"?>\n'
+        f'<svg width="{width}pt" height="{height}pt" xmlns="http://www.w3.org/2000/svg" '
+        'xmlns:xlink="http://www.w3.org/1999/xlink">\n' + "\n".join(parts) + "</svg>\n"
+    )
+
+
+_PDF_OBJ = re.compile(rb"(\d+)\s+(\d+)\s+obj\b")
+_PDF_REF = re.compile(rb"(\d+)\s+(\d+)\s+R\b")
+_PDF_STREAM = re.compile(rb">>\s*stream(\r\n|\n|\r)")
+
+
+def _pdf_ref(data: bytes, key: bytes) -> int | None:
+    "The object number of an indirect reference in a dictionary."
+    match = re.search(rb"/" + key + rb"\s+(\d+)\s+\d+\s+R", data)
+    return int(match.group(1)) if match else None
+
+
+def _pdf_objects(pdf: bytes) -> tuple[dict[int, tuple[bytes, bytes]], int]:
+    """The objects in a PDF, and the object number of its catalog.
+
+    Each object is a tuple of its head (everything up to its stream data, if it
+    has any) and its stream data, including the `endstream` keyword. Only PDFs
+    with cross-reference tables, like those written by graphviz, are supported.
+    """
+    offsets: dict[int, int] = {}
+    root = None
+    xref: int | None = int(pdf[pdf.rindex(b"startxref") + 9 :].split()[0])
+    while xref is not None:
+        if not pdf.startswith(b"xref", xref):
+            raise ValueError("Unable to read PDF without a cross-reference table")
+        trailer = pdf.index(b"trailer", xref)
+        tokens = pdf[xref + 4 : trailer].split()
+        i = 0
+        while i < len(tokens):
+            start, count = int(tokens[i]), int(tokens[i + 1])
+            for n in range(count):
+                offset, _gen, kind = tokens[i + 2 + n * 3 : i + 5 + n * 3]
+                # Entries from later sections override earlier ones
+                if kind == b"n":
+                    offsets.setdefault(start + n, int(offset))
+            i += 2 + count * 3
+        trailer_dict = pdf[trailer : pdf.index(b"startxref", trailer)]
+        if root is None:
+            root = _pdf_ref(trailer_dict, b"Root")
+        prev = re.search(rb"/Prev\s+(\d+)", trailer_dict)
+        xref = int(prev.group(1)) if prev else None
+    if root is None:
+        raise ValueError("Unable to find the catalog of PDF")
+
+    def read(offset: int) -> tuple[bytes, bytes]:
+        match = _PDF_OBJ.match(pdf, offset)
+        if match is None:
+            raise ValueError(f"Unable to find PDF object at offset {offset}")
+        end = pdf.index(b"endobj", match.end())
+        stream = _PDF_STREAM.search(pdf, match.end(), end)
+        if stream is None:
+            return pdf[match.end() : end].strip(), b""
+        head = pdf[match.end() : stream.end()]
+        length_match = re.search(rb"/Length\s+(\d+)(\s+\d+\s+R)?", head)
+        if length_match is None:
+            raise ValueError("Unable to find the length of PDF stream")
+        length = int(length_match.group(1))
+        if length_match.group(2):
+            length = int(read(offsets[length])[0])
+        data_end = pdf.index(b"endstream", stream.end() + length) + 9
+        return head.lstrip(), pdf[stream.end() : data_end]
+
+    return {n: read(offset) for n, offset in offsets.items()}, root
+
+
+def assemble_pdf(rendered: list[tuple[str | None, bytes]]) -> bytes:
+    """Join the PDFs of each grid, as returned by `render_grids`, into one document.
+
+    Each grid's pages are added in order, under a new page tree.
+    """
+    out = io.BytesIO()
+    version = max((output[5:8] for _name, output in rendered if output.startswith(b"%PDF-")), default=b"1.4")
+    out.write(b"%PDF-" + version + b"\n%\xe2\xe3\xcf\xd3\n")
+
+    # Objects 1 and 2 are the new catalog and page tree
+    offsets: list[int] = []
+    kids = []
+    count = 0
+    number = 3
+    for _name, output in rendered:
+        objects, root = _pdf_objects(output)
+        pages = _pdf_ref(objects[root][0], b"Pages")
+        if pages is None:
+            raise ValueError("Unable to find the pages of PDF")
+        numbers = {}
+        for n in objects:
+            if n != root:
+                numbers[n] = number
+                number += 1
+
+        def renumber(match: re.Match[bytes], numbers: dict[int, int] = numbers) -> bytes:
+            n = numbers.get(int(match.group(1)))
+            return b"null" if n is None else b"%d 0 R" % n
+
+        for n, (head, data) in objects.items():
+            if n == root:
+                continue
+            head = _PDF_REF.sub(renumber, head)
+            if n == pages:
+                head = head.replace(b"<<", b"<< /Parent 2 0 R", 1)
+                pages_count = re.search(rb"/Count\s+(\d+)", head)
+                if pages_count is None:
+                    raise ValueError("Unable to find the page count of PDF")
+                count += int(pages_count.group(1))
+                kids.append(numbers[n])
+            offsets.append(out.tell())
+            out.write(b"%d 0 obj\n" % numbers[n] + head + data + b"\nendobj\n")
+
+    header = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(b"%d 0 R" % kid for kid in kids), count),
+    ]
+    for i, body in enumerate(header):
+        offsets.insert(i, out.tell())
+        out.write(b"%d 0 obj\n" % (i + 1) + body + b"\nendobj\n")
+
+    xref = out.tell()
+    out.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(offsets) + 1))
+    for offset in offsets:
+        out.write(b"%010d 00000 n \n" % offset)
+    out.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(offsets) + 1, xref))
+    return out.getvalue()
@@ -0,0 +1,183 @@
+"""A read-only, array-backed snapshot of a plan.
+
+`FrozenPlan` stores the plan graph in compressed sparse row (CSR) form, with
+node kinds and equipment types coded as integers. It supports the read-only
+parts of the `Plan` interface used by validation, BOM, test schedule and
+diagram generation, so it can be passed to them in place of a `Plan`.
+"""
+
+from __future__ import annotations
+
+from collections.abc import Iterable
+from typing import TYPE_CHECKING
+
+import networkx as nx
+import numpy as np
+
+from .data import AMF, Connection, Distro, Generator, Load, LogicalSink, LogicalSource, PowerNode, VirtualNode
+
+if TYPE_CHECKING:
+    from .plan import Plan
+
+# Node classes, indexed by their kind code. Subclasses take the code of their nearest base.
+KINDS: tuple[type[PowerNode], ...] = (PowerNode, Generator, Distro, AMF, Load, LogicalSource, LogicalSink)
+
+
+def kind_code(node: PowerNode) -> int:
+    "The kind code of a node."
+    for cls in type(node).__mro__:
+        if cls in KINDS:
+            return KINDS.index(cls)
+    return 0
+
+
+class FrozenPlan:
+    """A snapshot of a plan's nodes and connections.
+
+    Nodes are numbered in topological order. For node `i`, its outgoing
+    connections are `out_edges[out_ptr[i]:out_ptr[i + 1]]` and its incoming
+    connections are `in_edges[in_ptr[i]:in_ptr[i + 1]]`, where each value is
+    an index into `connections`, `edge_from` and `edge_to`.
+
+    Changes made to the plan after it's frozen aren't reflected in the snapshot,
+    which holds copies of the plan's connection records. Its grids are split and
+    frozen along with it, unless `grids` is False, which is the case for the
+    grids themselves. `records` maps the `id` of each live record to its copy, so
+    the grids share their copies with the plan they were split from.
+    """
+
+    def __init__(self, plan: Plan, grids: bool = True, records: dict[int, Connection] | None = None):
+        self.plan = plan
+        self.name = plan.name
+        self.spec = plan.spec
+        self.valid = plan.valid
+
+        graph = plan.graph
+        self.node_list: list[PowerNode] = list(nx.topological_sort(graph))
+        self.index = {node: i for i, node in enumerate(self.node_list)}
+        n = len(self.node_list)
+
+        self.kind = np.array([kind_code(node) for node in self.node_list], dtype=np.int8)
+        self.virtual = np.array([isinstance(node, VirtualNode) for node in self.node_list], dtype=bool)
+
+        # Equipment types, as indices into `types`
+        type_codes: dict[str | None, int] = {}
+        self.type_code = np.array(
+            [type_codes.setdefault(node.type, len(type_codes)) for node in self.node_list], dtype=np.int32
+        )
+        self.types: list[str | None] = list(type_codes)
+
+        if records is None:
+            records = {}
+
+        # Edges are numbered in order of their upstream node
+        self.connections: list[Connection] = []
+        edge_from: list[int] = []
+        edge_to: list[int] = []
+        for i, node in enumerate(self.node_list):
+            for _, target, data in graph.out_edges(node, data=True):
+                edge_from.append(i)
+                edge_to.append(self.index[target])
+                record = records.get(id(data))
+                if record is None:
+                    record = records[id(data)] = data.copy()
+                self.connections.append(record)
+        self.edge_from = np.array(edge_from, dtype=np.int32)
+        self.edge_to = np.array(edge_to, dtype=np.int32)
+        self.edge_virtual = self.virtual[self.edge_from] | self.virtual[self.edge_to]
+
+        self.out_edges = np.arange(len(edge_from), dtype=np.int32)
+        self.out_ptr = np.zeros(n + 1, dtype=np.int32)
+        np.cumsum(np.bincount(self.edge_from, minlength=n), out=self.out_ptr[1:])
+
+        self.in_edges = np.argsort(self.edge_to, kind="stable").astype(np.int32)
+        self.in_ptr = np.zeros(n + 1, dtype=np.int32)
+        np.cumsum(np.bincount(self.edge_to, minlength=n), out=self.in_ptr[1:])
+
+        # The upstream node of each node in the distribution tree, or -1 for
+        # sources and nodes with more than one input
+        self.parent = np.full(n, -1, dtype=np.int32)
+        single = np.flatnonzero(np.diff(self.in_ptr) == 1)
+        self.parent[single] = self.edge_from[self.in_edges[self.in_ptr[single]]]
+
+        # Plain lists for iterating from Python, which is much faster than indexing arrays
+        virtual = self.virtual.tolist()
+        self._nodes = [node for node, v in zip(self.node_list, virtual, strict=True) if not v]
+        self._all_edges = [
+            (self.node_list[u], self.node_list[v], data)
+            for u, v, data in zip(edge_from, edge_to, self.connections, strict=True)
+        ]
+        self._edges = [
+            edge for edge, v in zip(self._all_edges, self.edge_virtual.tolist(), strict=True) if not v
+        ]
+        in_ptr, out_ptr, in_edges = self.in_ptr.tolist(), self.out_ptr.tolist(), self.in_edges.tolist()
+        nodes, connections = self.node_list, self.connections
+        self._inputs = [
+            [(nodes[edge_from[e]], connections[e], virtual[edge_from[e]]) for e in in_edges[a:b]]
+            for a, b in zip(in_ptr, in_ptr[1:], strict=False)
+        ]
+        self._outputs = [
+            [(nodes[edge_to[e]], connections[e], virtual[edge_to[e]]) for e in range(a, b)]
+            for a, b in zip(out_ptr, out_ptr[1:], strict=False)
+        ]
+
+        # Grids, keyed by `split_amf`, or the error raised when splitting them
+        self._grids: dict[bool, list[FrozenPlan] | Exception] = {}
+        if grids:
+            for split_amf in (True, False):
+                try:
+                    self._grids[split_amf] = [
+                        FrozenPlan(grid, grids=False, records=records) for grid in plan.grids(split_amf)
+                    ]
+                except Exception as e:
+                    self._grids[split_amf] = e
+
+    def __len__(self) -> int:
+        return len(self.node_list)
+
+    def __repr__(self):
+        return (
+            f"<FrozenPlan '{self.name}': {self.num_generators()} generators, "
+            f"{self.num_distros()} distros, {len(self.connections)} connections>"
+        )
+
+    def num_generators(self) -> int:
+        return int(np.count_nonzero(self.kind == KINDS.index(Generator)))
+
+    def num_distros(self) -> int:
+        return int(np.count_nonzero(self.kind == KINDS.index(Distro)))
+
+    def nodes(self, include_virtual: bool = False) -> Iterable[PowerNode]:
+        """Enumerate nodes in the plan.
+        Excludes virtual nodes (loads) unless `include_virtual` is True.
+        """
+        return self.node_list if include_virtual else self._nodes
+
+    def edges(self, include_virtual: bool = False) -> Iterable[tuple[PowerNode, PowerNode, Connection]]:
+        """Iterate over edges (cables) in the plan.
+
+        Excludes virtual nodes (loads) unless `include_virtual` is True.
+        """
+        return self._all_edges if include_virtual else self._edges
+
+    def inputs(self, node: PowerNode, include_virtual: bool = False) -> list[tuple[PowerNode, Connection]]:
+        "The upstream nodes of a node, and the connections from them."
+        inputs = self._inputs[self.index[node]]
+        return [(n, data) for n, data, virtual in inputs if include_virtual or not virtual]
+
+    def outputs(self, node: PowerNode, include_virtual: bool = False) -> list[tuple[PowerNode, Connection]]:
+        "The downstream nodes of a node, and the connections to them."
+        outputs = self._outputs[self.index[node]]
+        return [(n, data) for n, data, virtual in outputs if include_virtual or not virtual]
+
+    def grids(self, split_amf: bool = True) -> list[FrozenPlan]:
+        """The independent grids of the plan when it was frozen.
+
+        A frozen grid is its own only grid.
+        """
+        if split_amf not in self._grids:
+            return [self]
+        grids = self._grids[split_amf]
+        if isinstance(grids, Exception):
+            raise grids
+        return grids
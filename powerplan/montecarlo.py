@@ -0,0 +1,190 @@
+"""Monte Carlo simulation of load uncertainty.
+
+Declared loads are estimates. `simulate` samples every load from a
+distribution, solves the plan for all of the samples at once with the
+array-backed solver, and reports the spread of loads and voltage drops, and
+how likely each breaker, cable and generator is to be overloaded.
+"""
+
+from __future__ import annotations
+
+from collections.abc import Callable, Iterable
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+from . import ureg
+from .data import MISSING, Generator, Load, PowerNode
+from .solver import _float
+
+if TYPE_CHECKING:
+    from .plan import Plan
+
+# A distribution of a load, which is called with a random generator and the
+# number of samples and returns the load in watts for each sample
+Distribution = Callable[[np.random.Generator, int], np.ndarray]
+
+PERCENTILES = (5, 50, 95, 99)
+
+
+def uniform(watts: float, uncertainty: float) -> Distribution:
+    "A load equally likely to be anywhere within `uncertainty` (a ratio) of `watts`."
+    return lambda rng, size: rng.uniform(watts * (1 - uncertainty), watts * (1 + uncertainty), size)
+
+
+def normal(watts: float, sd: float) -> Distribution:
+    "A normally distributed load with a standard deviation of `sd` (a ratio of `watts`), clipped at zero."
+    return lambda rng, size: np.maximum(rng.normal(watts, watts * sd, size), 0.0)
+
+
+class SimulationResult:
+    """The result of `simulate`.
+
+    `load` and `v_drop` hold the percentiles of each node's load (in watts) and
+    voltage drop (in volts), with shape `(len(percentiles), nodes)`.
+
+    For each cable (indexed as `solver.edge_index`), `p_breaker` is the
+    probability of its current exceeding the rating of the connection, and
+    `p_cable` of exceeding the current rating of the cable. Currents are as the
+    solver calculates them, from apparent power. For each node, `p_generator`
+    is the probability of a generator's apparent power exceeding its rating,
+    and is NaN for other nodes.
+    """
+
+    def __init__(
+        self,
+        solver,
+        samples: int,
+        percentiles: tuple[float, ...],
+        load: np.ndarray,
+        v_drop: np.ndarray,
+        p_breaker: np.ndarray,
+        p_cable: np.ndarray,
+        p_generator: np.ndarray,
+    ):
+        self.solver = solver
+        self.samples = samples
+        self.percentiles = percentiles
+        self.load = load
+        self.v_drop = v_drop
+        self.p_breaker = p_breaker
+        self.p_cable = p_cable
+        self.p_generator = p_generator
+
+    def node(self, node: PowerNode):
+        """Load and voltage drop percentiles for a node, and the probability of
+        overloading it if it's a generator, or `MISSING` if it isn't in the plan."""
+        i = self.solver.index.get(node)
+        if i is None:
+            return MISSING
+        result: dict[str, object] = {
+            "load": dict(zip(self.percentiles, self.load[:, i].tolist(), strict=True)),
+            "v_drop": dict(zip(self.percentiles, _floats(self.v_drop[:, i]), strict=True)),
+        }
+        if isinstance(node, Generator):
+            result["p_overload"] = float(self.p_generator[i])
+        return result
+
+    def cable(self, from_node: PowerNode, to_node: PowerNode):
+        """Probabilities of a connection exceeding its breaker and cable ratings,
+        or `MISSING` if there isn't one."""
+        e = self.solver.edge_index.get((from_node, to_node))
+        if e is None:
+            return MISSING
+        return {
+            "p_breaker": _float(self.p_breaker[e]),
+            "p_cable": _float(self.p_cable[e]),
+        }
+
+
+def simulate(
+    plan: Plan,
+    samples: int = 10000,
+    uncertainty: float = 0.2,
+    distributions: dict[Load, Distribution] | None = None,
+    percentiles: Iterable[float] = PERCENTILES,
+    seed: int | None = None,
+    chunk: int = 1000,
+) -> SimulationResult:
+    """Simulate the plan with each load sampled from a distribution.
+
+    Loads are uniformly distributed within `uncertainty` (a ratio) of their
+    declared value, unless a distribution is given for them in `distributions`.
+    The plan's cables must have been assigned by `Plan.generate`.
+
+    Samples are solved `chunk` at a time, which limits the memory used by the
+    solver. The load and voltage drop of every node in every sample are kept
+    (16 bytes per node per sample), so the percentiles are exact and don't
+    depend on `chunk`.
+    """
+    percentiles = tuple(percentiles)
+    distributions = distributions or {}
+    rng = np.random.default_rng(seed)
+    solver = plan.solver()
+    graph = plan.graph
+    n = len(solver.nodes)
+    num_edges = len(solver.parent)
+
+    samplers: dict[int, Distribution] = {}
+    for i, node in enumerate(solver.nodes):
+        if isinstance(node, Load):
+            samplers[i] = distributions.get(node) or uniform(node.watts, uncertainty)
+
+    edges = [(solver.nodes[u], solver.nodes[v]) for u, v in zip(solver.parent, solver.child, strict=True)]
+    breaker_rating = np.array([graph[u][v].current or np.nan for u, v in edges], dtype=float)
+    cable_rating = np.full(num_edges, np.nan)
+    for e, (u, v) in enumerate(edges):
+        rating = plan.cable_rating(graph[u][v]) if graph[u][v].csa is not None else None
+        if rating is not None:
+            cable_rating[e] = rating.rating
+
+    generators = np.array([isinstance(node, Generator) for node in solver.nodes])
+    generator_edges = np.flatnonzero(generators[solver.parent])
+    power = np.full(n, np.nan)
+    for i in np.flatnonzero(generators):
+        power[i] = solver.nodes[i].power.to(ureg.VA).magnitude
+
+    load = np.empty((samples, n))
+    v_drop = np.empty((samples, n))
+    breaker_trips = np.zeros(num_edges)
+    cable_overloads = np.zeros(num_edges)
+    generator_overloads = np.zeros(n)
+
+    for start in range(0, samples, chunk):
+        size = min(chunk, samples - start)
+        loads = np.repeat(solver.own_load[np.newaxis, :], size, axis=0)
+        for i, sampler in samplers.items():
+            loads[:, i] = sampler(rng, size)
+
+        solution = solver.solve(loads)
+        load[start : start + size] = solution.load
+        v_drop[start : start + size] = solution.v_drop
+
+        current = solution.current
+        breaker_trips += (current > breaker_rating).sum(axis=0)
+        cable_overloads += (current > cable_rating).sum(axis=0)
+        # The apparent power supplied by each generator is the sum over its output cables
+        apparent = current[:, generator_edges] * solver.voltage[solver.child[generator_edges]]
+        generator_power = np.zeros((n, size))
+        np.add.at(generator_power, solver.parent[generator_edges], apparent.T)
+        generator_overloads += (generator_power.T > power).sum(axis=0)
+
+    with np.errstate(invalid="ignore"):
+        p_breaker = np.where(np.isnan(breaker_rating), np.nan, breaker_trips / samples)
+        p_cable = np.where(np.isnan(cable_rating), np.nan, cable_overloads / samples)
+    p_generator = np.where(generators, generator_overloads / samples, np.nan)
+
+    return SimulationResult(
+        solver,
+        samples,
+        percentiles,
+        np.percentile(load, percentiles, axis=0),
+        np.percentile(v_drop, percentiles, axis=0),
+        p_breaker,
+        p_cable,
+        p_generator,
+    )
+
+
+def _floats(values: np.ndarray) -> list[float | None]:
+    return [_float(value) for value in values]
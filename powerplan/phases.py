@@ -0,0 +1,244 @@
+"""Per-phase loads and phase balancing.
+
+Each single-phase connection is fed from one phase (L1, L2 or L3) of its
+upstream node, which is recorded in its `phase` attribute when ports are
+assigned. A node fed by a single-phase connection only has that phase, so its
+single-phase outputs are all on it. Three-phase connections carry each phase
+straight through, so the load on each phase of a node is the sum of its
+three-phase children's phase loads, plus the whole load of each single-phase
+child on the phase it's connected to. Declared loads are shared equally
+between the phases of the node which declares them.
+
+`balance` moves single-phase connections between phases to even out the load
+on each three-phase node, which in turn balances the load on each generator.
+"""
+
+from __future__ import annotations
+
+from collections.abc import Iterable
+from typing import TYPE_CHECKING
+
+import networkx as nx
+import numpy as np
+
+from .data import MISSING, LogicalSource, PowerNode
+
+if TYPE_CHECKING:
+    from .plan import Plan
+    from .solver import PlanSolver
+
+PHASE_NAMES = ("L1", "L2", "L3")
+
+
+def port_phase(port: dict) -> int | None:
+    """The phase a port is fixed to, if its spec has a `phase` (1-3, or L1-L3).
+
+    The phase of other single-phase outputs is chosen when their ports are assigned.
+    """
+    phase = port.get("phase")
+    if phase is None:
+        return None
+    if isinstance(phase, str) and phase.upper() in PHASE_NAMES:
+        return PHASE_NAMES.index(phase.upper()) + 1
+    if phase in (1, 2, 3):
+        return int(phase)
+    raise ValueError(f"Invalid phase: {phase}")
+
+
+def _supply(graph, node: PowerNode) -> tuple[bool, int | None]:
+    """Whether a node has all three phases and, if it hasn't, the phase it's fed from.
+
+    The phase is None if the node's single-phase input hasn't been assigned one.
+    """
+    if isinstance(node, LogicalSource):
+        return node.spec["outputs"][0]["phases"] == 3, None
+    for _, _, data in graph.in_edges(node, data=True):
+        if data.phases != 3:
+            return False, data.phase
+    return True, None
+
+
+def assign_phases(plan: Plan, nodes: Iterable[PowerNode] | None = None) -> None:
+    """Assign a phase to each single-phase output of `nodes` (or of every node).
+
+    The single-phase outputs of a three-phase node which haven't got a phase
+    use the phase of their port if it's fixed by the spec. Others are put on the
+    phase with the fewest single-phase outputs of the node, in order of the name
+    of the downstream node. A node fed by a single-phase connection only has
+    that phase, so all of its outputs take it, and the nodes below them are
+    updated in turn.
+    """
+    graph = plan.graph
+    pending = list(nx.topological_sort(graph) if nodes is None else nodes)
+    pending.reverse()
+    while pending:
+        a = pending.pop()
+        outputs = [(b, data) for _, b, data in graph.out_edges(a, data=True) if data.phases == 1]
+        if not outputs:
+            continue
+
+        three_phase, supply = _supply(graph, a)
+        if not three_phase:
+            for b, data in outputs:
+                if data.phase != supply:
+                    data.phase = supply
+                    pending.append(b)
+            continue
+
+        if all(data.phase is not None for _, data in outputs):
+            continue
+        counts = [0, 0, 0]
+        for _, data in outputs:
+            if data.phase is not None:
+                counts[data.phase - 1] += 1
+
+        spec = a.get_spec()
+        for b, data in sorted(outputs, key=lambda output: output[0].name or ""):
+            if data.phase is not None:
+                continue
+            if spec is not None and data.out_port is not None:
+                data.phase = port_phase(spec["outputs"][data.out_port])
+            if data.phase is None:
+                data.phase = counts.index(min(counts)) + 1
+            counts[data.phase - 1] += 1
+            pending.append(b)
+
+
+class PhaseLoads:
+    """The load on each phase of each node.
+
+    `load` has shape `(nodes, 3)`, indexed as `solver.nodes`, in watts.
+    `imbalance` is the largest difference between the load on a phase and the
+    mean load of the phases, as a ratio of the mean, which is NaN for nodes
+    with no load.
+    """
+
+    def __init__(self, solver: PlanSolver, load: np.ndarray):
+        self.solver = solver
+        self.load = load
+        mean = load.mean(axis=1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            self.imbalance = np.abs(load - mean[:, np.newaxis]).max(axis=1) / mean
+
+    def value(self, node: PowerNode):
+        "The loads on L1, L2 and L3 of a node, or `MISSING` if it isn't in the plan."
+        i = self.solver.index.get(node)
+        if i is None:
+            return MISSING
+        return tuple(float(load) for load in self.load[i])
+
+    def node_imbalance(self, node: PowerNode):
+        "The phase imbalance of a node, None if it has no load, or `MISSING` if it isn't in the plan."
+        i = self.solver.index.get(node)
+        if i is None:
+            return MISSING
+        imbalance = float(self.imbalance[i])
+        return None if np.isnan(imbalance) else imbalance
+
+
+def edge_phases(plan: Plan, solver: PlanSolver) -> np.ndarray:
+    """The phase (1-3) of each of the solver's edges.
+
+    This is 0 for three-phase connections, and for single-phase connections
+    which haven't been assigned a phase, whose load is shared between phases.
+    """
+    graph = plan.graph
+    nodes = solver.nodes
+    result = np.zeros(len(solver.parent), dtype=int)
+    for e, (u, v) in enumerate(zip(solver.parent, solver.child, strict=True)):
+        data = graph[nodes[u]][nodes[v]]
+        if data.phases == 1 and data.phase is not None:
+            result[e] = data.phase
+    return result
+
+
+def phase_loads(plan: Plan, loads: np.ndarray | None = None) -> PhaseLoads:
+    """Calculate the load on each phase of every node.
+
+    `loads` overrides the declared load of each node, as for `PlanSolver.solve`,
+    but can't have batch dimensions.
+    """
+    solver = plan.solver()
+    phase = edge_phases(plan, solver)
+    own = solver.own_load if loads is None else np.asarray(loads, dtype=float)
+    load = np.repeat(np.where(solver.has_own_load, own, 0.0)[:, np.newaxis] / 3, 3, axis=1)
+
+    single = phase > 0
+    one_hot = np.eye(4)[phase][:, 1:]
+    sums_load = ~solver.has_own_load
+    for level in reversed(solver.levels):
+        edges = level.edges_by_parent
+        child_load = load[solver.child[edges]]
+        contribution = np.where(
+            single[edges, np.newaxis], one_hot[edges] * child_load.sum(axis=1, keepdims=True), child_load
+        )
+        sums = np.add.reduceat(contribution, level.parent_starts, axis=0)
+        load[level.parents] += np.where(sums_load[level.parents, np.newaxis], sums, 0.0)
+
+    return PhaseLoads(solver, load)
+
+
+def _three_phase(plan: Plan, solver: PlanSolver) -> np.ndarray:
+    "Whether each node has all three phases, so its single-phase outputs can be moved between them."
+    return np.array([_supply(plan.graph, node)[0] for node in solver.nodes], dtype=bool)
+
+
+def balance(plan: Plan) -> dict[tuple[PowerNode, PowerNode], int]:
+    """Choose phases for single-phase connections to balance the load on each node.
+
+    Nodes are balanced from the bottom of the tree up. The single-phase outputs
+    of each three-phase node are placed, largest load first, on its least loaded
+    phase, taking the phase loads of its three-phase outputs as fixed (longest
+    processing time scheduling). Balancing every distro this way also balances
+    the generators, and keeps each distro's breakers evenly loaded.
+
+    Outputs whose phase is fixed by their port aren't moved. Loads are the
+    declared (peak) loads. Returns the new phase of each connection which should
+    move, which `Plan.balance_phases` applies, along with the phase of the
+    connections below it which are fed from it.
+    """
+    solver = plan.solver()
+    graph = plan.graph
+    nodes = solver.nodes
+    n = len(nodes)
+    three_phase = _three_phase(plan, solver)
+    load = np.repeat(np.where(solver.has_own_load, solver.own_load, 0.0)[:, np.newaxis] / 3, 3, axis=1)
+
+    outputs: list[list[int]] = [[] for _ in range(n)]
+    for e, u in enumerate(solver.parent):
+        outputs[u].append(e)
+
+    changes: dict[tuple[PowerNode, PowerNode], int] = {}
+    # Children are always numbered after their parents, so work backwards
+    for i in range(n - 1, -1, -1):
+        if solver.has_own_load[i] or not outputs[i]:
+            continue
+
+        spec = nodes[i].get_spec()
+        total = np.zeros(3)
+        movable: list[tuple[float, int]] = []
+        for e in outputs[i]:
+            data = graph[nodes[i]][nodes[solver.child[e]]]
+            child_load = load[solver.child[e]]
+            if data.phases != 1:
+                total += child_load
+                continue
+
+            port = spec["outputs"][data.out_port] if spec is not None and data.out_port is not None else {}
+            if three_phase[i] and port_phase(port) is None:
+                movable.append((child_load.sum(), e))
+            elif data.phase is not None:
+                total[data.phase - 1] += child_load.sum()
+            else:
+                total += child_load.sum() / 3
+
+        for weight, e in sorted(movable, key=lambda item: (-item[0], item[1])):
+            b = nodes[solver.child[e]]
+            current = graph[nodes[i]][b].phase
+            phase = min(range(1, 4), key=lambda p: (total[p - 1], p != current, p))
+            total[phase - 1] += weight
+            if phase != current:
+                changes[nodes[i], b] = phase
+
+        load[i] = total
+    return changes
@@ -1,24 +1,48 @@
 from __future__ import annotations
 
 import logging
-from typing import Iterable, List, Optional, Union  # noqa
+from typing import Callable, Iterable, List, Optional, Union  # noqa
 
 import networkx as nx
 
-from . import ureg
-from .cables import CableConfiguration, get_cable_ratings
+from . import contingency, montecarlo, phases
+from .cables import CableConfiguration, CableRating, get_cable_rating
+from .contingency import Violation
 from .data import (
     AMF,
+    MISSING,
+    Connection,
     Distro,
     Generator,
+    Load,
     LogicalSink,
     LogicalSource,
     PowerNode,
     PowerSource,
     VirtualNode,
 )
+from .frozen import FrozenPlan
+from .montecarlo import SimulationResult
+from .phases import PhaseLoads
+from .solver import PlanSolver, ProfileSolution, Solution
 from .spec import EquipmentSpec
-from .validator import ValidationError, validate_basic, validate_spec
+from .stats import Stats
+from .validator import ValidationError, Validator
+
+# Connection attributes which are assigned by `Plan.generate`
+PORT_KEYS = ("out_port", "in_port", "connector", "rcd", "phase")
+CABLE_KEYS = ("csa", "cable_lengths", "impedance", "resistance", "reactance", "voltage_drop")
+
+
+class PlanGraph(nx.DiGraph):
+    "A directed graph of power nodes, with a `Connection` record for each edge."
+
+    edge_attr_dict_factory = Connection
+
+    def add_record(self, u: PowerNode, v: PowerNode, data: Connection) -> None:
+        "Add an edge which shares an existing connection record, rather than copying it."
+        self.add_edge(u, v)
+        self._succ[u][v] = self._pred[v][u] = data
 
 
 class Plan:
@@ -29,6 +53,7 @@ class Plan:
         spec: EquipmentSpec | None = None,
         methodology: str = "Eland",
         graph: nx.DiGraph | None = None,
+        power_factor: float | None = None,
     ):
         self.name = name
         self.parent = parent
@@ -36,13 +61,79 @@ class Plan:
         self.log = logging.getLogger(__name__)
 
         if graph:
-            self.graph = graph
+            self.graph = graph if isinstance(graph, PlanGraph) else PlanGraph(graph)
         else:
-            self.graph = nx.DiGraph()
+            self.graph = PlanGraph()
+        if parent is None:
+            # Nodes in a graph which is passed in now belong to this plan, so their
+            # edits are tracked here. Grids leave their nodes with the parent plan.
+            for node in self.graph.nodes():
+                node.plan = self
         self.spec = spec
         self.methodology = methodology
 
-        self.valid = True
+        # Whether the latest validation passed, and the connections which couldn't be
+        # assigned ports or a cable
+        self._validated = True
+        self._failed: set[tuple[PowerNode, PowerNode]] = set()
+
+        # Calculated values are held as floats in SI units (watts, volts, ohms, metres),
+        # and are only converted to pint quantities by the node accessors.
+        self._solver: PlanSolver | None = None
+        self._solution: Solution | None = None
+        # Grids, keyed by `split_amf`, which are discarded along with the solution
+        self._grids: dict[bool, list[Plan]] = {}
+        self.power_factor = power_factor
+
+        # Callbacks which are called with the nodes touched by each edit
+        self._observers: list[Callable[..., None]] = []
+
+        # Connections which need ports and cables assigning by `generate`. Connections
+        # in a graph which is passed in are assigned on the first `generate`, unless
+        # they already have a cable.
+        self._dirty: set[tuple[PowerNode, PowerNode]] = set()
+        for a, b, data in self.graph.edges(data=True):
+            if data.cable_lengths is None:
+                self._mark_dirty(a, b)
+        # Ports which released connections were using, which are preferred when reassigning them
+        self._previous_ports: dict[tuple[PowerNode, PowerNode], tuple[int | None, int | None]] = {}
+
+        # Timings and counts from the last `generate`, and a callback which is passed them
+        self.stats = Stats()
+        self.stats_callback: Callable[[Plan, Stats], None] | None = None
+
+    def __getstate__(self) -> dict:
+        "Plans are pickled without their observers, callbacks or cached calculations."
+        state = self.__dict__.copy()
+        state.update(_solver=None, _solution=None, _grids={}, _observers=[], stats_callback=None)
+        return state
+
+    @property
+    def valid(self) -> bool:
+        """Whether the plan is valid.
+
+        This is the result of the latest validation, by `validate` or an open
+        `ValidationSession`, and is False while any connection couldn't be
+        assigned ports or a cable.
+        """
+        return self._validated and not self._failed
+
+    @property
+    def power_factor(self) -> float | None:
+        """The power factor of loads which don't declare their own.
+
+        If any load has a power factor, voltage drops are calculated with the
+        cables' resistance and reactance, otherwise with their scalar impedance.
+        R1 and Zs are always calculated with the cables' complex impedance.
+        """
+        return self._power_factor
+
+    @power_factor.setter
+    def power_factor(self, value: float | None) -> None:
+        if value is not None and not 0 < value <= 1:
+            raise ValueError("Power factor must be between 0 and 1")
+        self._power_factor = value
+        self.invalidate()
 
     def num_generators(self) -> int:
         return sum(1 for n in self.graph.nodes() if type(n) == Generator)
@@ -53,6 +144,8 @@ class Plan:
     def add_node(self, node: PowerNode) -> None:
         node.plan = self
         self.graph.add_node(node)
+        self.invalidate()
+        self._notify(node)
 
     def add_connection(
         self,
@@ -64,11 +157,21 @@ class Plan:
         logical: bool = False,
         extra_length: float = 0.0
     ) -> None:
+        """Connect two nodes, adding them to the plan if required.
+
+        If the nodes are already connected, the connection is replaced and its
+        ports and cables will be reassigned by the next `generate`.
+        """
         if not self.graph.has_node(from_node):
             self.add_node(from_node)
         if not self.graph.has_node(to_node):
             self.add_node(to_node)
 
+        if self.graph.has_edge(from_node, to_node):
+            self._release(from_node, to_node)
+        else:
+            self.invalidate()
+
         self.graph.add_edge(
             from_node,
             to_node,
@@ -78,15 +181,165 @@ class Plan:
             logical=logical,
             extra_length=extra_length
         )
+        self._mark_dirty(from_node, to_node)
+        self._notify(from_node, to_node)
+
+    def remove_connection(self, from_node: PowerNode, to_node: PowerNode) -> None:
+        "Remove the connection between two nodes, releasing its ports."
+        self._release(from_node, to_node)
+        self.graph.remove_edge(from_node, to_node)
+        self._dirty.discard((from_node, to_node))
+        self._failed.discard((from_node, to_node))
+        self._previous_ports.pop((from_node, to_node), None)
+        self.invalidate()
+        self._notify(from_node, to_node)
+
+    def update_connection(
+        self,
+        from_node: PowerNode,
+        to_node: PowerNode,
+        *,
+        current: int | None = None,
+        phases: int | None = None,
+        length: float | None = None,
+        logical: bool | None = None,
+        extra_length: float | None = None,
+    ) -> None:
+        """Change the attributes of an existing connection.
+
+        Attributes which aren't provided are left unchanged. Changing the current
+        or phases releases the connection's ports; changing only the length keeps
+        them. The connection's ports and cable are then reassigned straight away.
+        """
+        data = self.graph[from_node][to_node]
+        changes = {
+            "current": current,
+            "phases": phases,
+            "length": length,
+            "logical": logical,
+            "extra_length": extra_length,
+        }
+        changes = {key: value for key, value in changes.items() if value is not None}
+
+        ports = any(data[key] != changes[key] for key in ("current", "phases") if key in changes)
+        self._release(from_node, to_node, ports=ports)
+        data.update(changes)
+        self._reassign([(from_node, to_node)])
+        self._notify(from_node, to_node)
+
+    def replace_node_type(self, node: PowerNode, type: str | None) -> None:
+        """Change the type of a node, and reassign ports and cables for its connections.
+
+        Ports on the other end of each connection are kept if they're still
+        suitable.
+        """
+        if self.spec is not None and type is not None:
+            # AMFs are distros, and their specs are kept with the distros
+            specs = None
+            if isinstance(node, Generator):
+                specs = self.spec.generator
+            elif isinstance(node, Distro):
+                specs = self.spec.distro
+            if specs is not None and type not in specs:
+                raise ValueError(f"Spec not found for item: {type}")
+
+        node.type = type
+        self._reassign(list(self.graph.in_edges(node)) + list(self.graph.out_edges(node)))
+
+    def _reassign(self, edges: list[tuple[PowerNode, PowerNode]]) -> None:
+        "Assign ports and cables to the given connections, if they're dirty."
+        if self.spec is None:
+            return
+        edges = [edge for edge in edges if edge in self._dirty]
+        self.assign_ports(edges)
+        self.assign_cables(edges)
+
+    def subscribe(self, callback: Callable[..., None]) -> None:
+        "Call `callback` with the nodes touched by each edit to the plan."
+        self._observers.append(callback)
+
+    def unsubscribe(self, callback: Callable[..., None]) -> None:
+        self._observers.remove(callback)
+
+    def _notify(self, *nodes: PowerNode) -> None:
+        for callback in self._observers:
+            callback(*nodes)
 
-    def validate(self) -> Iterable[ValidationError]:
-        errors = validate_basic(self)
-        if self.spec:
-            errors += validate_spec(self)
+    @property
+    def dirty(self) -> frozenset[tuple[PowerNode, PowerNode]]:
+        "Connections which have changed since their ports and cables were last assigned."
+        return frozenset(self._dirty)
 
-        if len(errors)>0:
-            self.valid = False
+    def invalidate(self) -> None:
+        """Discard cached calculations (the solver, solution and grids) so they're recalculated.
 
+        Edits made through the plan call this. Changes made directly to `self.graph`
+        bypass it, so call it if you do that.
+        """
+        self._solver = None
+        self._solution = None
+        self._grids.clear()
+
+    def _mark_dirty(self, from_node: PowerNode, to_node: PowerNode) -> None:
+        if isinstance(from_node, VirtualNode) or isinstance(to_node, VirtualNode):
+            return
+        self._dirty.add((from_node, to_node))
+
+    def _release(self, from_node: PowerNode, to_node: PowerNode, ports: bool = True) -> None:
+        """Release the ports allocated to a connection and discard its assigned cable.
+
+        If `ports` is False, only the cable is discarded. The connection is
+        marked dirty so `generate` will assign it again.
+        """
+        data: Connection = self.graph[from_node][to_node]
+        if ports:
+            if data.in_port is not None:
+                self._previous_ports[from_node, to_node] = (data.out_port, data.in_port)
+            if data.out_port is not None:
+                from_node.outputs_allocated.discard(data.out_port)
+            if data.in_port is not None:
+                to_node.inputs_allocated.discard(data.in_port)
+            for key in PORT_KEYS:
+                data[key] = None
+            if data.adaptor:
+                data.adaptor = None
+                data.logical = False
+        for key in CABLE_KEYS:
+            data[key] = None
+
+        if self._solver is not None and (from_node, to_node) in self._solver.edge_index:
+            self._solver.update_cable(from_node, to_node, data)
+        self._solution = None
+        self._grids.clear()
+        self._mark_dirty(from_node, to_node)
+
+    def _node_changed(self, node: PowerNode) -> None:
+        "Called when a node's type changes, so its connections need assigning again."
+        if not self.graph.has_node(node):
+            return
+        for u, v in list(self.graph.in_edges(node)) + list(self.graph.out_edges(node)):
+            self._release(u, v)
+        if isinstance(node, PowerSource):
+            # The source's voltage and impedance are captured by the solver
+            self.invalidate()
+        self._notify(node)
+
+    def _load_changed(self, node: Load) -> None:
+        "Called when the declared value of a load changes."
+        if self._solver is not None and node in self._solver.index:
+            self._solver.update_load(node)
+        self._solution = None
+        self._grids.clear()
+
+    def validate(self, validator: Validator | None = None) -> Iterable[ValidationError]:
+        """Validate the plan, and mark it valid or invalid by whether there are any errors.
+
+        `validator` may be given to add project-specific rules to the defaults.
+        """
+        if validator is None:
+            validator = Validator(spec=bool(self.spec))
+        errors = validator.validate(self)
+        self._validated = not errors
         return errors
 
     def nodes(self, include_virtual: bool = False) -> Iterable[PowerNode]:
@@ -98,15 +351,32 @@ class Plan:
                 continue
             yield node
 
+    def inputs(
+        self, node: PowerNode, include_virtual: bool = False
+    ) -> Iterable[tuple[PowerNode, Connection]]:
+        "The upstream nodes of a node, and the connections from them."
+        return node.inputs(include_virtual)
+
+    def outputs(
+        self, node: PowerNode, include_virtual: bool = False
+    ) -> Iterable[tuple[PowerNode, Connection]]:
+        "The downstream nodes of a node, and the connections to them."
+        return node.outputs(include_virtual)
+
+    def freeze(self) -> FrozenPlan:
+        "Return a read-only, array-backed snapshot of the plan."
+        return FrozenPlan(self)
+
     def edges(
         self, include_virtual: bool = False
-    ) -> Iterable[tuple[PowerNode, PowerNode, dict]]:
+    ) -> Iterable[tuple[PowerNode, PowerNode, Connection]]:
         """Iterate over edges (cables) in the plan.
 
         Excludes virtual nodes (loads) unless `include_virtual` is True.
 
-        Returns an iterator of `(from_node, to_node, data)` tuples.
-
+        Returns an iterator of `(from_node, to_node, data)` tuples. Values calculated
+        for each cable are in SI units: `impedance` in ohms/metre and `voltage_drop`
+        in volts.
         """
         for u, v, edge_data in self.graph.edges(data=True):
             if not include_virtual and (
@@ -116,165 +386,374 @@ class Plan:
             yield (u, v, edge_data)
 
     def generate(self) -> None:
-        self.assign_ports()
-        self.assign_cables()
-        self.calculate_voltage_drop()
+        """Assign ports and cables, and calculate voltage drops.
 
-    def assign_output(self, node: PowerNode, current: int, phases: int) -> int:
-        spec = node.get_spec()
-        outputs = spec.get("outputs", [])
+        Only connections which have changed since the last call have their
+        ports and cables assigned.
 
-        for out_id in range(0, len(outputs)):
-            if out_id in node.outputs_allocated:
-                continue
-            output = spec["outputs"][out_id]
-            if current == output["current"] and phases == output["phases"]:
-                node.outputs_allocated.add(out_id)
-                return out_id
-        else:
+        The time taken by each stage, along with call counts and cache hits,
+        are recorded in `stats`, which is passed to `stats_callback` if it's set.
+        """
+        self.stats = stats = Stats()
+        spec_stats = self.spec.stats.copy() if self.spec else None
+
+        with stats.timer("generate"):
+            with stats.timer("assign_ports"):
+                self.assign_ports()
+            with stats.timer("assign_cables"):
+                self.assign_cables()
+            with stats.timer("calculate_voltage_drop"):
+                self.calculate_voltage_drop()
+
+        if self.spec and spec_stats is not None:
+            stats.update(self.spec.stats.since(spec_stats))
+        if self.stats_callback is not None:
+            self.stats_callback(self, stats)
+
+    def solver(self) -> PlanSolver:
+        """Return the array-backed solver for this plan.
+
+        The solver captures the plan's topology and cable assignments. It is
+        rebuilt after the plan changes.
+        """
+        self.stats.lookup("solver", self._solver is not None)
+        if self._solver is None:
+            self._solver = PlanSolver(self)
+        return self._solver
+
+    def solve(self) -> Solution:
+        """Calculate loads, voltage drops, R1, Zs and fault currents for every node.
+
+        The result is cached until the plan changes.
+        """
+        self.stats.lookup("solution", self._solution is not None)
+        if self._solution is None:
+            self._solution = self.solver().solve()
+        return self._solution
+
+    def solve_profiles(self, chunk: int = 1024) -> ProfileSolution:
+        """Calculate peak and diversified loads, and worst-case voltage drops,
+        over every time slot of the plan's load profiles at once.
+
+        See `PlanSolver.solve_profiles`. Cables must have been assigned by `generate`.
+        """
+        return self.solver().solve_profiles(chunk)
+
+    def phase_loads(self) -> PhaseLoads:
+        """Calculate the load on each of the three phases of every node.
+
+        Single-phase connections must have been assigned a phase by `generate`.
+        See `phases.phase_loads`.
+        """
+        return phases.phase_loads(self)
+
+    def balance_phases(self) -> int:
+        """Move single-phase connections between phases to balance the load on
+        each node, and return the number of connections moved. See `phases.balance`.
+        """
+        changes = phases.balance(self)
+        for (a, b), phase in changes.items():
+            self.graph[a][b].phase = phase
+            self._notify(a, b)
+        # Everything below a moved connection is now fed from its new phase
+        phases.assign_phases(self, [b for _, b in changes])
+        return len(changes)
+
+    def simulate(self, samples: int = 10000, uncertainty: float = 0.2, **kwargs) -> SimulationResult:
+        """Simulate the plan with loads sampled within `uncertainty` (a ratio) of
+        their declared values. See `montecarlo.simulate`.
+        """
+        return montecarlo.simulate(self, samples, uncertainty, **kwargs)
+
+    def node_load(self, node: PowerNode) -> float | None:
+        """Return the aggregated load for a node in watts, or None if it's not in this plan."""
+        load = self.solve().value("load", node)
+        return None if load is MISSING else load
+
+    def node_voltage(self, node: PowerNode) -> float | None:
+        """Return the nominal L-L voltage for a node in volts, or None if it isn't known."""
+        voltage = self.solve().value("voltage", node)
+        return None if voltage is MISSING else voltage
+
+    def upstream_value(self, field: str, node: PowerNode, direction: PowerNode | None = None):
+        """Return a calculated value for a node, or `MISSING` if it isn't known.
+
+        `field` is one of `source`, `r1`, `z_e`, `z_s`, `i_pf`, `v_drop` or `length`.
+        Values are floats in SI units, or None if they couldn't be calculated.
+        """
+        return self.solve().value(field, node, direction)
+
+    def assign_output(
+        self, node: PowerNode, current: int, phases: int, preferred: int | None = None
+    ) -> int:
+        port = self._assign_port(node, "outputs", current, phases, preferred)
+        if port is None:
             raise ValueError(
                 f"Can't assign output from node {node}, current {current}, phases {phases}."
             )
+        return port
 
-    def assign_input(self, node: PowerNode, current: int, phases: int) -> int:
-        spec = node.get_spec()
-        inputs = spec.get("inputs", [])
-
-        for in_id in range(0, len(inputs)):
-            if in_id in node.inputs_allocated:
-                continue
-            input = spec["inputs"][in_id]
-            if current == input["current"] and phases == input["phases"]:
-                node.inputs_allocated.add(in_id)
-                return in_id
-        else:
+    def assign_input(
+        self, node: PowerNode, current: int, phases: int, preferred: int | None = None
+    ) -> int:
+        port = self._assign_port(node, "inputs", current, phases, preferred)
+        if port is None:
             raise ValueError(
                 f"Can't assign input to node {node}, current {current}, phases {phases}"
             )
+        return port
+
+    def _assign_port(
+        self, node: PowerNode, direction: str, current: int, phases: int, preferred: int | None
+    ) -> int | None:
+        "Allocate the preferred port if it's suitable, otherwise the first free port with a matching rating."
+        assert self.spec is not None
+        index = self.spec.port_index(node.get_spec(), direction)
+        allocated = node.inputs_allocated if direction == "inputs" else node.outputs_allocated
+        ports = [index.first_free(key, allocated, preferred) for key in index.keys(current, phases)]
+        if preferred in ports:
+            port = preferred
+        else:
+            port = min((port for port in ports if port is not None), default=None)
+        if port is not None:
+            allocated.add(port)
+        return port
 
-    def assign_ports(self) -> None:
+    def assign_ports(self, edges: Iterable[tuple[PowerNode, PowerNode]] | None = None) -> None:
         """Assign edges a port on each power node.
 
-        If a node at either end of a cable doesn't have a spec
-        (perhaps because it has no type assigned), it will be skipped.
+        Only connections which have changed since ports were last assigned are
+        considered, optionally limited to `edges`. If a node at either end of a
+        cable doesn't have a spec (perhaps because it has no type assigned), it
+        will be skipped.
+
+        The outputs of each node are assigned together, as a matching between
+        its connections and groups of interchangeable ports, so a connection is
+        only left unassigned if there's no way of assigning them all.
         """
         if not self.spec:
             raise Exception("Cannot assign ports with no spec data")
 
-        for a in self.nodes():
-            a_spec = a.get_spec()
+        dirty: dict[PowerNode, list[PowerNode]] = {}
+        for a, b in self._dirty if edges is None else edges:
+            dirty.setdefault(a, []).append(b)
 
-            if a_spec is None:
+        for a in self.nodes():
+            if a not in dirty or a.get_spec() is None:
                 continue
 
             # Sort outputs alphabetically by name so assignments are stable
-            for b, data in sorted(a.outputs(), key=lambda d: d[0].name or ""):
-                if "in_port" in data:
-                    continue
-
-                b_spec = b.get_spec()
-                if b_spec is None:
+            targets = [
+                b
+                for b in sorted(dirty[a], key=lambda node: node.name or "")
+                if "in_port" not in self.graph[a][b] and b.get_spec() is not None
+            ]
+            if targets:
+                self._assign_node_ports(a, targets)
+
+        phases.assign_phases(self, None if edges is None else dirty)
+
+    def _assign_node_ports(self, a: PowerNode, targets: list[PowerNode]) -> None:
+        "Assign ports to the connections from `a` to each of `targets`."
+        assert self.spec is not None
+        a_spec = a.get_spec()
+        outputs = self.spec.port_index(a_spec, "outputs")
+
+        # The groups of ports which each connection could use, and how many are free
+        candidates: dict[PowerNode, list[tuple]] = {}
+        capacity: dict[tuple, int] = {}
+        for b in targets:
+            data = self.graph[a][b]
+            inputs = self.spec.port_index(b.get_spec(), "inputs")
+            keys = [
+                key
+                for key in outputs.keys(data.current, data.phases)
+                if inputs.free(key, b.inputs_allocated)
+            ]
+            # Try the group of the previously assigned port first
+            previous_out = self._previous_ports.get((a, b), (None, None))[0]
+            keys.sort(key=lambda key: previous_out not in outputs.groups[key])
+            candidates[b] = keys
+            for key in keys:
+                capacity[key] = len(outputs.free(key, a.outputs_allocated))
+
+        matched: dict[tuple, list[PowerNode]] = {key: [] for key in capacity}
+        assignment: dict[PowerNode, tuple] = {}
+
+        def augment(b: PowerNode, visited: set[tuple]) -> bool:
+            for key in candidates[b]:
+                if key in visited:
                     continue
+                visited.add(key)
+                if len(matched[key]) < capacity[key]:
+                    matched[key].append(b)
+                    assignment[b] = key
+                    return True
+                for other in matched[key]:
+                    if augment(other, visited):
+                        matched[key].remove(other)
+                        matched[key].append(b)
+                        assignment[b] = key
+                        return True
+            return False
+
+        for b in targets:
+            augment(b, set())
+
+        for b in targets:
+            data = self.graph[a][b]
+            if b not in assignment:
+                self.log.error(self._port_error(a, b, data))
+                self._failed.add((a, b))
+                continue
+            self._failed.discard((a, b))
 
-                try:
-                    out_id = self.assign_output(a, data["current"], data["phases"])
-                    in_id = self.assign_input(b, data["current"], data["phases"])
-
-                    out_type = a_spec["outputs"][out_id]["type"]
-                    in_type = b_spec["inputs"][in_id]["type"]
-
-                    if out_type != in_type:
-                        raise ValueError(
-                            f"Connector types don't match: {out_type} on {a} != {in_type} on {b}"
-                        )
-
-                    self.graph[a][b]["out_port"] = out_id
-                    self.graph[a][b]["in_port"] = in_id
-                    self.graph[a][b]["connector"] = a_spec["outputs"][out_id]["type"]
-                    self.graph[a][b]["rcd"] = a_spec["outputs"][out_id].get("rcd")
-
-                    if a_spec["outputs"][out_id].get("cable", False):
-                        # This is an adaptor cable, so the downstream cable is part of it.
-                        # TODO: somehow check the length etc.
-                        self.graph[a][b]["logical"] = True
-                except ValueError as e:
-                    self.log.error(e)
-                    self.valid = False
-                    continue
-
-    def assign_cables(self) -> None:
-        """Assign cable cross-sectional areas to all cables.
-
-        Cables with no assigned connectors will be skipped.
+            key = assignment[b]
+            previous_out, previous_in = self._previous_ports.pop((a, b), (None, None))
+            out_id = outputs.first_free(key, a.outputs_allocated, previous_out)
+            in_id = self.spec.port_index(b.get_spec(), "inputs").first_free(
+                key, b.inputs_allocated, previous_in
+            )
+            assert out_id is not None and in_id is not None
+            a.outputs_allocated.add(out_id)
+            b.inputs_allocated.add(in_id)
+
+            data.out_port = out_id
+            data.in_port = in_id
+            data.connector = a_spec["outputs"][out_id]["type"]
+            data.rcd = a_spec["outputs"][out_id].get("rcd")
+
+            if a_spec["outputs"][out_id].get("cable", False):
+                # This is an adaptor cable, so the downstream cable is part of it.
+                # TODO: somehow check the length etc.
+                data.logical = True
+                data.adaptor = True
+
+    def _port_error(self, a: PowerNode, b: PowerNode, data: Connection) -> str:
+        "Describe why a connection couldn't be assigned ports."
+        assert self.spec is not None
+        current, phases = data.current, data.phases
+        outputs = self.spec.port_index(a.get_spec(), "outputs")
+        output_keys = outputs.keys(current, phases)
+        input_keys = self.spec.port_index(b.get_spec(), "inputs").keys(current, phases)
+        if not any(outputs.free(key, a.outputs_allocated) for key in output_keys):
+            return f"Can't assign output from node {a}, current {current}, phases {phases}."
+        if not input_keys:
+            return f"Can't assign input to node {b}, current {current}, phases {phases}"
+        if not set(output_keys) & set(input_keys):
+            out_types = ", ".join(str(key[2]) for key in output_keys)
+            in_types = ", ".join(str(key[2]) for key in input_keys)
+            return f"Connector types don't match: {out_types} on {a} != {in_types} on {b}"
+        return f"Can't assign ports from node {a} to node {b}, current {current}, phases {phases}."
+
+    def assign_cables(self, edges: Iterable[tuple[PowerNode, PowerNode]] | None = None) -> None:
+        """Assign cable cross-sectional areas to cables which have changed.
+
+        Only connections which have changed are considered, optionally limited
+        to `edges`. Cables with no assigned connectors will be skipped, and will
+        be considered again on the next call.
         """
         if self.spec is None:
             return
 
         self.log.info("Assigning cables")
-        for a, b, data in self.edges():
-            if "connector" not in data:
+        for a, b in list(self._dirty if edges is None else edges):
+            data = self.graph[a][b]
+            if data.connector is None:
                 continue
+            self._dirty.discard((a, b))
 
             try:
-                lengths, csa = self.spec.select_cable(
-                    data["connector"], data["current"], data["phases"], data["length"], data["extra_length"]
-                )
-                self.graph[a][b]["csa"] = csa
-                self.graph[a][b]["cable_lengths"] = lengths
-
-                if data["connector"] == "Powerlock":
-                    config = CableConfiguration.TWO_SINGLE
-                elif data["connector"] == "IEC 60309":
-                    config = CableConfiguration.MULTI_CORE
-                else:
-                    raise ValueError("Unknown cable configuration: %s", data["connector"])
-
-                ratings = get_cable_ratings(csa, self.methodology, config)
-                if ratings is None:
-                    raise ValueError(
-                        f"No ratings found for CSA: {csa}mm², "
-                        f"methodology {self.methodology}, configuration {config}"
-                    )
-                drop = ratings["voltage_drop"]
-                if type(drop) == tuple:
-                    # Use the scalar impedance value (Zr)
-                    # TODO: use the complex impedance and calculate with expected PF
-                    drop = drop[2]
-
-                if drop is None:
-                    continue
+                self._assign_cable(self.spec, data)
+            except ValueError as e:
+                self.log.error("%s %u/%u: %s", data.connector, data.current, data.phases, e)
+                self._failed.add((a, b))
+            else:
+                self._failed.discard((a, b))
 
-                drop *= ureg("mohm/m")
+            # Cable impedances are captured by the solver
+            if self._solver is not None:
+                self._solver.update_cable(a, b, data)
+            self._solution = None
+            self._grids.clear()
 
-                self.graph[a][b]["impedance"] = drop
-            except ValueError as e:
-                self.log.error("%s %u/%u: %s", data["connector"], data["current"], data["phases"], e)
-                self.valid = False
-                continue
+    def _assign_cable(self, spec: EquipmentSpec, data: Connection) -> None:
+        lengths, csa = spec.select_cable(
+            data.connector, data.current, data.phases, data.length, data.extra_length
+        )
+        data.csa = csa
+        data.cable_lengths = lengths
+
+        rating = self.cable_rating(data)
+        if rating is None:
+            raise ValueError(
+                f"No ratings found for CSA: {csa}mm², "
+                f"methodology {self.methodology}, connector {data.connector}"
+            )
+        # Convert from mV/A/m (milliohms/m) to ohms/m. The scalar impedance is
+        # used unless loads have a power factor.
+        data.impedance = rating.z / 1000
+        data.resistance = rating.r / 1000
+        data.reactance = rating.x / 1000
+
+    def cable_rating(self, data: Connection) -> CableRating | None:
+        "The current rating and voltage drop of a connection's cable, or None if it's not in the tables."
+        if data.csa is None:
+            return None
+        if data.connector == "Powerlock":
+            config = CableConfiguration.TWO_SINGLE
+        elif data.connector == "IEC 60309":
+            config = CableConfiguration.MULTI_CORE
+        else:
+            raise ValueError("Unknown cable configuration: %s", data.connector)
+
+        self.stats.count("get_cable_rating")
+        return get_cable_rating(data.csa, self.methodology, config)
 
     def calculate_voltage_drop(self) -> None:
         "Calculate voltage drop per cable length."
+        solution = self.solve()
         for a, b, data in self.edges():
-            if not data.get("cable_lengths") or not data.get("impedance"):
+            if not data.cable_lengths or not data.impedance:
                 continue
 
-            length = sum(data["cable_lengths"]) * ureg.m
-            # Per-phase current is the load in watts divided by the source L-L voltage
-            current = b.load() / b.voltage
+            if self.node_voltage(b) is None:
+                raise Exception(f"Node {b}: nominal voltage can't be determined")
+
+            data.voltage_drop = float(
+                solution.voltage_drop[solution.solver.edge_index[a, b]]
+            )
+
+    def contingencies(self, processes: int | None = None, max_v_drop: float = 0.05) -> list[Violation]:
+        """Check the plan against the failure of each generator, cable and AMF input.
+
+        Returns the limits which are exceeded in each scenario, which are
+        evaluated in parallel on `processes` worker processes. See `contingency.analyse`.
+        """
+        return contingency.analyse(self, processes, max_v_drop)
+
+    def grids(self, split_amf: bool = True) -> list[Plan]:
+        """Split the plan into its independent grids, each fed by one source.
 
-            self.graph[a][b]["voltage_drop"] = (
-                current * data["impedance"] * length
-            ).to(ureg.V)
+        If `split_amf` is set, the grids on each side of an AMF are kept separate
+        by linking them with a LogicalSink and a LogicalSource. Each grid's graph
+        is a view, which shares the plan's connection records, and the grids are
+        cached until the plan changes.
+        """
+        cached = self._grids.get(split_amf)
+        if cached is not None:
+            return cached
 
-    def grids(self, split_amf: bool = True):
         graph = self.graph
-        if split_amf:
-            graph = graph.copy()
-            # Iterate over the original graph and modify the copy
-            for node in self.graph.nodes():
-                if type(node) == AMF:
-                    # Insert LogicalSource and LogicalSink nodes to split grids at the AMF.
-                    self.split_graph(graph, node)
+        amfs = [node for node in self.graph.nodes() if type(node) is AMF]
+        if split_amf and amfs:
+            graph = PlanGraph()
+            graph.add_nodes_from(self.graph)
+            for u, v, data in self.graph.edges(data=True):
+                graph.add_record(u, v, data)
+            for node in amfs:
+                # Insert LogicalSource and LogicalSink nodes to split grids at the AMF.
+                self.split_graph(graph, node)
 
         grids = []
         for c in nx.weakly_connected_components(graph):
@@ -290,10 +769,18 @@ class Plan:
             else:
                 name = name_source.name
             grids.append(
-                Plan(parent=self, name=name, graph=graph.subgraph(c), spec=self.spec)
+                Plan(
+                    parent=self,
+                    name=name,
+                    graph=graph.subgraph(c),
+                    spec=self.spec,
+                    power_factor=self.power_factor,
+                )
             )
 
-        return sorted(grids, key=lambda plan: plan.name)
+        grids.sort(key=lambda plan: plan.name or "")
+        self._grids[split_amf] = grids
+        return grids
 
     def __repr__(self):
         return (
@@ -301,7 +788,7 @@ class Plan:
             f"{self.num_distros()} distros, {len(self.graph.edges())} connections>"
         )
 
-    def split_graph(self, graph: nx.DiGraph, node: Distro) -> None:
+    def split_graph(self, graph: PlanGraph, node: Distro) -> None:
         for upstream, data in node.inputs():
             source = upstream.source()
             logical_source = LogicalSource(
@@ -309,25 +796,28 @@ class Plan:
                 node.voltage,
                 node.v_drop(upstream),
                 node.z_s(upstream),
-                data["current"],
-                data["phases"],
+                data.current,
+                data.phases,
                 source.geom
             )
             logical_sink = LogicalSink(
                 f"{node.name} {source.name}",
                 node.load(),
-                data["current"],
-                data["phases"],
+                data.current,
+                data.phases,
             )
 
             logical_source.plan = self
             logical_sink.plan = self
 
+            # The cable to the AMF now ends at the sink. The link from the source
+            # to the AMF is logical, so it gets its own record.
             graph.remove_edge(upstream, node)
-            graph.add_edge(upstream, logical_sink, **data)
-
-            data["length"] = 0
-            data["cable_lengths"] = [0]
-            data["voltage_drop"] = 0
-            data["logical"] = True
-            graph.add_edge(logical_source, node, **data)
+            graph.add_record(upstream, logical_sink, data)
+
+            link = data.copy()
+            link.length = 0
+            link.cable_lengths = [0]
+            link.voltage_drop = 0
+            link.logical = True
+            graph.add_record(logical_source, node, link)
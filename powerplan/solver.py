@@ -0,0 +1,597 @@
+"""Array-backed electrical calculations over a whole plan.
+
+The plan graph is flattened into NumPy arrays once, and loads, voltage drops,
+R1, Zs and prospective fault currents are then calculated for every node with a
+handful of vectorised operations per level of the distribution tree.
+
+All values are floats in SI units (watts, volts, amps, ohms, metres). Values
+which can't be calculated (for example because a cable has no impedance data)
+are NaN.
+
+R1 and Zs are summed along each path as complex impedances (R + jX), and are
+the magnitude of that sum, so they only depend on the cables. If any load has a
+power factor, each load's reactive power is summed up the tree alongside its
+real power, and the voltage drop on each cable is calculated with its resistance
+and reactance. Loads without a power factor, and cables without a resistance and
+reactance, use the scalar impedance.
+"""
+
+from __future__ import annotations
+
+import copy
+from collections.abc import Iterable
+from math import sqrt
+from typing import TYPE_CHECKING
+
+import networkx as nx
+import numpy as np
+
+from . import ureg
+from .data import AMF, MISSING, Connection, Generator, Load, LogicalSource, PowerNode, PowerSource
+
+if TYPE_CHECKING:
+    from .plan import Plan
+
+
+class Level:
+    """A group of edges whose downstream nodes are all at the same depth in the tree.
+
+    The edges are stored twice: grouped by downstream node, for pushing values
+    down the tree, and grouped by upstream node, for summing loads up it.
+    """
+
+    def __init__(self, edges: np.ndarray, parent: np.ndarray, child: np.ndarray):
+        by_child = edges[np.argsort(child[edges], kind="stable")]
+        self.edges = by_child
+        self.children, self.child_starts = np.unique(child[by_child], return_index=True)
+
+        by_parent = edges[np.argsort(parent[edges], kind="stable")]
+        self.edges_by_parent = by_parent
+        self.parents, self.parent_starts = np.unique(parent[by_parent], return_index=True)
+
+
+class PlanSolver:
+    """Calculates loads, voltage drops and fault loop impedances for a plan.
+
+    Nodes are numbered in topological order, and each edge records the index of
+    its upstream (`parent`) and downstream (`child`) node. Edges are grouped into
+    levels by the depth of their downstream node, so each level only depends on
+    the levels above it.
+
+    The solver captures the plan's topology and cables when it's constructed.
+    `solve` can then be called repeatedly, optionally with different loads, to
+    evaluate what-if scenarios without rebuilding the arrays. Changes to cables
+    and loads which don't alter the topology can be applied with `update_cable`
+    and `update_load`, and failures of edges and sources with `outage`.
+
+    Solvers are pickled without their nodes, so they can be sent to worker
+    processes, which refer to nodes by index.
+    """
+
+    def __init__(self, plan: Plan):
+        self.power_factor = plan.power_factor
+        graph = plan.graph
+        self.nodes: list[PowerNode] = list(nx.topological_sort(graph))
+        self.index = {node: i for i, node in enumerate(self.nodes)}
+        n = len(self.nodes)
+
+        self.own_load = np.zeros(n)
+        self.has_own_load = np.zeros(n, dtype=bool)
+        # Load profiles, keyed by node index
+        self.profiles: dict[int, np.ndarray] = {}
+        # Reactive power per watt of each node's own load, which is NaN if it has no power factor
+        self.tan_phi = np.full(n, np.nan)
+        self.is_source = np.zeros(n, dtype=bool)
+        self.is_amf = np.zeros(n, dtype=bool)
+        depth = np.zeros(n, dtype=int)
+
+        # Values at each power source
+        self.source_voltage = np.full(n, np.nan)
+        self.source_z_e = np.full(n, np.nan)
+        self.source_r1 = np.full(n, np.nan)
+        self.source_v_drop = np.full(n, np.nan)
+        self.source_length = np.full(n, np.nan)
+
+        parent: list[int] = []
+        child: list[int] = []
+        cable_length: list[float] = []
+        cable_impedance: list[float] = []
+        cable_resistance: list[float] = []
+        cable_reactance: list[float] = []
+        self.edge_index: dict[tuple[PowerNode, PowerNode], int] = {}
+
+        for i, node in enumerate(self.nodes):
+            if isinstance(node, Load):
+                self.own_load[i] = node.watts
+                self.has_own_load[i] = True
+                if node.profile is not None:
+                    self.profiles[i] = node.profile
+                self.tan_phi[i] = _tan_phi(node.power_factor or self.power_factor)
+            elif type(node).load is not PowerNode.load:
+                self.own_load[i] = node.load().to(ureg.W).magnitude
+                self.has_own_load[i] = True
+                self.tan_phi[i] = _tan_phi(self.power_factor)
+
+            if isinstance(node, PowerSource):
+                self.is_source[i] = True
+                self.source_r1[i] = node.r1().to(ureg.ohm).magnitude
+                # A LogicalSource's voltage drop may not be known, which is taken as none
+                v_drop = node.v_drop()
+                self.source_v_drop[i] = 0.0 if v_drop is None else v_drop.to(ureg.V).magnitude
+                if isinstance(node, LogicalSource):
+                    if node.voltage is not None:
+                        self.source_voltage[i] = node.voltage.to(ureg.V).magnitude
+                elif isinstance(node, Generator):
+                    self.source_length[i] = 0.0
+                    if node.get_spec() is not None:
+                        self.source_voltage[i] = node.voltage.to(ureg.V).magnitude
+                        self.source_z_e[i] = node.z_e().to(ureg.ohm).magnitude
+            self.is_amf[i] = isinstance(node, AMF)
+
+            for ipt, _, attrs in graph.in_edges(node, data=True):
+                u = self.index[ipt]
+                self.edge_index[ipt, node] = len(parent)
+                parent.append(u)
+                child.append(i)
+                depth[i] = max(depth[i], depth[u] + 1)
+
+                length, impedance, resistance, reactance = _cable_values(attrs)
+                cable_length.append(length)
+                cable_impedance.append(impedance)
+                cable_resistance.append(resistance)
+                cable_reactance.append(reactance)
+
+        self.parent = np.array(parent, dtype=int)
+        self.child = np.array(child, dtype=int)
+        self.cable_length = np.array(cable_length, dtype=float)
+        # Impedance of the cable (r1 + r2) in ohms/m
+        self.cable_impedance = np.array(cable_impedance, dtype=float)
+        self.cable_resistance = np.array(cable_resistance, dtype=float)
+        self.cable_reactance = np.array(cable_reactance, dtype=float)
+
+        # Loads are only summed into nodes which don't declare their own load
+        self._sums_load = ~self.has_own_load
+
+        self._set_topology(np.ones(len(self.parent), dtype=bool), depth)
+        self.supplied = self._supplied()[0]
+        self.refresh()
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        state.update(nodes=None, index={}, edge_index={})
+        return state
+
+    def _set_topology(self, active: np.ndarray, depth: np.ndarray) -> None:
+        """Group the `active` edges into levels by the `depth` of their downstream
+        node, and calculate the values which only depend on the topology."""
+        self.active = active
+        self.num_inputs = np.bincount(self.child[active], minlength=len(self.own_load))
+
+        # Default (no direction specified) values are only defined for nodes with
+        # a single input, or for AMFs, which report the worst case of their inputs.
+        self.defined = self.is_source | (self.num_inputs == 1) | (self.is_amf & (self.num_inputs > 1))
+
+        edge_depth = np.where(active, depth[self.child], 0)
+        self.levels = [
+            Level(np.flatnonzero(edge_depth == d), self.parent, self.child)
+            for d in range(1, int(edge_depth.max(initial=0)) + 1)
+        ]
+
+        self.voltage = self._nominal_voltage()
+        self.z_e = self._push_down(self.source_z_e, None)[1]
+        self.source, self.edge_source = self._sources()
+
+    def _supplied(self) -> tuple[np.ndarray, np.ndarray]:
+        """Which nodes are connected to a source by active edges, and the depth of each
+        in the tree of those edges. Returns `(supplied, depth)`."""
+        supplied = self.is_source.copy()
+        depth = np.zeros(len(self.own_load), dtype=int)
+        for level in self.levels:
+            edges = level.edges[supplied[self.parent[level.edges]]]
+            supplied[self.child[edges]] = True
+            np.maximum.at(depth, self.child[edges], depth[self.parent[edges]] + 1)
+        return supplied, depth
+
+    def outage(self, edges: Iterable[int] = (), sources: Iterable[int] = ()) -> PlanSolver:
+        """A copy of the solver with some edges and sources failed, to evaluate outages
+        without rebuilding it.
+
+        Edges are indexed as `edge_index`, and sources as `nodes`. Nodes which are
+        no longer connected to a source are marked in `supplied`, and edges from
+        them are also removed, so each node's values only depend on its inputs
+        which are still supplied. The copy shares the arrays which don't depend
+        on the topology with this solver.
+        """
+        solver = copy.copy(self)
+        solver.is_source = self.is_source.copy()
+        solver.is_source[list(sources)] = False
+        active = self.active.copy()
+        active[list(edges)] = False
+        solver.levels = [
+            Level(level.edges[active[level.edges]], self.parent, self.child) for level in self.levels
+        ]
+
+        solver.supplied, depth = solver._supplied()
+        solver._set_topology(active & solver.supplied[self.parent], depth)
+        solver.refresh()
+        return solver
+
+    @property
+    def complex(self) -> bool:
+        "Whether any load has a power factor, so voltage drops are calculated with complex power."
+        return bool(np.isfinite(self.tan_phi).any())
+
+    def refresh(self) -> None:
+        "Recalculate the values which depend on the cables."
+        self.edge_length, self.length = self._push_down(self.source_length, self.cable_length)
+        edge_r1, r1 = self._push_down_complex(self.source_r1 + 0j, self._cable_impedance() / 2)
+        self.edge_r1, self.r1 = np.abs(edge_r1), np.abs(r1)
+        # Ze is the generator's transient reactance, so it's in quadrature with R1
+        self.edge_z_s = np.abs(1j * self.z_e[self.child] + edge_r1 * 2)
+        self.z_s = np.abs(1j * self.z_e + r1 * 2)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            self.i_pf = (self.voltage / sqrt(3)) / self.z_s
+        self._stale = False
+
+    def update_cable(self, from_node: PowerNode, to_node: PowerNode, attrs: Connection) -> None:
+        """Update the cable between two nodes. `refresh` is called on the next `solve`."""
+        i = self.edge_index[from_node, to_node]
+        (
+            self.cable_length[i],
+            self.cable_impedance[i],
+            self.cable_resistance[i],
+            self.cable_reactance[i],
+        ) = _cable_values(attrs)
+        self._stale = True
+
+    def update_load(self, node: Load) -> None:
+        "Update the declared load, profile and power factor of a node."
+        i = self.index[node]
+        self.own_load[i] = node.watts
+        if node.profile is not None:
+            self.profiles[i] = node.profile
+        else:
+            self.profiles.pop(i, None)
+        self.tan_phi[i] = _tan_phi(node.power_factor or self.power_factor)
+
+    def slots(self) -> int:
+        "The number of time slots in the plan's load profiles, which is 1 if there are none."
+        lengths = {len(profile) for profile in self.profiles.values()}
+        if len(lengths) > 1:
+            raise ValueError(f"Load profiles have different numbers of time slots: {sorted(lengths)}")
+        return lengths.pop() if lengths else 1
+
+    def profile_loads(self, start: int = 0, stop: int | None = None) -> np.ndarray:
+        """The declared load of each node in each time slot from `start` to `stop`.
+
+        Returns an array of shape `(slots, nodes)`, which can be passed to `solve`.
+        Nodes without a profile have the same load in each slot.
+        """
+        stop = self.slots() if stop is None else min(stop, self.slots())
+        loads = np.repeat(self.own_load[np.newaxis, :], stop - start, axis=0)
+        for i, profile in self.profiles.items():
+            loads[:, i] = profile[start:stop]
+        return loads
+
+    def solve_profiles(self, chunk: int = 1024) -> ProfileSolution:
+        """Calculate peak loads and worst-case voltage drops over the load profiles.
+
+        Time slots are solved `chunk` at a time, to limit the memory used.
+        """
+        slots = self.slots()
+        n = len(self.own_load)
+        peak_load = np.full(n, -np.inf)
+        peak_slot = np.zeros(n, dtype=int)
+        total_load = np.zeros(n)
+        v_drop = np.full(n, np.nan)
+        voltage_drop = np.full(len(self.parent), np.nan)
+
+        for start in range(0, slots, chunk):
+            solution = self.solve(self.profile_loads(start, start + chunk))
+            load = solution.load
+            chunk_slot = load.argmax(axis=0)
+            chunk_peak = load[chunk_slot, np.arange(n)]
+            later = chunk_peak > peak_load
+            peak_load[later] = chunk_peak[later]
+            peak_slot[later] = chunk_slot[later] + start
+            total_load += load.sum(axis=0)
+            v_drop = np.fmax(v_drop, np.fmax.reduce(solution.v_drop, axis=0))
+            voltage_drop = np.fmax(voltage_drop, np.fmax.reduce(solution.voltage_drop, axis=0))
+
+        # The load if every load in the plan was at its own peak at once
+        own_peaks = self.own_load.copy()
+        for i, profile in self.profiles.items():
+            own_peaks[i] = profile.max()
+        undiversified_load = self.solve(own_peaks).load
+
+        return ProfileSolution(
+            self, slots, peak_load, peak_slot, total_load / slots, undiversified_load, v_drop, voltage_drop
+        )
+
+    def _push_down(self, base: np.ndarray, local: np.ndarray | None) -> tuple[np.ndarray, np.ndarray]:
+        """Propagate values from the sources down the tree.
+
+        `base` holds the value at each source, with a leading batch axis if required.
+        The value on each edge is the value of its upstream node plus `local`; the
+        value of a node is the maximum of its inputs. Returns `(edge_values, node_values)`.
+        """
+        node_values = np.where(self.is_source, base, np.nan)
+        edge_values = np.full(node_values.shape[:-1] + (len(self.parent),), np.nan)
+        for level in self.levels:
+            values = node_values[..., self.parent[level.edges]]
+            if local is not None:
+                values = values + local[..., level.edges]
+            edge_values[..., level.edges] = values
+            node_values[..., level.children] = np.maximum.reduceat(values, level.child_starts, axis=-1)
+        return edge_values, node_values
+
+    def _push_down_complex(self, base: np.ndarray, local: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """As `_push_down`, for complex values.
+
+        The value of a node with several inputs is the value of the input with the largest magnitude.
+        """
+        node_values = np.where(self.is_source, base, np.nan + 0j)
+        edge_values = np.full(len(self.parent), np.nan + 0j)
+        for level in self.levels:
+            values = node_values[self.parent[level.edges]] + local[level.edges]
+            edge_values[level.edges] = values
+            magnitude = np.abs(values)
+            counts = np.diff(level.child_starts, append=len(values))
+            segment = np.repeat(np.arange(len(level.children)), counts)
+            largest = magnitude == np.maximum.reduceat(magnitude, level.child_starts)[segment]
+            node_values[level.children[segment[largest]]] = values[largest]
+        return edge_values, node_values
+
+    def _cable_impedance(self) -> np.ndarray:
+        "The complex impedance (r1 + r2) of each cable in ohms."
+        return (self.cable_resistance + 1j * self.cable_reactance) * self.cable_length
+
+    def _nominal_voltage(self) -> np.ndarray:
+        "Nominal L-L voltage at each node, which is NaN if its sources' voltages differ."
+        voltage = np.where(self.is_source, self.source_voltage, np.nan)
+        for level in self.levels:
+            values = voltage[self.parent[level.edges]]
+            highest = np.maximum.reduceat(values, level.child_starts)
+            lowest = np.minimum.reduceat(values, level.child_starts)
+            voltage[level.children] = np.where(highest == lowest, highest, np.nan)
+        return voltage
+
+    def _sources(self) -> tuple[np.ndarray, np.ndarray]:
+        "Index of the source feeding each node and edge, or -1 if there isn't a single source."
+        source = np.where(self.is_source, np.arange(len(self.own_load)), -1)
+        edge_source = np.full(len(self.parent), -1)
+        for level in self.levels:
+            values = source[self.parent[level.edges]]
+            edge_source[level.edges] = values
+            single = self.num_inputs[level.children] == 1
+            source[level.children] = np.where(
+                single, np.maximum.reduceat(values, level.child_starts), -1
+            )
+        return source, edge_source
+
+    def solve(self, loads: np.ndarray | None = None) -> Solution:
+        """Calculate loads and voltage drops for the whole plan.
+
+        `loads` overrides the declared load (in watts) of each node, indexed as
+        `self.nodes`. It may have leading batch dimensions, in which case every
+        batch is solved at once and the load-dependent results share them.
+        """
+        if self._stale:
+            self.refresh()
+        if loads is None:
+            loads = self.own_load
+        loads = np.asarray(loads, dtype=float)
+        batch_shape = loads.shape[:-1]
+        load = np.where(self.has_own_load, loads, 0.0).reshape(-1, len(self.own_load))
+
+        if self.complex:
+            load, apparent, drop = self._sum_power(load)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                current = apparent / self.voltage[self.child]
+                voltage_drop = drop * self.cable_length / self.voltage[self.child]
+            load = load.reshape(batch_shape + (len(self.own_load),))
+            current = current.reshape(batch_shape + (len(self.parent),))
+            voltage_drop = voltage_drop.reshape(current.shape)
+        else:
+            load = self._sum_load(load).reshape(batch_shape + (len(self.own_load),))
+            with np.errstate(divide="ignore", invalid="ignore"):
+                # Per-phase current is the load in watts divided by the source L-L voltage
+                current = load[..., self.child] / self.voltage[self.child]
+            voltage_drop = current * self.cable_impedance * self.cable_length
+
+        edge_v_drop, v_drop = self._push_down(
+            np.broadcast_to(self.source_v_drop, load.shape), voltage_drop
+        )
+        return Solution(self, load, current, voltage_drop, edge_v_drop, v_drop)
+
+
+    def _sum_power(self, load: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Sum real and reactive power up the tree, for loads of shape `(batch, nodes)`.
+
+        Returns the real power of each node, and the apparent power and R1 + R2
+        voltage drop per metre of cable (in volt-ohms) on each edge. The drop in
+        phase with the voltage is I(R cos φ + X sin φ) = (RP + XQ) / V, or IZ for
+        loads with no power factor.
+        """
+        tan_phi = self.tan_phi[self.has_own_load]
+        if np.isfinite(tan_phi).all() and (tan_phi == tan_phi[:1]).all():
+            # Every load has the same power factor, so reactive power is proportional to real power
+            ratio = tan_phi[0] if len(tan_phi) else 0.0
+            load = self._sum_load(load)
+            child_load = load[:, self.child]
+            drop = (self.cable_resistance + self.cable_reactance * ratio) * child_load
+            return load, child_load * sqrt(1 + ratio**2), drop
+
+        known = np.isfinite(self.tan_phi)
+        batch = len(load)
+        power = self._sum_load(
+            np.concatenate([load, load * np.where(known, self.tan_phi, 0.0), np.where(known, 0.0, load)])
+        )
+        load = power[:batch]
+        child_load, reactive, unknown = (
+            values[:, self.child] for values in (load, power[batch : batch * 2], power[batch * 2 :])
+        )
+        drop = (
+            self.cable_resistance * child_load
+            + self.cable_reactance * reactive
+            + (self.cable_impedance - self.cable_resistance) * unknown
+        )
+        return load, np.hypot(child_load, reactive), drop
+
+    def _sum_load(self, load: np.ndarray) -> np.ndarray:
+        "Sum loads of shape `(batch, nodes)` up the tree, into the nodes which don't declare their own."
+        for level in reversed(self.levels):
+            edges = level.edges_by_parent
+            sums = np.add.reduceat(load[:, self.child[edges]], level.parent_starts, axis=1)
+            load[:, level.parents] += np.where(self._sums_load[level.parents], sums, 0)
+        return load
+
+
+class Solution:
+    """The result of `PlanSolver.solve`.
+
+    Load-independent values (`r1`, `z_s`, `i_pf` and so on) are read from the solver.
+    """
+
+    def __init__(
+        self,
+        solver: PlanSolver,
+        load: np.ndarray,
+        current: np.ndarray,
+        voltage_drop: np.ndarray,
+        edge_v_drop: np.ndarray,
+        v_drop: np.ndarray,
+    ):
+        self.solver = solver
+        self.load = load
+        self.current = current
+        self.voltage_drop = voltage_drop
+        self.edge_v_drop = edge_v_drop
+        self.v_drop = v_drop
+
+    def value(self, field: str, node: PowerNode, direction: PowerNode | None = None):
+        """Look up a calculated value for a node, optionally via one of its inputs.
+
+        Returns a float, None if the value couldn't be calculated, or `MISSING`
+        if the node isn't in the plan or the value isn't defined for it.
+        """
+        solver = self.solver
+        i = solver.index.get(node)
+        if i is None:
+            return MISSING
+
+        if field == "load":
+            return _float(self.load[i])
+        if field in ("voltage", "z_e", "i_pf"):
+            return _float(getattr(solver, field)[i])
+
+        if field == "v_drop":
+            node_values, edge_values = self.v_drop, self.edge_v_drop
+        else:
+            node_values, edge_values = getattr(solver, field), getattr(solver, "edge_" + field)
+
+        if direction is None:
+            if not solver.defined[i] or (field == "source" and solver.is_source[i]):
+                return MISSING
+            value = node_values[i]
+        else:
+            index = solver.edge_index.get((direction, node))
+            if index is None:
+                return MISSING
+            value = edge_values[index]
+
+        if field == "source":
+            if value < 0:
+                return MISSING
+            return solver.nodes[value]
+        return _float(value)
+
+
+class ProfileSolution:
+    """The result of `PlanSolver.solve_profiles`.
+
+    For each node, `peak_load` is its highest load in any time slot, which is
+    in slot `peak_slot`, and `mean_load` is its average load. `undiversified_load`
+    is the load if every load downstream was at its own peak at the same time.
+    `v_drop` is the worst voltage drop at each node, and `voltage_drop` the
+    worst voltage drop along each cable (indexed as `solver.edge_index`).
+    """
+
+    def __init__(
+        self,
+        solver: PlanSolver,
+        slots: int,
+        peak_load: np.ndarray,
+        peak_slot: np.ndarray,
+        mean_load: np.ndarray,
+        undiversified_load: np.ndarray,
+        v_drop: np.ndarray,
+        voltage_drop: np.ndarray,
+    ):
+        self.solver = solver
+        self.slots = slots
+        self.peak_load = peak_load
+        self.peak_slot = peak_slot
+        self.mean_load = mean_load
+        self.undiversified_load = undiversified_load
+        self.v_drop = v_drop
+        self.voltage_drop = voltage_drop
+
+    def value(self, field: str, node: PowerNode):
+        """Look up a value for a node.
+
+        Returns a float (or an int for `peak_slot`), None if the value couldn't be
+        calculated, or `MISSING` if the node isn't in the plan or the value isn't
+        defined for it.
+        """
+        i = self.solver.index.get(node)
+        if i is None:
+            return MISSING
+        if field == "peak_slot":
+            return int(self.peak_slot[i])
+        if field == "v_drop" and not self.solver.defined[i]:
+            return MISSING
+        return _float(getattr(self, field)[i])
+
+    def cable_value(self, field: str, from_node: PowerNode, to_node: PowerNode):
+        "Look up a value for the cable between two nodes, or `MISSING` if there isn't one."
+        index = self.solver.edge_index.get((from_node, to_node))
+        if index is None:
+            return MISSING
+        return _float(getattr(self, field)[index])
+
+    def diversity(self, node: PowerNode) -> float | None:
+        "The ratio of a node's undiversified load to its peak load, or None if it has no load."
+        i = self.solver.index.get(node)
+        if i is None or self.peak_load[i] <= 0:
+            return None
+        return float(self.undiversified_load[i] / self.peak_load[i])
+
+
+def _cable_values(attrs: Connection) -> tuple[float, float, float, float]:
+    """Return the total length (m), and the impedance, resistance and reactance (ohms/m) of a cable.
+
+    Values are NaN if unknown. If only the impedance is known, it's taken to be resistive.
+    """
+    lengths = attrs.cable_lengths
+    length = np.nan if lengths is None else sum(lengths)
+    impedance = attrs.impedance
+    if not impedance or not lengths:
+        return length, np.nan, np.nan, np.nan
+    if attrs.resistance is None or attrs.reactance is None:
+        return length, impedance, impedance, 0.0
+    return length, impedance, attrs.resistance, attrs.reactance
+
+
+def _tan_phi(power_factor: float | None) -> float:
+    "The ratio of reactive to real power for a lagging power factor, or NaN if it's unknown."
+    if power_factor is None:
+        return np.nan
+    return sqrt(1 - power_factor**2) / power_factor
+
+
+def _float(value) -> float | None:
+    value = float(value)
+    if np.isnan(value):
+        return None
+    return value
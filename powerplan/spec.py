@@ -1,5 +1,12 @@
+from __future__ import annotations
+
+import hashlib
 import logging
+import math
 import os.path
+import pickle
+from collections.abc import MutableMapping
+from functools import cache
 from itertools import combinations_with_replacement
 from os import walk
 
@@ -7,40 +14,326 @@ import yaml
 from pint import PintError
 
 from . import ureg
+from .stats import Stats
+
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader  # type: ignore[assignment]
 
 REQUIRED = ["type", "ref"]
 
+# Bump this when the format of the spec cache changes
+CACHE_VERSION = 2
+
+# The EquipmentSpec attribute which each type of item is stored in
+ITEM_KINDS = {"generator": "generator", "distro": "distro", "amf": "distro", "cable": "cables"}
+
+# Weight multipliers used to rank cable combinations
+EXCESS_LENGTH_WEIGHT = 5.0  # Penalty per unit of wasted length
+CABLE_COUNT_WEIGHT = 15.0  # Penalty per cable used (prefers fewer joints)
+THRESHOLD_PENALTY = 15.0  # Penalty per instance of small cables on long runs
+
+MAX_CABLES = 5
+SMALL_THRESHOLD = 5.0
+
+
+def _combination_score(combo, min_length, long_run, small_threshold=SMALL_THRESHOLD) -> float:
+    "The penalty score of a cable combination, as ranked by `EquipmentSpec.find_cable_combinations`."
+    # base penalty for wasting length
+    score = float(sum(combo) - min_length) * EXCESS_LENGTH_WEIGHT
+
+    # add penalty for using more cables (prefer fewer joints)
+    score += len(combo) * CABLE_COUNT_WEIGHT
+
+    # disincentivize cables <= threshold ONLY IF target > largest cable
+    if long_run:
+        # Count how many cables in this combo fall below or equal the threshold
+        score += sum(1 for length in combo if length <= small_threshold) * THRESHOLD_PENALTY
+    return score
+
+
+class CableLengthTable:
+    """Precomputed best cable combinations for every integer run length.
+
+    This produces exactly the same selection as
+    `EquipmentSpec.find_cable_combinations`, but the ranking is done once
+    per cable type rather than for every run.
+
+    For a required length `m`, the score of a combination is
+    `EXCESS_LENGTH_WEIGHT * (total - m) + CABLE_COUNT_WEIGHT * count`, plus the
+    small cable penalty if `m` is longer than the longest cable in stock. For a
+    fixed `m` the `- m` term is constant, so the best combination only changes
+    at integer boundaries when all stock lengths are integers. We sweep
+    combinations in descending order of total length, keeping the best ones seen
+    so far for each of the two penalty regimes, scored in exact integers.
+
+    Every combination which ties for the best score is kept. For an integer `m`
+    the search breaks ties in enumeration order, but for a fractional `m` the
+    scores are rounded differently, so `lookup` re-scores the tied
+    combinations the same way the search does.
+    """
+
+    def __init__(self, stock):
+        self.stock = sorted(stock)
+        self.max_stock_item = max(self.stock)
+        self.max_total = int(self.max_stock_item) * MAX_CABLES
+
+        combos = []
+        for r in range(1, MAX_CABLES + 1):
+            for combo in combinations_with_replacement(self.stock, r):
+                small = sum(1 for length in combo if length <= SMALL_THRESHOLD)
+                combos.append((int(sum(combo)), len(combo), small, combo))
+
+        # Keep enumeration order within each total so ties are broken exactly as
+        # the stable sort in find_cable_combinations does.
+        order = sorted(range(len(combos)), key=lambda i: -combos[i][0])
+
+        # The best score in each penalty regime, and the (index, combo) of every
+        # combination with that score
+        short_score, short_ties = None, []  # min_length <= longest stock cable
+        long_score, long_ties = None, []  # min_length > longest stock cable
+        best: list = [None] * (self.max_total + 1)
+        short_best = long_best = None
+        i = 0
+        for target in range(self.max_total, -1, -1):
+            while i < len(order) and combos[order[i]][0] >= target:
+                idx = order[i]
+                total, count, small, combo = combos[idx]
+                base = total * int(EXCESS_LENGTH_WEIGHT) + count * int(CABLE_COUNT_WEIGHT)
+                score = base + small * int(THRESHOLD_PENALTY)
+                if short_score is None or base < short_score:
+                    short_score, short_ties, short_best = base, [(idx, combo)], None
+                elif base == short_score:
+                    short_ties.append((idx, combo))
+                    short_best = None
+                if long_score is None or score < long_score:
+                    long_score, long_ties, long_best = score, [(idx, combo)], None
+                elif score == long_score:
+                    long_ties.append((idx, combo))
+                    long_best = None
+                i += 1
+            # Share one tuple of ties between the targets they're the best for
+            if target > self.max_stock_item:
+                if long_best is None and long_ties:
+                    long_best = tuple(combo for _, combo in sorted(long_ties))
+                best[target] = long_best
+            else:
+                if short_best is None and short_ties:
+                    short_best = tuple(combo for _, combo in sorted(short_ties))
+                best[target] = short_best
+        self.best: list[tuple] = best
+
+    @classmethod
+    def supports(cls, stock) -> bool:
+        "The table can only be used for non-empty stock with integer lengths."
+        return bool(stock) and all(float(length).is_integer() for length in stock)
+
+    def lookup(self, min_length) -> tuple:
+        "Return the best combination of cables which is at least `min_length` long."
+        target = max(0, math.ceil(min_length))
+        if target > self.max_total:
+            raise ValueError(f"No valid cable combinations found to meet length {min_length}")
+        ties = self.best[target]
+        if len(ties) == 1 or min_length == target:
+            return ties[0]
+        long_run = min_length > self.max_stock_item
+        # min() returns the first of equal scores, like the stable sort in the search
+        return min(ties, key=lambda combo: _combination_score(combo, min_length, long_run))
+
+
+class PortIndex:
+    """The inputs or outputs of a piece of equipment, grouped by current, phases and connector type.
+
+    Ports in the same group are interchangeable, so assigning connections to
+    ports only has to choose a group for each connection.
+    """
+
+    def __init__(self, ports: list[dict]):
+        self.groups: dict[tuple, list[int]] = {}
+        for port_id, port in enumerate(ports):
+            key = (port["current"], port["phases"], port.get("type"))
+            self.groups.setdefault(key, []).append(port_id)
+        self.by_rating: dict[tuple, list[tuple]] = {}
+        for key in self.groups:
+            self.by_rating.setdefault(key[:2], []).append(key)
+
+    def keys(self, current, phases) -> list[tuple]:
+        "Groups of ports with the given rating, in port order."
+        return self.by_rating.get((current, phases), [])
+
+    def free(self, key: tuple, allocated: set[int]) -> list[int]:
+        "Ports in a group which aren't allocated."
+        return [port_id for port_id in self.groups.get(key, ()) if port_id not in allocated]
+
+    def first_free(self, key: tuple, allocated: set[int], preferred: int | None = None) -> int | None:
+        "The preferred port if it's in the group and free, otherwise the first free port."
+        ports = self.groups.get(key, ())
+        if preferred in ports and preferred not in allocated:
+            return preferred
+        return next((port_id for port_id in ports if port_id not in allocated), None)
+
+
+class LazyItems(MutableMapping):
+    """A dict of spec items, some of which haven't been imported yet.
+
+    Deferred items are stored pickled, and imported into the spec the first
+    time they're accessed.
+    """
+
+    def __init__(self, spec: EquipmentSpec):
+        self.spec = spec
+        self.items_loaded: dict = {}
+        self.deferred: dict = {}
+
+    def defer(self, key, blob: bytes, supplier: str) -> None:
+        self.items_loaded.pop(key, None)
+        self.deferred[key] = (blob, supplier)
+
+    def get(self, key, default=None):
+        item = self.items_loaded.get(key)
+        if item is not None:
+            return item
+        if key in self.deferred:
+            return self[key]
+        return default
+
+    def __getitem__(self, key):
+        if key in self.deferred:
+            blob, supplier = self.deferred.pop(key)
+            self.spec.import_equipment(pickle.loads(blob), supplier)
+        return self.items_loaded[key]
+
+    def __setitem__(self, key, item) -> None:
+        self.deferred.pop(key, None)
+        self.items_loaded[key] = item
+
+    def __delitem__(self, key) -> None:
+        if self.deferred.pop(key, None) is None:
+            del self.items_loaded[key]
+
+    def __contains__(self, key) -> bool:
+        return key in self.items_loaded or key in self.deferred
+
+    def __iter__(self):
+        yield from self.items_loaded
+        yield from list(self.deferred)
+
+    def __len__(self) -> int:
+        return len(self.items_loaded) + len(self.deferred)
+
 
 class EquipmentSpec:
     """Stores specification data about power equipment."""
 
-    def __init__(self, metadata_path):
+    def __init__(self, metadata_path, cache_path=None, lazy=False):
+        """Load specs from the YAML files under `metadata_path`.
+
+        If `cache_path` is given, the parsed files are cached there, and only
+        files which have changed since the cache was written are parsed again.
+
+        If `lazy` is set, items are only indexed by their ref when the spec is
+        loaded, and are imported when they're first used.
+        """
         self.log = logging.getLogger(__name__)
-        self.generator = {}
-        self.distro = {}
-        self.cables = {}
+        self.cache_path = cache_path
+        self.lazy = lazy
+        self.generator = LazyItems(self)
+        self.distro = LazyItems(self)
+        self.cables = LazyItems(self)
+        self.cable_tables: dict[tuple, CableLengthTable] = {}
+        self._port_indexes: dict[tuple[int, str], tuple[dict, PortIndex]] = {}
+        # Call counts and cache hits, which are reported by `Plan.generate`
+        self.stats = Stats()
         self.load(metadata_path)
 
     def __len__(self):
         return len(self.generator)+len(self.distro)+len(self.cables)
 
     def load(self, metadata_path):
+        cache = self.read_cache()
+        files = {}
         for dirpath, _dirnames, filenames in walk(metadata_path):
             for fname in filenames:
                 _, ext = os.path.splitext(fname)
                 path = os.path.join(dirpath, fname)
                 if os.path.isfile(path) and ext in (".yml", ".yaml"):
                     _, supplier = os.path.split(dirpath)
-                    self.load_file(path, supplier)
+                    files[path] = self.load_file(path, supplier, cache.get(path))
 
-    def load_file(self, path, supplier):
-        with open(path) as f:
-            data = yaml.load(f, Loader=yaml.SafeLoader)
+        if self.cache_path is not None and files != cache:
+            self.write_cache(files)
 
-        if not data:
-            return
-        for item in data:
-            self.import_equipment(item, supplier)
+    def load_file(self, path, supplier, cached=None):
+        """Import the equipment in a YAML file.
+
+        `cached` is the file's entry from the spec cache, which is used instead
+        of parsing the file if it's still up to date. Returns the file's new
+        cache entry.
+        """
+        stat = os.stat(path)
+        if cached is not None and (cached["mtime"], cached["size"]) == (stat.st_mtime_ns, stat.st_size):
+            entry = cached
+        else:
+            with open(path, "rb") as f:
+                content = f.read()
+            digest = hashlib.sha256(content).hexdigest()
+            if cached is not None and cached["hash"] == digest:
+                # Touched but not changed
+                items = cached["items"]
+            else:
+                self.log.debug("Parsing %s", path)
+                items = [self.index_item(item) for item in yaml.load(content, Loader=SafeLoader) or []]
+            entry = {"mtime": stat.st_mtime_ns, "size": stat.st_size, "hash": digest, "items": items}
+
+        # Items are stored pickled so the cached copy isn't modified by importing them
+        for kind, key, blob in entry["items"]:
+            if self.lazy and kind is not None:
+                getattr(self, kind).defer(key, blob, supplier)
+            else:
+                self.import_equipment(pickle.loads(blob), supplier)
+        return entry
+
+    def index_item(self, item) -> tuple:
+        """Return the attribute and key an item will be stored under, and the pickled item.
+
+        The attribute and key are None if the item is invalid, in which case it's
+        always imported straight away so the error is reported.
+        """
+        blob = pickle.dumps(item)
+        kind = ITEM_KINDS.get(item.get("type", "")) if isinstance(item, dict) else None
+        try:
+            if kind == "cables":
+                return kind, (item["connector"], self.convert_current(item["rating"]), item["phases"]), blob
+            if kind is not None:
+                return kind, item["ref"], blob
+        except (KeyError, PintError, AttributeError):
+            pass
+        return None, None, blob
+
+    def read_cache(self) -> dict:
+        "Read the parsed files from the spec cache, if there's a usable one."
+        if self.cache_path is None or not os.path.exists(self.cache_path):
+            return {}
+        try:
+            with open(self.cache_path, "rb") as f:
+                cache = pickle.load(f)
+        except (OSError, pickle.PickleError, EOFError, AttributeError, ValueError) as e:
+            self.log.warning("Unable to read spec cache %s: %s", self.cache_path, e)
+            return {}
+        if not isinstance(cache, dict) or cache.get("version") != CACHE_VERSION:
+            return {}
+        return cache["files"]
+
+    def write_cache(self, files: dict) -> None:
+        "Write the parsed files to the spec cache."
+        tmp_path = f"{self.cache_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                pickle.dump({"version": CACHE_VERSION, "files": files}, f, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            self.log.warning("Unable to write spec cache %s: %s", self.cache_path, e)
 
     def import_equipment(self, item, supplier):
         if "type" not in item:
@@ -53,7 +346,7 @@ class EquipmentSpec:
             for field in ("voltage", "power", "transient_reactance"):
                 if field in item:
                     try:
-                        item[field] = ureg(item[field])
+                        item[field] = _parse_quantity(item[field])
                     except PintError as e:
                         raise ValueError(
                             f"Unable to parse {field}: {item[field]} ({e})"
@@ -63,7 +356,12 @@ class EquipmentSpec:
             self.distro[item["ref"]] = item
         elif item["type"] == "cable":
             item["rating"] = self.convert_current(item["rating"])
-            self.cables[(item["connector"], item["rating"], item["phases"])] = item
+            key = (item["connector"], item["rating"], item["phases"])
+            self.cables[key] = item
+            if CableLengthTable.supports(item.get("lengths")):
+                self.cable_tables[key] = CableLengthTable(item["lengths"])
+            else:
+                self.cable_tables.pop(key, None)
 
     def parse_item(self, item):
         for key in ["inputs", "outputs"]:
@@ -82,8 +380,18 @@ class EquipmentSpec:
                     res.append(io)
             item[key] = res
 
+    def port_index(self, item: dict, direction: str) -> PortIndex:
+        """Return the index of an item's "inputs" or "outputs"."""
+        cached = self._port_indexes.get((id(item), direction))
+        self.stats.lookup("port_index", cached is not None and cached[0] is item)
+        if cached is not None and cached[0] is item:
+            return cached[1]
+        index = PortIndex(item.get(direction, []))
+        self._port_indexes[id(item), direction] = (item, index)
+        return index
+
     def convert_current(self, val):
-        return ureg(val).to(ureg.A).magnitude
+        return _parse_quantity(val).to(ureg.A).magnitude
 
     def select_cable(self, connector, rating, phases, length, extra_length=0):
         """Select appropriate cables for a run.
@@ -94,67 +402,55 @@ class EquipmentSpec:
         so extra lengths will show up as extra "spare" in the power plan.
 
         """
+        self.stats.count("select_cable")
         key = (connector, rating, phases)
-        if key not in self.cables:
+        cable = self.cables.get(key)
+        if cable is None:
             raise ValueError(
                 f"No cable data available for {connector}, {rating}A, {phases} phases"
             )
 
         if length is None:
-            return (None, self.cables[key]["csa"])
+            return (None, cable["csa"])
 
         if extra_length is None:
             extra_length = 0
 
         # Calculate the shortest combination of cable lengths.
         # The n-sum problem!
+        table = self.cable_tables.get(key)
+        self.stats.lookup("cable_table", table is not None)
+        if table is not None:
+            return (table.lookup(length + extra_length), cable["csa"])
 
-        lengths = sorted(self.cables[key]["lengths"])
+        lengths = sorted(cable["lengths"])
 
         combinations = self.find_cable_combinations(lengths, length+extra_length)
 
         selected_lengths = combinations[0][2]  # Get the cable lengths from the best combo
 
+        return (selected_lengths, cable["csa"])
 
-        return (selected_lengths, self.cables[key]["csa"])
-
-    def find_cable_combinations(self, stock, min_length, small_threshold=5.0):
+    def find_cable_combinations(self, stock, min_length, small_threshold=SMALL_THRESHOLD):
         """
         Finds combinations of up to 5 cables that meet or exceed a minimum length,
         ranking them using weights and a penalty for cables below a threshold.
         """
+        self.stats.count("find_cable_combinations")
         if not stock:
             return []
 
         valid_combinations = []
         max_stock_item = max(stock)
 
-        # weight multipliers
-        EXCESS_LENGTH_WEIGHT = 5.0  # Penalty per unit of wasted length
-        CABLE_COUNT_WEIGHT = 15.0  # Penalty per cable used (prefers fewer joints)
-        THRESHOLD_PENALTY = 15.0  # Penalty per instance of small cables on long runs
-
         # check combinations from 1 up to 5 cables
-        for r in range(1, 6):
+        for r in range(1, MAX_CABLES + 1):
             for combo in combinations_with_replacement(stock, r):
                 total = sum(combo)
 
                 if total >= min_length:
-                    excess = float(total - min_length)
-                    num_cables = len(combo)
-
-                    # base penalty for wasting length
-                    score = excess * EXCESS_LENGTH_WEIGHT
-
-                    # add penalty for using more cables (prefer fewer joints)
-                    score += num_cables * CABLE_COUNT_WEIGHT
-
-                    # disincentivize cables <= threshold ONLY IF target > largest cable
-                    if min_length > max_stock_item:
-                        # Count how many cables in this combo fall below or equal the threshold
-                        small_cable_count = sum(1 for length in combo if length <= small_threshold)
-                        score += (small_cable_count * THRESHOLD_PENALTY)
-
+                    long_run = min_length > max_stock_item
+                    score = _combination_score(combo, min_length, long_run, small_threshold)
                     valid_combinations.append((score, total, combo))
 
         # sort by penalty score ascending (lowest score = best option)
@@ -164,3 +460,9 @@ class EquipmentSpec:
             raise ValueError(f"No valid cable combinations found to meet length {min_length}")
             
         return valid_combinations
+
+
+@cache
+def _parse_quantity(value):
+    "Parse a quantity from the spec. The same few values appear many times, so they're cached."
+    return ureg(value)
@@ -0,0 +1,101 @@
+"""Instrumentation of plan generation.
+
+`Plan.generate` records the time taken by each of its stages in a `Stats`
+object, along with counts of calls to the cable selection functions and the
+hit rates of the caches they use.
+"""
+
+from __future__ import annotations
+
+import time
+from collections import Counter
+from collections.abc import Iterator
+from contextlib import contextmanager
+
+
+class Stats:
+    """Timings, call counts and cache hits.
+
+    `timings` holds the total seconds spent in each stage, `calls` the number
+    of calls to each function, and `hits` and `misses` the number of lookups
+    in each cache which were and weren't found.
+    """
+
+    __slots__ = ("timings", "calls", "hits", "misses")
+
+    def __init__(self):
+        self.timings: dict[str, float] = {}
+        self.calls: Counter[str] = Counter()
+        self.hits: Counter[str] = Counter()
+        self.misses: Counter[str] = Counter()
+
+    def __repr__(self):
+        return f"<Stats timings={self.timings} calls={dict(self.calls)}>"
+
+    @contextmanager
+    def timer(self, stage: str) -> Iterator[None]:
+        "Add the time spent in a `with` block to a stage's timing."
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[stage] = self.timings.get(stage, 0.0) + time.perf_counter() - start
+
+    def count(self, name: str) -> None:
+        self.calls[name] += 1
+
+    def lookup(self, cache: str, hit: bool) -> None:
+        "Record a lookup in a cache."
+        if hit:
+            self.hits[cache] += 1
+        else:
+            self.misses[cache] += 1
+
+    def hit_rate(self, cache: str) -> float | None:
+        "The proportion of lookups in a cache which were hits, or None if there were none."
+        total = self.hits[cache] + self.misses[cache]
+        if total == 0:
+            return None
+        return self.hits[cache] / total
+
+    def copy(self) -> Stats:
+        stats = Stats()
+        stats.update(self)
+        return stats
+
+    def update(self, other: Stats) -> None:
+        "Add the timings and counts from another `Stats`."
+        for stage, seconds in other.timings.items():
+            self.timings[stage] = self.timings.get(stage, 0.0) + seconds
+        self.calls.update(other.calls)
+        self.hits.update(other.hits)
+        self.misses.update(other.misses)
+
+    def since(self, earlier: Stats) -> Stats:
+        "The timings and counts recorded since `earlier`, which is a copy of this object."
+        stats = Stats()
+        stats.timings = {
+            stage: seconds - earlier.timings.get(stage, 0.0)
+            for stage, seconds in self.timings.items()
+            if seconds != earlier.timings.get(stage, 0.0)
+        }
+        stats.calls = self.calls - earlier.calls
+        stats.hits = self.hits - earlier.hits
+        stats.misses = self.misses - earlier.misses
+        return stats
+
+    def as_dict(self) -> dict:
+        "The stats as plain dicts, for forwarding to a metrics system."
+        caches = sorted(set(self.hits) | set(self.misses))
+        return {
+            "timings": dict(self.timings),
+            "calls": dict(self.calls),
+            "caches": {
+                cache: {
+                    "hits": self.hits[cache],
+                    "misses": self.misses[cache],
+                    "hit_rate": self.hit_rate(cache),
+                }
+                for cache in caches
+            },
+        }
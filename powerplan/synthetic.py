@@ -0,0 +1,189 @@
+"""Synthetic plans of arbitrary size, for benchmarking.
+
+The equipment is chosen from the spec. Each generator feeds a main distro (the
+distro with the largest input), which is the root of a tree of distros: every
+distro in the tree feeds up to `fanout` distros from its largest outputs, down
+to `depth` levels below the main distro, and has `loads` loads. The distro fed
+from each output is the one which can itself feed the most distros.
+
+AMFs are fed from the main distros of two generators, and are the root of a
+tree of their own.
+"""
+
+from __future__ import annotations
+
+from .data import AMF, Distro, Generator, Load
+from .plan import Plan
+from .spec import EquipmentSpec
+
+# The largest number of nodes fed by each generator in a plan built by `sized_plan`
+MAX_GENERATOR_NODES = 100
+
+
+class Equipment:
+    """The equipment in a spec which synthetic plans are built from.
+
+    `main` is the type of the main distros, and `amf` of the AMFs (or None if
+    the spec has none which can be used), which are fed by main distros of type
+    `amf_main`. `children` maps each distro type to the `(current, phases, type)`
+    of each distro which can be fed from its outputs, largest first.
+    """
+
+    def __init__(self, spec: EquipmentSpec):
+        if not spec.generator:
+            raise ValueError("Spec has no generators")
+        self.generator = min(spec.generator)
+
+        distros = {
+            ref: item
+            for ref, item in spec.distro.items()
+            if item["type"] == "distro" and len(item["inputs"]) == 1
+        }
+
+        def can_feed(output: dict, item: dict) -> bool:
+            ipt = item["inputs"][0]
+            return (
+                (output["current"], output["phases"]) == (ipt["current"], ipt["phases"])
+                and output.get("type") == ipt.get("type")
+                and (output.get("type"), output["current"], output["phases"]) in spec.cables
+            )
+
+        def fed_from(output: dict) -> list[str]:
+            return sorted(ref for ref, item in distros.items() if can_feed(output, item))
+
+        def score(ref: str) -> int:
+            return sum(1 for output in distros[ref]["outputs"] if fed_from(output))
+
+        self.children: dict[str, list[tuple[int, int, str]]] = {}
+        for ref, item in sorted(spec.distro.items()):
+            children = []
+            for output in sorted(item["outputs"], key=lambda output: -output["current"]):
+                candidates = fed_from(output)
+                if candidates:
+                    child = max(candidates, key=lambda ref: (score(ref), ref))
+                    children.append((output["current"], output["phases"], child))
+            self.children[ref] = children
+
+        if not distros:
+            raise ValueError("Spec has no distros")
+        self.inputs = {
+            ref: (item["inputs"][0]["current"], item["inputs"][0]["phases"]) for ref, item in distros.items()
+        }
+        self.main = max(distros, key=lambda ref: (self.inputs[ref][0], score(ref), ref))
+
+        # An AMF, and a distro with the same input as the main distro which can feed it
+        self.amf: str | None = None
+        self.amf_main = self.main
+        for ref, item in sorted(spec.distro.items()):
+            if item["type"] != "amf":
+                continue
+            mains = [
+                main
+                for main, main_item in distros.items()
+                if self.inputs[main] == self.inputs[self.main]
+                and any(can_feed(output, item) for output in main_item["outputs"])
+            ]
+            if mains:
+                self.amf = ref
+                self.amf_main = max(mains, key=lambda ref: (score(ref), ref))
+                self.inputs[ref] = (item["inputs"][0]["current"], item["inputs"][0]["phases"])
+                # The AMF's inputs aren't used for the main distro's tree
+                self.children[self.amf_main] = [
+                    child for child in self.children[self.amf_main] if child[:2] != self.inputs[ref]
+                ]
+                break
+
+    def tree_size(self, distro: str, depth: int, fanout: int, loads: int) -> int:
+        "The number of nodes, including loads, in the tree below a distro."
+        if depth == 0:
+            return 0
+        return sum(
+            1 + loads + self.tree_size(child, depth - 1, fanout, loads)
+            for _, _, child in self.children[distro][:fanout]
+        )
+
+
+def synthetic_plan(
+    spec: EquipmentSpec,
+    generators: int = 1,
+    depth: int = 2,
+    fanout: int = 4,
+    amfs: int = 0,
+    loads: int = 1,
+    load: float = 1000,
+    length: int = 10,
+) -> Plan:
+    """Build a synthetic plan.
+
+    `fanout` is limited by the number of outputs of each distro which can feed
+    another distro, and `amfs` to half the number of generators. Each load is
+    `load` watts, and each cable is `length` metres.
+    """
+    equipment = Equipment(spec)
+    if amfs * 2 > generators:
+        raise ValueError(f"{amfs} AMFs need at least {amfs * 2} generators")
+    if amfs and equipment.amf is None:
+        raise ValueError("Spec has no AMF which can be fed from a main distro")
+
+    plan = Plan(name="Synthetic", spec=spec)
+
+    def tree(upstream: Distro, upstream_type: str, level: int) -> None:
+        if level == depth:
+            return
+        for i, (current, phases, child) in enumerate(equipment.children[upstream_type][:fanout]):
+            distro = Distro(name=f"{upstream.name}.{i}", type=child)
+            plan.add_connection(upstream, distro, current, phases, length=length)
+            for j in range(loads):
+                plan.add_connection(distro, Load(name=f"{distro.name} Load {j}", load=load))
+            tree(distro, child, level + 1)
+
+    mains = []
+    for g in range(generators):
+        gen = Generator(name=f"G{g}", type=equipment.generator)
+        main_type = equipment.amf_main if g < amfs * 2 else equipment.main
+        main = Distro(name=f"G{g}-M", type=main_type)
+        plan.add_connection(gen, main, *equipment.inputs[main_type], length=length)
+        mains.append(main)
+        tree(main, main_type, 0)
+
+    for a in range(amfs):
+        assert equipment.amf is not None
+        amf = AMF(name=f"AMF{a}", type=equipment.amf)
+        for main in mains[a * 2 : a * 2 + 2]:
+            plan.add_connection(main, amf, *equipment.inputs[equipment.amf], length=length)
+        tree(amf, equipment.amf, 0)
+
+    return plan
+
+
+def plan_size(
+    spec: EquipmentSpec, generators: int = 1, depth: int = 2, fanout: int = 4, amfs: int = 0, loads: int = 1
+) -> int:
+    "The number of nodes, including loads, in a plan built by `synthetic_plan`."
+    equipment = Equipment(spec)
+    nodes = 0
+    for g in range(generators):
+        main_type = equipment.amf_main if g < amfs * 2 else equipment.main
+        nodes += 2 + equipment.tree_size(main_type, depth, fanout, loads)
+    if amfs and equipment.amf is not None:
+        nodes += amfs * (1 + equipment.tree_size(equipment.amf, depth, fanout, loads))
+    return nodes
+
+
+def sized_plan(spec: EquipmentSpec, nodes: int, amfs: int = 0, loads: int = 1) -> Plan:
+    """Build a synthetic plan with approximately `nodes` nodes, including loads.
+
+    Plans grow by adding generators, each with the largest tree of up to
+    `MAX_GENERATOR_NODES` nodes (or `nodes`, if that's fewer) that fits.
+    """
+    equipment = Equipment(spec)
+    limit = min(nodes, MAX_GENERATOR_NODES)
+    sizes = {
+        (depth, fanout): 2 + equipment.tree_size(equipment.main, depth, fanout, loads)
+        for depth in range(1, 6)
+        for fanout in range(1, 11)
+    }
+    fitting = [shape for shape, size in sizes.items() if size <= limit]
+    depth, fanout = max(fitting, key=lambda shape: (sizes[shape], shape)) if fitting else (1, 1)
+    generators = max(1, amfs * 2, round(nodes / sizes[depth, fanout]))
+    return synthetic_plan(spec, generators, depth, fanout, amfs, loads)
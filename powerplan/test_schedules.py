@@ -35,7 +35,7 @@ def generate_schedule(plan: Plan):
 
             for c, c_data in b.outputs():
                 # Test each adjustable RCD
-                if "rcd" in c_data and c_data["rcd"] in ADJUSTABLE:
+                if c_data.rcd in ADJUSTABLE:
                     tests[grid.name][c.name] = {
                         "source": b,
                         "node": c,
@@ -1,11 +1,14 @@
 from __future__ import annotations
 
-from typing import TYPE_CHECKING
+from collections import defaultdict
+from collections.abc import Callable, Iterable
+from typing import TYPE_CHECKING, Any
 
-from .data import Distro, PowerSource
+from .data import Connection, Distro, PowerNode, PowerSource, VirtualNode
 
 if TYPE_CHECKING:
     from .plan import Plan
+    from .spec import EquipmentSpec
 
 
 class ValidationError:
@@ -19,99 +22,352 @@ class ValidationError:
     def __repr__(self):
         return str(self)
 
+    def __eq__(self, other):
+        if not isinstance(other, ValidationError):
+            return NotImplemented
+        return self.node is other.node and self.description == other.description
 
-def validate_node_uniqueness(plan: Plan):
-    nodes = sorted(plan.nodes(), key=lambda node: node.name or "")
-    duplicates = set()
-    for i in range(len(nodes) - 1):
-        if nodes[i].name == nodes[i + 1].name:
-            duplicates.add(nodes[i])
-            duplicates.add(nodes[i + 1])
+    def __hash__(self):
+        return hash((id(self.node), self.description))
 
-    return [ValidationError(node, "Duplicate node name") for node in duplicates]
 
+class NodeContext:
+    """A node being validated, with its connections.
+
+    Connections to virtual nodes (loads) aren't included.
+    """
+
+    __slots__ = ("node", "plan", "inputs", "outputs", "_spec")
+
+    def __init__(self, node: PowerNode, plan: Plan):
+        self.node = node
+        self.plan = plan
+        self.inputs: list[tuple[PowerNode, Connection]] = []
+        self.outputs: list[tuple[PowerNode, Connection]] = []
+        self._spec: dict | None = None
+
+    @property
+    def spec(self) -> dict | None:
+        "The node's spec, which is looked up once."
+        if self._spec is None:
+            self._spec = self.node.get_spec()
+        return self._spec
+
+
+class Rule:
+    """A validation rule.
+
+    `start` is called before a plan is validated, `check` for each node, and
+    `finish` once every node has been checked.
+
+    A `ValidationSession` only calls `finish` when it starts, and then calls
+    `touched` and `check` for nodes which have changed. Rules whose errors
+    for a node depend on other nodes must return them from `touched`.
+
+    Any state a rule needs while validating a plan is returned by `start`, and
+    passed to the other methods, so one rule can be used to validate several
+    plans (or run several sessions) at once.
+    """
+
+    def start(self, plan: Plan) -> Any:
+        return None
+
+    def check(self, ctx: NodeContext, state: Any) -> Iterable[ValidationError]:
+        return ()
+
+    def finish(self, state: Any) -> Iterable[ValidationError]:
+        return ()
+
+    def touched(self, node: PowerNode, present: bool, state: Any) -> Iterable[PowerNode]:
+        """Called when a node has changed, before it's checked again.
+
+        `present` is False if the node has been removed from the plan. Returns
+        any other nodes which need checking again as a result.
+        """
+        return ()
+
+
+class FunctionRule(Rule):
+    "A rule which calls a function for each node."
+
+    def __init__(self, func: Callable[[NodeContext], Iterable[ValidationError] | None]):
+        self.func = func
+
+    def check(self, ctx: NodeContext, state: Any) -> Iterable[ValidationError]:
+        return self.func(ctx) or ()
 
-def validate_basic(plan: Plan):
-    errors = []
-    for node in plan.nodes():
-        in_edges = list(node.inputs())
-        out_edges = list(node.outputs())
 
+class BasicRule(Rule):
+    "Check that sources and distros are connected the right way round."
+
+    def check(self, ctx: NodeContext, state: Any) -> Iterable[ValidationError]:
+        node = ctx.node
         if isinstance(node, PowerSource):
-            if len(out_edges) == 0:
-                errors.append(
-                    ValidationError(node, "Generator has no outgoing connections")
-                )
-            if len(in_edges) > 0:
-                errors.append(
-                    ValidationError(node, "Generator has incoming connections")
-                )
+            if len(ctx.outputs) == 0:
+                yield ValidationError(node, "Generator has no outgoing connections")
+            if len(ctx.inputs) > 0:
+                yield ValidationError(node, "Generator has incoming connections")
 
-        elif type(node) == Distro:
-            if len(in_edges) == 0:
-                errors.append(
-                    ValidationError(node, "Distro has no incoming connections")
-                )
+        elif type(node) is Distro:
+            if len(ctx.inputs) == 0:
+                yield ValidationError(node, "Distro has no incoming connections")
 
-    errors += validate_node_uniqueness(plan)
-    return errors
 
+class NameIndex:
+    "The nodes of a plan, indexed by name, for `UniqueNameRule`."
 
-def validate_spec(plan: Plan):
-    errors = []
+    def __init__(self):
+        self.nodes_by_name: defaultdict[str | None, set[PowerNode]] = defaultdict(set)
+        self.names: dict[PowerNode, str | None] = {}
+        self.indexed = False
+
+    def add(self, node: PowerNode) -> None:
+        self.names[node] = node.name
+        self.nodes_by_name[node.name].add(node)
+
+
+class UniqueNameRule(Rule):
+    """Check that no two nodes have the same name.
+
+    Nodes are indexed by name as they're checked, and duplicates are reported
+    by `finish`. After that, each node is checked against the index.
+    """
+
+    def start(self, plan: Plan) -> NameIndex:
+        return NameIndex()
+
+    def check(self, ctx: NodeContext, state: NameIndex) -> Iterable[ValidationError]:
+        if not state.indexed:
+            state.add(ctx.node)
+            return ()
+        if len(state.nodes_by_name[ctx.node.name]) > 1:
+            return [ValidationError(ctx.node, "Duplicate node name")]
+        return ()
 
-    for node in plan.nodes():
+    def finish(self, state: NameIndex) -> Iterable[ValidationError]:
+        state.indexed = True
+        return [
+            ValidationError(node, "Duplicate node name")
+            for node in state.names
+            if len(state.nodes_by_name[node.name]) > 1
+        ]
+
+    def touched(self, node: PowerNode, present: bool, state: NameIndex) -> Iterable[PowerNode]:
+        affected: set[PowerNode] = set()
+        if node in state.names:
+            nodes = state.nodes_by_name[state.names.pop(node)]
+            nodes.discard(node)
+            affected |= nodes
+        if present:
+            state.add(node)
+            affected |= state.nodes_by_name[node.name]
+        affected.discard(node)
+        return affected
+
+
+class SpecRule(Rule):
+    """Check that each node's type is in the spec, and that it has enough
+    suitable ports for its connections.
+    """
+
+    def start(self, plan: Plan) -> EquipmentSpec:
+        if plan.spec is None:
+            raise ValueError("Plan has no spec")
+        return plan.spec
+
+    def check(self, ctx: NodeContext, state: EquipmentSpec) -> Iterable[ValidationError]:
+        node = ctx.node
         if node.type is None:
-            errors.append(ValidationError(node, "Node has no type"))
-            continue
+            yield ValidationError(node, "Node has no type")
+            return
 
-        spec = node.get_spec()
+        spec = ctx.spec
         if spec is None:
-            errors.append(
-                ValidationError(node, "Spec not found for item: %s" % node.type)
-            )
-            continue
-
-        if len(list(node.outputs())) > len(spec.get("outputs", [])):
-            errors.append(ValidationError(node, "More outputs than available"))
-            continue
-
-        if len(list(node.inputs())) > len(spec.get("inputs", [])):
-            errors.append(
-                ValidationError(
-                    node, f"More inputs than available: {list(node.inputs())}"
-                )
-            )
-            continue
-
-        for _, attribs in node.outputs():
-            for item in spec["outputs"]:
-                if (
-                    item["phases"] == attribs["phases"]
-                    and item["current"] == attribs["current"]
-                ):
-                    break
-            else:
-                errors.append(
-                    ValidationError(
-                        node,
-                        f"No output for current: {attribs['current']}, phases: {attribs['phases']}",
-                    )
+            yield ValidationError(node, f"Spec not found for item: {node.type}")
+            return
+
+        if len(ctx.outputs) > len(spec.get("outputs", [])):
+            yield ValidationError(node, "More outputs than available")
+            return
+
+        if len(ctx.inputs) > len(spec.get("inputs", [])):
+            yield ValidationError(node, f"More inputs than available: {ctx.inputs}")
+            return
+
+        outputs = state.port_index(spec, "outputs")
+        for _, attribs in ctx.outputs:
+            if not outputs.keys(attribs.current, attribs.phases):
+                yield ValidationError(
+                    node, f"No output for current: {attribs.current}, phases: {attribs.phases}"
                 )
 
-        for _, attribs in node.inputs():
-            for item in spec["inputs"]:
-                if (
-                    item["phases"] == attribs["phases"]
-                    and item["current"] == attribs["current"]
-                ):
-                    break
-            else:
-                errors.append(
-                    ValidationError(
-                        node,
-                        f"No input for current: {attribs['current']}, phases: {attribs['phases']}",
-                    )
+        inputs = state.port_index(spec, "inputs")
+        for _, attribs in ctx.inputs:
+            if not inputs.keys(attribs.current, attribs.phases):
+                yield ValidationError(
+                    node, f"No input for current: {attribs.current}, phases: {attribs.phases}"
                 )
 
-    return errors
+
+class Validator:
+    """Validates a plan against a set of rules, in a single pass over its nodes and edges.
+
+    Additional rules can be registered with `add_rule`, either as a `Rule` or
+    as a function which is called with the `NodeContext` of each node and
+    returns any errors.
+
+    Errors are returned grouped by rule, in the order the rules were added.
+    """
+
+    def __init__(self, rules: Iterable[Rule] | None = None, spec: bool = True):
+        if rules is None:
+            rules = [BasicRule(), UniqueNameRule()]
+            if spec:
+                rules.append(SpecRule())
+        self.rules: list[Rule] = list(rules)
+
+    def add_rule(self, rule: Rule | Callable[[NodeContext], Iterable[ValidationError] | None]):
+        "Add a rule. This returns the rule, so it can be used as a decorator."
+        self.rules.append(rule if isinstance(rule, Rule) else FunctionRule(rule))
+        return rule
+
+    def contexts(self, plan: Plan) -> dict[PowerNode, NodeContext]:
+        "Build the context of every node in a plan, in one pass over its edges."
+        contexts = {node: NodeContext(node, plan) for node in plan.nodes()}
+        for u, v, data in plan.edges():
+            contexts[u].outputs.append((v, data))
+            contexts[v].inputs.append((u, data))
+        return contexts
+
+    def validate(self, plan: Plan) -> list[ValidationError]:
+        contexts = self.contexts(plan)
+        states = [rule.start(plan) for rule in self.rules]
+
+        errors: list[list[ValidationError]] = [[] for _ in self.rules]
+        for ctx in contexts.values():
+            for rule, state, rule_errors in zip(self.rules, states, errors, strict=True):
+                rule_errors.extend(rule.check(ctx, state))
+
+        for rule, state, rule_errors in zip(self.rules, states, errors, strict=True):
+            rule_errors.extend(rule.finish(state))
+        return [error for rule_errors in errors for error in rule_errors]
+
+
+class ValidationDelta:
+    "The errors which a `ValidationSession.update` has added and cleared."
+
+    def __init__(self, added: list[ValidationError], cleared: list[ValidationError]):
+        self.added = added
+        self.cleared = cleared
+
+    def __bool__(self) -> bool:
+        return bool(self.added or self.cleared)
+
+    def __repr__(self):
+        return f"<ValidationDelta added={self.added} cleared={self.cleared}>"
+
+
+class ValidationSession:
+    """Keeps the validation errors of a plan up to date as it's edited.
+
+    The whole plan is validated when the session starts. After that, the plan
+    notifies the session of each node touched by an edit, and `update` checks
+    only those nodes (and any others which rules say are affected), returning
+    the errors which were added and cleared. The plan's `valid` follows the
+    session's errors.
+
+    Renaming a node isn't detected automatically, so call `touch` with it.
+    """
+
+    def __init__(self, plan: Plan, validator: Validator | None = None):
+        self.plan = plan
+        self.validator = validator if validator is not None else Validator(spec=bool(plan.spec))
+        rules = self.validator.rules
+
+        # Errors for each rule, keyed by node
+        self._errors: list[dict[PowerNode, list[ValidationError]]] = [{} for _ in rules]
+        self._touched: set[PowerNode] = set()
+
+        # The state of each rule for this session
+        self._states = [rule.start(plan) for rule in rules]
+        for ctx in self.validator.contexts(plan).values():
+            for rule, state, errors in zip(rules, self._states, self._errors, strict=True):
+                self._store(errors, ctx.node, list(rule.check(ctx, state)))
+        for rule, state, errors in zip(rules, self._states, self._errors, strict=True):
+            for error in rule.finish(state):
+                errors.setdefault(error.node, []).append(error)
+        plan._validated = self.valid
+
+        plan.subscribe(self.touch)
+
+    def close(self) -> None:
+        "Stop tracking changes to the plan."
+        self.plan.unsubscribe(self.touch)
+
+    @staticmethod
+    def _store(errors: dict[PowerNode, list[ValidationError]], node: PowerNode, node_errors) -> None:
+        if node_errors:
+            errors[node] = node_errors
+        else:
+            errors.pop(node, None)
+
+    def touch(self, *nodes: PowerNode) -> None:
+        "Mark nodes as changed, so they're checked by the next `update`."
+        self._touched.update(nodes)
+
+    @property
+    def errors(self) -> list[ValidationError]:
+        "The current errors, grouped by rule."
+        return [error for errors in self._errors for node_errors in errors.values() for error in node_errors]
+
+    @property
+    def valid(self) -> bool:
+        return not any(self._errors)
+
+    def errors_for(self, node: PowerNode) -> list[ValidationError]:
+        "The current errors for a node."
+        return [error for errors in self._errors for error in errors.get(node, ())]
+
+    def update(self) -> ValidationDelta:
+        "Check the nodes which have changed since the last update."
+        touched, self._touched = self._touched, set()
+        graph = self.plan.graph
+        present = {
+            node: graph.has_node(node) and not isinstance(node, VirtualNode) for node in touched
+        }
+
+        affected = {node for node in touched if not isinstance(node, VirtualNode)}
+        for rule, state in zip(self.validator.rules, self._states, strict=True):
+            for node in touched:
+                affected.update(rule.touched(node, present[node], state))
+
+        added: list[ValidationError] = []
+        cleared: list[ValidationError] = []
+        for node in affected:
+            ctx = None
+            if present.get(node, True):
+                ctx = NodeContext(node, self.plan)
+                ctx.inputs = list(self.plan.inputs(node))
+                ctx.outputs = list(self.plan.outputs(node))
+
+            for rule, state, errors in zip(self.validator.rules, self._states, self._errors, strict=True):
+                old = errors.get(node, [])
+                new = list(rule.check(ctx, state)) if ctx is not None else []
+                self._store(errors, node, new)
+                added.extend(error for error in new if error not in old)
+                cleared.extend(error for error in old if error not in new)
+
+        self.plan._validated = self.valid
+        return ValidationDelta(added, cleared)
+
+
+def validate_node_uniqueness(plan: Plan):
+    return Validator([UniqueNameRule()]).validate(plan)
+
+
+def validate_basic(plan: Plan):
+    return Validator([BasicRule(), UniqueNameRule()]).validate(plan)
+
+
+def validate_spec(plan: Plan):
+    return Validator([SpecRule()]).validate(plan)
@@ -28,3 +28,38 @@ def test_amf(plan):
 
     dot = to_dot(plan)
     dot.create_pdf()
+
+
+def test_amf_grids_cached(plan):
+    gen_a = Generator(name="A", type="135kVA")
+    a1 = Distro(name="A1", type="SPEC-4")
+    plan.add_connection(gen_a, a1, 400, 3, length=10)
+
+    gen_b = Generator(name="B", type="135kVA")
+    b1 = Distro(name="B1", type="SPEC-4")
+    plan.add_connection(gen_b, b1, 400, 3, length=10)
+
+    amf = AMF(name="AMF-1", type="125AMF-EVENT")
+    plan.add_connection(a1, amf, 125, 3, length=10)
+    plan.add_connection(b1, amf, 125, 3, length=50)
+    plan.generate()
+    cable_lengths = plan.graph[b1][amf]["cable_lengths"]
+
+    grids = plan.grids()
+    assert plan.grids() is grids
+    assert [grid.name for grid in grids] == ["A", "AMF-1", "B"]
+    plan.invalidate()
+    assert plan.grids() is not grids
+
+    # Splitting the grids doesn't change the plan's own connections
+    assert plan.graph[b1][amf]["cable_lengths"] == cable_lengths
+    assert not plan.graph[b1][amf]["logical"]
+
+    # The grid on each side of the AMF shares the plan's record for the cable to it
+    grid_b = grids[2]
+    (sink,) = [v for _, v in grid_b.graph.out_edges(b1)]
+    assert grid_b.graph[b1][sink] is plan.graph[b1][amf]
+
+    ab1 = Distro(name="AB1", type="EPS/63-3")
+    plan.add_connection(amf, ab1, 63, 3, length=25)
+    assert plan.grids() is not grids
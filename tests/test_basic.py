@@ -1,4 +1,9 @@
+from math import isclose
+
 from powerplan import Distro, Generator, Plan
+from powerplan.data import Connection
+from powerplan.spec import CableLengthTable
+from powerplan.validator import ValidationError, ValidationSession, Validator
 
 
 def test_create_graph():
@@ -43,6 +48,58 @@ def test_spec(spec, plan):
     assert len(plan.validate()) == 2
 
 
+def test_valid_after_fixing_errors(plan):
+    gen = Generator(name="A", type="135kVA")
+    a1 = Distro(name="A1", type="SPEC-7")
+    plan.add_connection(gen, a1, 400, 3)
+    a2 = Distro(name="A1", type="EPS/63-3")
+    plan.add_connection(a1, a2, 63, 3)
+    assert len(plan.validate()) == 2
+    assert not plan.valid
+
+    a2.name = "A2"
+    assert len(plan.validate()) == 0
+    assert plan.valid
+
+    # The plan follows an open validation session
+    session = ValidationSession(plan)
+    a2.name = "A1"
+    session.touch(a2)
+    session.update()
+    assert not plan.valid
+    a2.name = "A2"
+    session.touch(a2)
+    session.update()
+    assert plan.valid
+    session.close()
+
+
+def test_custom_validation_rule(plan):
+    gen = Generator(name="A", type="135kVA")
+    dist = Distro(name="A1", type="SPEC-7")
+    plan.add_connection(gen, dist, 400, 3)
+    plan.add_connection(dist, Distro(name="A1", type="EPS/32"), 32, 3)
+
+    validator = Validator()
+
+    @validator.add_rule
+    def named_after_source(ctx):
+        if not isinstance(ctx.node, Generator) and not ctx.node.name.startswith(ctx.node.source().name):
+            yield ValidationError(ctx.node, "Not named after its source")
+
+    errors = [error.description for error in plan.validate(validator)]
+    assert errors == [
+        "Duplicate node name",
+        "Duplicate node name",
+        "No output for current: 32, phases: 3",
+    ]
+    assert not plan.valid
+
+    plan.add_connection(gen, Distro(name="B1", type="SPEC-7"), 400, 3)
+    errors = [error.description for error in plan.validate(validator)]
+    assert "Not named after its source" in errors
+
+
 def test_port_assignment(plan):
     gen = Generator(name="A", type="135kVA")
     a1 = Distro(name="A1", type="SPEC-7")
@@ -70,6 +127,50 @@ def test_port_assignment(plan):
     assert a4.source() == gen
 
 
+def test_port_assignment_matching(spec, plan):
+    spec.import_equipment(
+        {
+            "type": "distro",
+            "ref": "MIXED",
+            "inputs": [{"type": "powerlock", "current": "400A", "phases": 3}],
+            "outputs": [
+                {"type": "ceeform-16-1", "current": "16A"},
+                {"type": "bs1363", "current": "16A"},
+            ],
+        },
+        "test",
+    )
+    spec.import_equipment(
+        {
+            "type": "distro",
+            "ref": "EITHER",
+            "inputs": [
+                {"type": "ceeform-16-1", "current": "16A"},
+                {"type": "bs1363", "current": "16A"},
+            ],
+        },
+        "test",
+    )
+    spec.import_equipment(
+        {"type": "distro", "ref": "CEEFORM", "inputs": [{"type": "ceeform-16-1", "current": "16A"}]},
+        "test",
+    )
+
+    a = Distro(name="A", type="MIXED")
+    b1 = Distro(name="B1", type="EITHER")
+    b2 = Distro(name="B2", type="CEEFORM")
+    plan.add_connection(a, b1, 16, 1)
+    plan.add_connection(a, b2, 16, 1)
+
+    # Assigning B1 to the first matching output would leave nothing for B2
+    plan.assign_ports()
+    assert plan.valid
+    assert plan.graph[a][b1]["connector"] == "bs1363"
+    assert plan.graph[a][b1]["in_port"] == 1
+    assert plan.graph[a][b2]["connector"] == "ceeform-16-1"
+    assert a.outputs_allocated == {0, 1}
+
+
 def test_subgraph(plan):
     a = Generator(name="A", type="135kVA")
     a1 = Distro(name="A1", type="SPEC-7")
@@ -123,3 +224,93 @@ def test_duplicate_node_name(plan):
     plan.add_connection(a1, a2, 63, 3)
 
     assert len(plan.validate()) == 2
+
+
+def test_cable_length_table_matches_search(spec):
+    stock = [5, 10, 20, 50]
+    table = spec.cable_tables[("IEC 60309", 63, 3)]
+    for length in [0, 1, 5, 12.5, 34, 41, 62, 99.9, 180, 250]:
+        assert table.lookup(length) == spec.find_cable_combinations(stock, length)[0][2]
+
+
+def test_cable_length_table_ties(spec):
+    # (25,) and (4, 4, 4, 4) have the same exact score for these lengths, but the
+    # search's floating point scores break the tie differently for each one
+    cases = [([4, 25], 12.925338651204557), ([6, 15], 6.252343170114874), ([2, 5, 10], 5.979634759402047)]
+    for stock, length in cases:
+        table = CableLengthTable(stock)
+        assert table.lookup(length) == spec.find_cable_combinations(stock, length)[0][2]
+    # Equal scores for an integer length are broken in enumeration order
+    table = CableLengthTable([4, 25])
+    assert table.lookup(13) == spec.find_cable_combinations([4, 25], 13)[0][2] == (25,)
+
+
+def test_upstream_values(plan):
+    gen = Generator(name="A", type="135kVA")
+    a1 = Distro(name="A1", type="SPEC-7")
+    plan.add_connection(gen, a1, 400, 3, length=10)
+
+    a3 = Distro(name="A3", type="EPS/63-3")
+    plan.add_connection(a1, a3, 63, 3, length=54)
+
+    a4 = Distro(name="A4", type="TOB-32")
+    plan.add_connection(a3, a4, 32, 1, length=25)
+    plan.generate()
+
+    path = [(gen, a1), (a1, a3), (a3, a4)]
+    total_length = sum(sum(plan.graph[u][v]["cable_lengths"]) for u, v in path)
+    assert a4.cable_length_from_source().magnitude == total_length
+    assert a4.source() == gen
+    cables = [plan.graph[u][v] for u, v in path]
+    z = sum((c.resistance + 1j * c.reactance) * sum(c.cable_lengths) for c in cables)
+    assert isclose(a4.z_s().magnitude, abs(1j * gen.z_e().magnitude + z))
+    assert a4.v_drop().magnitude == a3.v_drop().magnitude + plan.graph[a3][a4]["voltage_drop"]
+
+
+def test_connection_record(plan):
+    gen = Generator(name="A", type="135kVA")
+    a1 = Distro(name="A1", type="SPEC-7")
+    plan.add_connection(gen, a1, 400, 3, length=10)
+    data = plan.graph[gen][a1]
+
+    assert isinstance(data, Connection)
+    assert not hasattr(gen, "__dict__")
+    assert data.current == data["current"] == 400
+    assert "csa" not in data
+    assert data.get("csa", 0) == 0
+    assert dict(data) == {"current": 400, "phases": 3, "length": 10, "logical": False, "extra_length": 0.0}
+
+    data["note"] = "Under the stage"
+    plan.generate()
+    assert data.csa == data["csa"]
+    assert data["note"] == "Under the stage"
+
+    grid = plan.grids()[0]
+    copied = grid.graph[gen][a1]
+    assert isinstance(copied, Connection)
+    assert dict(copied) == dict(data)
+
+
+def test_generate_stats(plan):
+    gen = Generator(name="A", type="135kVA")
+    a1 = Distro(name="A1", type="SPEC-7")
+    plan.add_connection(gen, a1, 400, 3, length=10)
+    a2 = Distro(name="A2", type="EPS/63-3")
+    plan.add_connection(a1, a2, 63, 3, length=27)
+
+    reported = []
+    plan.stats_callback = lambda plan, stats: reported.append(stats)
+    plan.generate()
+
+    stats = plan.stats
+    assert reported == [stats]
+    assert set(stats.timings) == {"generate", "assign_ports", "assign_cables", "calculate_voltage_drop"}
+    assert stats.calls["select_cable"] == 2
+    assert stats.calls["get_cable_rating"] == 2
+    assert stats.hit_rate("cable_table") == 1.0
+    assert stats.as_dict()["caches"]["solver"] == {"hits": 0, "misses": 1, "hit_rate": 0.0}
+
+    # Nothing has changed, so no cables are selected
+    plan.generate()
+    assert plan.stats.calls["select_cable"] == 0
+    assert len(reported) == 2
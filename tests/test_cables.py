@@ -1,4 +1,4 @@
-from powerplan.cables import CableConfiguration, get_cable_ratings, select_cable_size
+from powerplan.cables import CableConfiguration, get_cable_rating, get_cable_ratings, select_cable_size
 
 
 def test_select_cable():
@@ -9,3 +9,17 @@ def test_select_cable():
 
 def test_get_ratings():
     assert get_cable_ratings(16, "4F1A", CableConfiguration.MULTI_CORE) == {"rating": 63, "voltage_drop": 2.5}
+
+
+def test_get_rating():
+    rating = get_cable_rating(25, "4F1A", CableConfiguration.MULTI_CORE)
+    assert rating is not None
+    assert rating.rating == 83
+    assert (rating.r, rating.x, rating.z) == (1.55, 0.150, 1.55)
+
+    rating = get_cable_rating(16, "4F1A", CableConfiguration.MULTI_CORE)
+    assert rating is not None
+    assert (rating.r, rating.x, rating.z) == (2.5, 0.0, 2.5)
+
+    assert get_cable_rating(35, "4F1A", CableConfiguration.TWO_CORE) is None
+    assert select_cable_size(1000, "4F1A", CableConfiguration.TWO_SINGLE) is None
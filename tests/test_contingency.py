@@ -0,0 +1,107 @@
+from collections import defaultdict
+
+from powerplan import contingency
+from powerplan.data import AMF, Distro, Generator, Load
+
+
+def build(plan):
+    gen_a = Generator(name="A", type="135kVA")
+    a1 = Distro(name="A1", type="SPEC-4")
+    plan.add_connection(gen_a, a1, 400, 3, length=10)
+
+    gen_b = Generator(name="B", type="135kVA")
+    b1 = Distro(name="B1", type="SPEC-4")
+    plan.add_connection(gen_b, b1, 400, 3, length=10)
+
+    amf = AMF(name="AMF-1", type="125AMF-EVENT")
+    plan.add_connection(a1, amf, 125, 3, length=10)
+    plan.add_connection(b1, amf, 125, 3, length=50)
+
+    ab1 = Distro(name="AB1", type="EPS/63-3")
+    plan.add_connection(amf, ab1, 63, 3, length=25)
+    plan.add_connection(ab1, Load(name="AB1 Load", load=60000))
+    plan.generate()
+    return a1, b1, amf, ab1
+
+
+def test_amf_contingencies(plan):
+    a1, b1, amf, ab1 = build(plan)
+
+    violations = plan.contingencies(processes=1)
+    assert plan.contingencies(processes=2) == violations
+
+    by_scenario = defaultdict(set)
+    for violation in violations:
+        by_scenario[violation.scenario].add((violation.node.name, violation.kind))
+
+    # The AMF switches over to the surviving generator
+    assert by_scenario["generator A"] == {("A1", "unsupplied")}
+    assert by_scenario["amf_input B1 -> AMF-1"] == set()
+    assert ("AB1", "unsupplied") in by_scenario["cable AMF-1 -> AB1"]
+
+    # 60kW overloads the supply to AB1 and both of the AMF's inputs in every scenario,
+    # so they're only reported once
+    overloads = [v for v in violations if v.kind == "overload"]
+    assert {(v.scenario, v.node, v.upstream, v.limit) for v in overloads} == {
+        ("none", ab1, amf, 63),
+        ("none", amf, a1, 125),
+        ("none", amf, b1, 125),
+    }
+
+    # The current is the same as a normal solve reports for each cable
+    solver = plan.solver()
+    current = plan.solve().current
+    for v in overloads:
+        assert v.value == current[solver.edge_index[v.upstream, v.node]]
+
+
+def test_contingency_generator_apparent_power(plan):
+    gen = Generator(name="A", type="135kVA")
+    a1 = Distro(name="A1", type="SPEC-7")
+    plan.add_connection(gen, a1, 400, 3, length=10)
+    plan.add_connection(a1, Load(name="A1 Load", load=120000))
+    plan.generate()
+    assert not [v for v in plan.contingencies(processes=1) if v.node is gen]
+
+    # 120kW at a power factor of 0.8 is 150kVA
+    plan.power_factor = 0.8
+    (overload,) = [v for v in plan.contingencies(processes=1) if v.node is gen]
+    assert overload.kind == "overload"
+    assert round(overload.value) == 150000
+    assert overload.limit == 135000
+
+
+def test_contingency_worse_violations(plan, monkeypatch):
+    gen = Generator(name="A", type="135kVA")
+    a1 = Distro(name="A1", type="SPEC-7")
+    plan.add_connection(gen, a1, 400, 3, length=10)
+    plan.generate()
+    i = plan.solver().index[a1]
+
+    def evaluate(solver, limits, outage):
+        if outage is None:
+            return [(i, None, "voltage_drop", 0.06, 0.05)]
+        # Failing the cable makes the voltage drop worse, and failing the generator doesn't change it
+        return [(i, None, "voltage_drop", 0.08 if outage.kind == "cable" else 0.06, 0.05)]
+
+    monkeypatch.setattr(contingency, "evaluate", evaluate)
+    violations = plan.contingencies(processes=1)
+    assert [(v.scenario, v.value) for v in violations] == [("none", 0.06), ("cable A -> A1", 0.08)]
+
+
+def test_contingency_amf_inputs(plan, monkeypatch):
+    a1, b1, amf, ab1 = build(plan)
+    solver = plan.solver()
+    i = solver.index[amf]
+    edge_a, edge_b = solver.edge_index[a1, amf], solver.edge_index[b1, amf]
+
+    def evaluate(solver, limits, outage):
+        if outage is None:
+            return [(i, edge_a, "overload", 130.0, 125.0), (i, edge_b, "overload", 140.0, 125.0)]
+        # An outage which makes the overload on A1's input worse, but no worse than on B1's
+        return [(i, edge_a, "overload", 135.0, 125.0), (i, edge_b, "overload", 140.0, 125.0)]
+
+    monkeypatch.setattr(contingency, "evaluate", evaluate)
+    worse = [v for v in plan.contingencies(processes=1) if v.scenario != "none"]
+    assert worse
+    assert {(v.upstream, v.value) for v in worse} == {(a1, 135.0)}
@@ -1,6 +1,17 @@
+import hashlib
+import io
+
 from powerplan import Plan
 from powerplan.data import Distro, Generator, Load
-from powerplan.diagram import to_dot
+from powerplan.diagram import (
+    _pdf_objects,
+    assemble_pdf,
+    assemble_svg,
+    grid_sources,
+    render_grids,
+    to_dot,
+    write_dot,
+)
 
 
 def test_create_graph(spec):
@@ -51,3 +62,115 @@ def test_graph_incomplete_spec(spec):
     dot = to_dot(plan)
     dot.to_string()
     dot.create_pdf()
+
+
+def test_write_dot(spec):
+    plan = Plan(name="Test", spec=spec)
+
+    gen = Generator(name="A", type="135kVA")
+    a1 = Distro(name="A1", type="SPEC-7")
+    plan.add_connection(gen, a1, 400, 3, length=10)
+
+    a3 = Distro(name="A3", type="EPS/63-3")
+    plan.add_connection(a1, a3, 63, 3, length=20)
+
+    a4 = Distro(name="A 4", type="TOB-32")
+    plan.add_connection(a3, a4, 32, 1)
+    plan.add_connection(a4, Load(name="A4 Load", load=1000))
+    plan.generate()
+
+    out = io.StringIO()
+    write_dot(plan, out)
+    source = out.getvalue()
+
+    assert source.startswith('strict digraph "Test" {')
+    assert 'subgraph "cluster_a" {' in source
+    assert '"A3" -> "A 4" [label=<32A' in source
+    assert 'tailport="32-1", headport="input", color="blue4"];' in source
+    assert "A4 Load" not in source
+    # Labels show the values calculated for each node
+    assert f'<td align="left">{a3.z_s():.4~H}</td>' in source
+    assert f'<td align="left">{a3.i_pf():.5~H} ' in source
+    assert '<td align="left">1.0 kW</td>' in source
+
+    # The same node labels as to_dot
+    dot = to_dot(plan)
+    for node in dot.get_subgraphs()[0].get_nodes():
+        assert f"{node.get_label()}];" in source
+
+
+def test_render_grids_cached(spec, tmp_path):
+    plan = Plan(name="Test", spec=spec)
+    gen_a = Generator(name="A", type="135kVA")
+    a1 = Distro(name="A1", type="SPEC-7")
+    plan.add_connection(gen_a, a1, 400, 3)
+    gen_b = Generator(name="B", type="135kVA")
+    b1 = Distro(name="B1", type="SPEC-7")
+    plan.add_connection(gen_b, b1, 400, 3)
+    plan.generate()
+
+    sources = grid_sources(plan)
+    assert [name for name, _ in sources] == ["A", "B"]
+    assert sources == grid_sources(plan)
+
+    # Seed the cache, so graphviz isn't needed
+    for i, (_, source) in enumerate(sources):
+        digest = hashlib.sha256(f"dot\0svg\0{source}".encode()).hexdigest()
+        (tmp_path / f"{digest}.svg").write_text(
+            f'<?xml version="1.0"?>\n<svg width="{100 + i}pt" height="50pt"><g id="grid{i}"/></svg>\n'
+        )
+
+    rendered = render_grids(plan, cache_dir=str(tmp_path))
+    assert [name for name, _ in rendered] == ["A", "B"]
+    assert b'id="grid1"' in rendered[1][1]
+
+    svg = assemble_svg(rendered)
+    assert '<svg width="101.0pt" height="100.0pt"' in svg
+    assert '<svg x="0" y="50.0pt" width="101pt"' in svg
+
+
+def _pdf(text):
+    "A single-page PDF, with the length of its content stream in a separate object."
+    content = f"BT /F1 12 Tf 10 10 Td ({text}) Tj ET".encode()
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 /MediaBox [0 0 100 50] >>",
+        b"<< /Type /Page /Parent 2 0 R /Contents 4 0 R >>",
+        b"<< /Length 5 0 R >>\nstream\n" + content + b"\nendstream",
+        str(len(content)).encode(),
+    ]
+    out = b"%PDF-1.5\n"
+    offsets = []
+    for i, body in enumerate(objects):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % (i + 1) + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 6\n0000000000 65535 f \n" + b"".join(b"%010d 00000 n \n" % o for o in offsets)
+    return out + b"trailer\n<< /Size 6 /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % xref
+
+
+def test_assemble_pdf(spec, tmp_path):
+    plan = Plan(name="Test", spec=spec)
+    plan.add_connection(Generator(name="A", type="135kVA"), Distro(name="A1", type="SPEC-7"), 400, 3)
+    plan.add_connection(Generator(name="B", type="135kVA"), Distro(name="B1", type="SPEC-7"), 400, 3)
+    plan.generate()
+
+    # Seed the cache, so graphviz isn't needed
+    for name, source in grid_sources(plan):
+        digest = hashlib.sha256(f"dot\0pdf\0{source}".encode()).hexdigest()
+        (tmp_path / f"{digest}.pdf").write_bytes(_pdf(f"Grid {name}"))
+
+    rendered = render_grids(plan, format="pdf", cache_dir=str(tmp_path))
+    objects, root = _pdf_objects(assemble_pdf(rendered))
+    assert objects[root][0] == b"<< /Type /Catalog /Pages 2 0 R >>"
+    assert objects[2][0] == b"<< /Type /Pages /Kids [3 0 R 7 0 R] /Count 2 >>"
+    assert objects[3][0].startswith(b"<< /Parent 2 0 R /Type /Pages /Kids [4 0 R] /Count 1")
+
+    # Each grid's page, with its content stream and length renumbered
+    for page, text in [(4, b"Grid A"), (8, b"Grid B")]:
+        assert objects[page][0] == b"<< /Type /Page /Parent %d 0 R /Contents %d 0 R >>" % (page - 1, page + 1)
+        head, data = objects[page + 1]
+        assert head.startswith(b"<< /Length %d 0 R >>" % (page + 2))
+        assert text in data
+        assert int(objects[page + 2][0]) == len(data) - len(b"\nendstream")
+
@@ -0,0 +1,208 @@
+import pytest
+
+from powerplan import Plan
+from powerplan.data import AMF, Distro, Generator, Load
+from powerplan.plan import PlanGraph
+from powerplan.validator import ValidationSession, Validator
+
+
+def build(plan):
+    gen = Generator(name="A", type="135kVA")
+    a1 = Distro(name="A1", type="SPEC-7")
+    plan.add_connection(gen, a1, 400, 3, length=10)
+
+    a2 = Distro(name="A2", type="EPS/63-4")
+    plan.add_connection(a1, a2, 63, 3, length=52)
+
+    a3 = Distro(name="A3", type="EPS/63-3")
+    plan.add_connection(a1, a3, 63, 3, length=54)
+
+    a4 = Distro(name="A4", type="TOB-32")
+    plan.add_connection(a3, a4, 32, 1, length=25)
+
+    load = Load(name="A4 Load", load=1000)
+    plan.add_connection(a4, load)
+    return gen, a1, a2, a3, a4, load
+
+
+def test_regenerate(plan):
+    gen, a1, a2, a3, a4, load = build(plan)
+    plan.generate()
+    assert len(plan.dirty) == 0
+    ports = {(u, v): (data["out_port"], data["in_port"]) for u, v, data in plan.edges()}
+
+    # Generating again without changes doesn't allocate any more ports
+    plan.generate()
+    assert {(u, v): (data["out_port"], data["in_port"]) for u, v, data in plan.edges()} == ports
+    assert a1.outputs_allocated == {0, 1}
+
+
+def test_modify_connection(plan):
+    gen, a1, a2, a3, a4, load = build(plan)
+    plan.generate()
+    v_drop = a4.v_drop()
+
+    plan.add_connection(a1, a3, 63, 3, length=100)
+    assert plan.dirty == {(a1, a3)}
+    assert "cable_lengths" not in plan.graph[a1][a3]
+
+    plan.generate()
+    assert len(plan.dirty) == 0
+    assert plan.graph[a1][a3]["out_port"] == 1
+    assert sum(plan.graph[a1][a3]["cable_lengths"]) >= 100
+    assert a4.v_drop() > v_drop
+
+
+def test_change_type_and_load(plan):
+    gen, a1, a2, a3, a4, load = build(plan)
+    plan.generate()
+
+    a4.type = "SSB-1"
+    assert plan.dirty == {(a3, a4)}
+    plan.generate()
+    assert plan.graph[a3][a4]["in_port"] == 0
+    assert a4.inputs_allocated == {0}
+
+    load.load_value = "3kW"
+    assert gen.load().to("W").magnitude == 3000
+    plan.generate()
+    assert a4.v_drop().magnitude == a3.v_drop().magnitude + plan.graph[a3][a4]["voltage_drop"]
+
+
+def test_remove_connection(plan):
+    gen, a1, a2, a3, a4, load = build(plan)
+    plan.generate()
+
+    plan.remove_connection(a1, a2)
+    assert a1.outputs_allocated == {1}
+    assert a2.inputs_allocated == set()
+    assert not plan.graph.has_edge(a1, a2)
+
+
+def test_update_connection(plan):
+    gen, a1, a2, a3, a4, load = build(plan)
+    plan.generate()
+    ports = (plan.graph[a1][a3]["out_port"], plan.graph[a1][a3]["in_port"])
+
+    # Changing the length keeps the ports and reassigns the cable immediately
+    plan.update_connection(a1, a3, length=100)
+    assert len(plan.dirty) == 0
+    assert (plan.graph[a1][a3]["out_port"], plan.graph[a1][a3]["in_port"]) == ports
+    assert sum(plan.graph[a1][a3]["cable_lengths"]) >= 100
+    assert plan.graph[a1][a3]["current"] == 63
+
+    # A current which the downstream distro can't take releases the ports
+    out_port = plan.graph[a3][a4]["out_port"]
+    plan.update_connection(a3, a4, current=16)
+    assert plan.dirty == {(a3, a4)}
+    assert "out_port" not in plan.graph[a3][a4]
+    assert a3.outputs_allocated == set()
+
+    # Changing it back reuses the previous ports
+    plan.update_connection(a3, a4, current=32)
+    assert len(plan.dirty) == 0
+    assert plan.graph[a3][a4]["out_port"] == out_port
+
+
+def test_replace_node_type(plan):
+    gen, a1, a2, a3, a4, load = build(plan)
+    plan.generate()
+    out_port = plan.graph[a3][a4]["out_port"]
+
+    plan.replace_node_type(a4, "SSB-1")
+    assert len(plan.dirty) == 0
+    assert plan.graph[a3][a4]["out_port"] == out_port
+    assert plan.graph[a3][a4]["in_port"] == 0
+
+    with pytest.raises(ValueError):
+        plan.replace_node_type(a4, "Nonexistent")
+    assert a4.type == "SSB-1"
+
+
+def test_replace_amf_type(plan):
+    gen, a1, a2, a3, a4, load = build(plan)
+    amf = AMF(name="AMF", type="125AMF-EVENT")
+    plan.add_connection(a1, amf, 125, 3, length=10)
+
+    with pytest.raises(ValueError):
+        plan.replace_node_type(amf, "Nonexistent")
+    assert amf.type == "125AMF-EVENT"
+
+
+def test_validation_session(plan):
+    gen, a1, a2, a3, a4, load = build(plan)
+    validator = Validator()
+    checked = []
+    validator.add_rule(lambda ctx: checked.append(ctx.node))
+    session = ValidationSession(plan, validator)
+    assert session.valid
+    checked.clear()
+
+    # A distro with a duplicate name, on an output which the upstream distro doesn't have
+    dup = Distro(name="A2", type="EPS/32")
+    plan.add_connection(a1, dup, 32, 3)
+    delta = session.update()
+    assert sorted(str(e) for e in delta.added) == sorted(
+        [
+            f"[{a1} SPEC-7] No output for current: 32, phases: 3",
+            f"[{a2} EPS/63-4] Duplicate node name",
+            f"[{dup} EPS/32] Duplicate node name",
+        ]
+    )
+    assert delta.cleared == []
+    assert set(checked) == {a1, a2, dup}
+    assert not session.valid
+
+    dup.name = "A5"
+    session.touch(dup)
+    delta = session.update()
+    assert delta.added == []
+    assert {e.node for e in delta.cleared} == {a2, dup}
+    assert session.errors == session.errors_for(a1)
+
+    plan.remove_connection(a1, dup)
+    delta = session.update()
+    assert [e.description for e in delta.cleared] == ["No output for current: 32, phases: 3"]
+    assert [e.description for e in delta.added] == ["Distro has no incoming connections"]
+    assert session.errors == delta.added
+
+    # Nothing has changed
+    assert not session.update()
+    session.close()
+
+
+def test_generate_from_graph(plan, spec):
+    gen, a1, a2, a3, a4, load = build(plan)
+    graph = PlanGraph()
+    for u, v, data in plan.graph.edges(data=True):
+        graph.add_edge(u, v, **data)
+
+    copy = Plan(spec=spec, graph=graph)
+    assert len(copy.dirty) == 4
+    copy.generate()
+    assert len(copy.dirty) == 0
+    for _, _, data in copy.edges():
+        assert data.csa is not None
+        assert data.cable_lengths
+
+    # The copy's nodes report their edits to it
+    assert a4.plan is copy
+    assert a4.load().to("W").magnitude == 1000
+    load.load_value = 2000
+    assert a4.load().to("W").magnitude == 2000
+    a4.type = "SSB-1"
+    assert (a3, a4) in copy.dirty
+
+
+def test_validation_session_shared_validator(plan, spec):
+    gen, a1, a2, a3, a4, load = build(plan)
+    validator = Validator()
+    session = ValidationSession(plan, validator)
+    # Validating another plan with the same validator doesn't affect the session
+    validator.validate(Plan(spec=spec))
+
+    dup = Distro(name="A2", type="EPS/63-4")
+    plan.add_connection(a1, dup, 63, 3)
+    delta = session.update()
+    assert {e.node for e in delta.added if e.description == "Duplicate node name"} == {a2, dup}
+    session.close()
@@ -0,0 +1,76 @@
+from powerplan.bom import generate_bom
+from powerplan.data import AMF, Distro, Generator, Load
+from powerplan.frozen import KINDS
+from powerplan.validator import validate_basic, validate_spec
+
+
+def build(plan):
+    gen_a = Generator(name="A", type="135kVA")
+    a1 = Distro(name="A1", type="SPEC-4")
+    plan.add_connection(gen_a, a1, 400, 3, length=10)
+
+    gen_b = Generator(name="B", type="135kVA")
+    b1 = Distro(name="B1", type="SPEC-4")
+    plan.add_connection(gen_b, b1, 400, 3, length=10)
+
+    amf = AMF(name="AMF-1", type="125AMF-EVENT")
+    plan.add_connection(a1, amf, 125, 3, length=10)
+    plan.add_connection(b1, amf, 125, 3, length=50)
+
+    ab1 = Distro(name="AB1", type="EPS/63-3")
+    plan.add_connection(amf, ab1, 63, 3, length=25)
+    plan.add_connection(ab1, Load(name="AB1 Load", load="10kW"))
+    plan.generate()
+    return gen_a, a1, amf, ab1
+
+
+def test_frozen_plan(plan):
+    gen_a, a1, amf, ab1 = build(plan)
+    frozen = plan.freeze()
+
+    assert set(frozen.nodes()) == set(plan.nodes())
+    assert set(frozen.nodes(True)) == set(plan.nodes(True))
+    assert {(u, v) for u, v, _ in frozen.edges()} == {(u, v) for u, v, _ in plan.edges()}
+    assert frozen.num_generators() == 2
+    assert frozen.num_distros() == 3
+
+    for node in plan.nodes(True):
+        assert frozen.inputs(node, True) == list(node.inputs(True))
+        assert frozen.outputs(node) == list(node.outputs())
+
+    i = frozen.index[ab1]
+    assert frozen.node_list[frozen.parent[i]] is amf
+    assert frozen.parent[frozen.index[amf]] == -1
+    assert KINDS[frozen.kind[frozen.index[amf]]] is AMF
+    assert frozen.types[frozen.type_code[i]] == "EPS/63-3"
+
+    # Consumers of plans accept a frozen plan
+    assert [str(e) for e in validate_basic(frozen)] == [str(e) for e in validate_basic(plan)]
+    assert [str(e) for e in validate_spec(frozen)] == [str(e) for e in validate_spec(plan)]
+    assert [grid.name for grid in frozen.grids()] == [grid.name for grid in plan.grids()]
+
+    # The plan's connections are captured when it's frozen
+    before = {(u, v): dict(data) for u, v, data in frozen.edges(True)}
+    grid_data = frozen.grids()[1].inputs(ab1)[0][1]
+    assert grid_data is frozen.inputs(ab1)[0][1]
+    plan.update_connection(amf, ab1, length=40)
+    plan.update_connection(a1, amf, current=63)
+    assert {(u, v): dict(data) for u, v, data in frozen.edges(True)} == before
+    assert grid_data.length == 25
+    assert frozen.inputs(amf)[0][1].current == 125
+
+    # Grids are captured when the plan is frozen
+    plan.remove_connection(amf, ab1)
+    assert [len(grid) for grid in frozen.grids()] == [3, 5, 3]
+    assert ab1 in frozen.grids()[1].index
+
+
+def test_frozen_bom(plan):
+    gen = Generator(name="A", type="135kVA")
+    a1 = Distro(name="A1", type="SPEC-7")
+    plan.add_connection(gen, a1, 400, 3, length=10)
+    a2 = Distro(name="A2", type="EPS/63-4")
+    plan.add_connection(a1, a2, 63, 3, length=52)
+    plan.generate()
+
+    assert generate_bom(plan.freeze()) == generate_bom(plan)
@@ -0,0 +1,79 @@
+import pytest
+
+from powerplan.data import Distro, Generator, Load
+from powerplan.phases import port_phase
+
+
+def test_phase_loads(plan):
+    gen = Generator(name="A", type="135kVA")
+    a1 = Distro(name="A1", type="SPEC-4")
+    plan.add_connection(gen, a1, 400, 3, length=10)
+    a2 = Distro(name="A2", type="EPS/63-3")
+    plan.add_connection(a1, a2, 63, 3, length=25)
+    loads = {
+        name: Load(name=name, load=load)
+        for name, load in [("A", 3000), ("B", 2000), ("C", 2000), ("D", 1000)]
+    }
+    for load in loads.values():
+        plan.add_connection(a2, load)
+    plan.add_connection(a1, Load(name="Balanced", load=1500), phases=3)
+    plan.generate()
+
+    # Single-phase outputs are assigned to each phase in turn
+    assert [plan.graph[a2][load].phase for load in loads.values()] == [1, 2, 3, 1]
+    assert plan.graph[a1][a2].phase is None
+    phase_loads = plan.phase_loads()
+    assert phase_loads.value(a2) == (4000, 2000, 2000)
+    assert phase_loads.value(gen) == (4500, 2500, 2500)
+    assert phase_loads.node_imbalance(a2) == pytest.approx(0.5)
+
+    assert plan.balance_phases() == 1
+    assert plan.graph[a2][loads["D"]].phase == 2
+    phase_loads = plan.phase_loads()
+    assert phase_loads.value(a2) == (3000, 3000, 2000)
+    assert phase_loads.value(gen) == (3500, 3500, 2500)
+    assert plan.balance_phases() == 0
+
+
+def test_single_phase_distros(plan):
+    gen = Generator(name="A", type="135kVA")
+    a1 = Distro(name="A1", type="SPEC-4")
+    plan.add_connection(gen, a1, 400, 3, length=10)
+    a2 = Distro(name="A2", type="EPS/63-3")
+    plan.add_connection(a1, a2, 63, 3, length=25)
+
+    # A single-phase distro feeding another single-phase distro
+    b = Distro(name="B", type="SSB-2")
+    plan.add_connection(a2, b, 32, 1, length=10)
+    c = Distro(name="C", type="SSB-1")
+    plan.add_connection(b, c, 32, 1, length=10)
+    plan.add_connection(b, Load(name="B1", load=500))
+    plan.add_connection(c, Load(name="C1", load=1000))
+    plan.add_connection(c, Load(name="C2", load=2000))
+    for name, load in [("C", 3000), ("D", 3000), ("E", 4000)]:
+        plan.add_connection(a2, Load(name=name, load=load))
+    plan.generate()
+
+    # Everything below B is on the phase B is fed from
+    assert plan.graph[a2][b].phase == 1
+    assert {data.phase for _, _, data in plan.graph.out_edges([b, c], data=True)} == {1}
+    phase_loads = plan.phase_loads()
+    assert phase_loads.value(c) == (3000, 0, 0)
+    assert phase_loads.value(b) == (3500, 0, 0)
+    assert phase_loads.value(a2) == (7500, 3000, 3000)
+
+    # Moving B moves everything below it
+    assert plan.balance_phases() == 2
+    assert plan.graph[a2][b].phase == 2
+    assert {data.phase for _, _, data in plan.graph.out_edges([b, c], data=True)} == {2}
+    phase_loads = plan.phase_loads()
+    assert phase_loads.value(c) == (0, 3000, 0)
+    assert phase_loads.value(a2) == (4000, 3500, 6000)
+
+
+def test_port_phase():
+    assert port_phase({"current": 16}) is None
+    assert port_phase({"phase": "L2"}) == 2
+    assert port_phase({"phase": 3}) == 3
+    with pytest.raises(ValueError):
+        port_phase({"phase": "L4"})
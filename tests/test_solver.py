@@ -0,0 +1,200 @@
+import numpy as np
+
+from powerplan import ureg
+from powerplan.data import AMF, MISSING, Distro, Generator, Load, LogicalSource
+
+
+def test_solver_matches_nodes(plan):
+    gen_a = Generator(name="A", type="135kVA")
+    a1 = Distro(name="A1", type="SPEC-4")
+    plan.add_connection(gen_a, a1, 400, 3, length=10)
+
+    gen_b = Generator(name="B", type="135kVA")
+    b1 = Distro(name="B1", type="SPEC-4")
+    plan.add_connection(gen_b, b1, 400, 3, length=10)
+
+    amf = AMF(name="AMF-1", type="125AMF-EVENT")
+    plan.add_connection(a1, amf, 125, 3, length=10)
+    plan.add_connection(b1, amf, 125, 3, length=50)
+
+    ab1 = Distro(name="AB1", type="EPS/63-3")
+    plan.add_connection(amf, ab1, 63, 3, length=25)
+    plan.add_connection(ab1, Load(name="AB1 Load", load="10kW"))
+    plan.generate()
+
+    assert gen_a.load().to("W").magnitude == 10000
+    assert gen_b.load().to("W").magnitude == 10000
+    assert amf.v_drop() == max(amf.v_drop(a1), amf.v_drop(b1))
+    assert amf.z_s() == max(amf.z_s(a1), amf.z_s(b1))
+    assert ab1.v_drop().magnitude == amf.v_drop().magnitude + plan.graph[amf][ab1]["voltage_drop"]
+
+    # Solve for two alternative loads at once
+    solver = plan.solver()
+    loads = np.stack([solver.own_load * 2, solver.own_load * 0])
+    solution = solver.solve(loads)
+    i = solver.index[ab1]
+    assert solution.load[:, i].tolist() == [20000, 0]
+    assert np.isclose(solution.v_drop[0, i], ab1.v_drop().magnitude * 2)
+    assert solution.v_drop[1, i] == 0
+
+
+def test_load_profiles(plan):
+    gen = Generator(name="A", type="135kVA")
+    a1 = Distro(name="A1", type="SPEC-4")
+    plan.add_connection(gen, a1, 400, 3, length=10)
+    a2 = Distro(name="A2", type="EPS/63-3")
+    plan.add_connection(a1, a2, 63, 3, length=25)
+    day = Load(name="Day", profile=[1000, 5000, 2000, 0])
+    night = Load(name="Night", profile=[3000, 0, 1000, 3000])
+    plan.add_connection(a2, day)
+    plan.add_connection(a2, night)
+    plan.add_connection(a1, Load(name="Static", load=500))
+    plan.generate()
+
+    # Static calculations use the peak of each profile
+    assert day.watts == 5000
+    assert gen.load().to("W").magnitude == 8500
+
+    solution = plan.solve_profiles(chunk=3)
+    assert solution.slots == 4
+    assert solution.value("peak_load", gen) == 5500
+    assert solution.value("peak_slot", gen) == 1
+    assert solution.value("mean_load", gen) == 4250
+    assert solution.value("undiversified_load", gen) == 8500
+    assert solution.diversity(gen) == 8500 / 5500
+
+    # The worst voltage drop is at the peak load
+    solver = plan.solver()
+    peak = solver.solve(solver.profile_loads(1, 2))
+    assert np.isclose(solution.value("v_drop", a2), peak.v_drop[0, solver.index[a2]])
+    assert solution.cable_value("voltage_drop", a1, a2) > 0
+
+    night.profile = [3000, 0, 1000, 6000]
+    assert plan.solve_profiles().value("peak_slot", gen) == 3
+
+
+def test_simulate(plan):
+    gen = Generator(name="A", type="135kVA")
+    a1 = Distro(name="A1", type="SPEC-4")
+    plan.add_connection(gen, a1, 400, 3, length=10)
+    a2 = Distro(name="A2", type="EPS/63-3")
+    plan.add_connection(a1, a2, 63, 3, length=25)
+    fixed = Load(name="Fixed", load=10000)
+    risky = Load(name="Risky", load=15000)
+    plan.add_connection(a2, fixed)
+    plan.add_connection(a2, risky)
+    plan.generate()
+
+    distributions = {fixed: lambda rng, size: np.full(size, 10000.0)}
+    result = plan.simulate(2000, uncertainty=0.2, distributions=distributions, seed=1)
+    load = result.node(a2)["load"]
+    assert 22000 < load[5] < load[50] < load[95] < load[99] < 28000
+    assert result.node(a2)["v_drop"][50] > 0
+    assert result.node(gen)["p_overload"] == 0
+
+    # 63A at 400V is 25.2kW, so the breaker is exceeded about 47% of the time
+    p_breaker = result.cable(a1, a2)["p_breaker"]
+    assert 0.4 < p_breaker < 0.55
+    assert result.cable(a1, a2)["p_cable"] <= 1
+    assert result.cable(gen, a1)["p_breaker"] == 0
+    assert result.cable(a2, a1) is MISSING
+
+    # The percentiles are exact, whatever the chunk size
+    chunked = plan.simulate(2000, uncertainty=0.2, distributions=distributions, seed=1, chunk=300)
+    assert np.allclose(chunked.load, result.load)
+    assert np.allclose(chunked.v_drop, result.v_drop, equal_nan=True)
+    assert chunked.cable(a1, a2)["p_breaker"] == p_breaker
+
+
+def test_simulate_apparent_power(plan):
+    gen = Generator(name="A", type="135kVA")
+    a1 = Distro(name="A1", type="SPEC-4")
+    plan.add_connection(gen, a1, 400, 3, length=10)
+    plan.add_connection(a1, Load(name="Load", load=120000))
+    plan.generate()
+    assert plan.simulate(100, uncertainty=0, seed=1).node(gen)["p_overload"] == 0
+
+    # 120kW at a power factor of 0.8 is 150kVA, which overloads the generator
+    plan.power_factor = 0.8
+    assert plan.simulate(100, uncertainty=0, seed=1).node(gen)["p_overload"] == 1
+
+
+def test_power_factor(plan):
+    gen = Generator(name="A", type="135kVA")
+    a1 = Distro(name="A1", type="SPEC-4")
+    plan.add_connection(gen, a1, 400, 3, length=100)
+    a2 = Distro(name="A2", type="EPS/63-3")
+    plan.add_connection(a1, a2, 63, 3, length=50)
+    load = Load(name="Load", load=40000)
+    plan.add_connection(a2, load)
+    plan.generate()
+
+    # With no power factor, the scalar impedance is used
+    cable = plan.graph[gen][a1]
+    assert cable.resistance < cable.impedance
+    length = sum(cable.cable_lengths)
+    assert np.isclose(cable.voltage_drop, 40000 / 400 * cable.impedance * length)
+    # Zs is the magnitude of the complex loop impedance, with Ze in quadrature
+    z_s = abs(1j * gen.z_e().magnitude + (cable.resistance + 1j * cable.reactance) * length)
+    assert np.isclose(a1.z_s().magnitude, z_s)
+    assert np.isclose(a1.r1().magnitude, abs(cable.resistance + 1j * cable.reactance) * length / 2)
+    z_s = a1.z_s()
+
+    # The drop in phase with the voltage is (RP + XQ) / V
+    load.power_factor = 0.8
+    plan.calculate_voltage_drop()
+    expected = (cable.resistance * 40000 + cable.reactance * 30000) / 400 * length
+    assert np.isclose(cable.voltage_drop, expected)
+    # Zs only depends on the cables
+    assert a1.z_s() == z_s
+
+    # A load without a power factor uses the plan's
+    load.power_factor = None
+    plan.power_factor = 0.8
+    plan.calculate_voltage_drop()
+    assert np.isclose(cable.voltage_drop, expected)
+
+    # Mixed power factors are summed as complex power
+    plan.power_factor = None
+    load.power_factor = 0.8
+    plan.add_connection(a1, Load(name="Heater", load=10000, power_factor=1))
+    plan.add_connection(a1, Load(name="Unknown", load=10000))
+    plan.generate()
+    expected += (cable.resistance * 10000 + cable.impedance * 10000) / 400 * length
+    assert np.isclose(cable.voltage_drop, expected)
+    assert plan.node_load(a1) == 60000
+
+
+def test_power_factor_z_s(plan):
+    gen = Generator(name="A", type="135kVA")
+    a1 = Distro(name="A1", type="SPEC-7")
+    plan.add_connection(gen, a1, 400, 3, length=100)
+    a2 = Distro(name="A2", type="EPS/63-3")
+    plan.add_connection(a1, a2, 63, 3, length=50)
+    a3 = Distro(name="A3", type="EPS/63-3")
+    plan.add_connection(a1, a3, 63, 3, length=80)
+    motor = Load(name="Motor", load=20000)
+    plan.add_connection(a2, motor)
+    plan.add_connection(a3, Load(name="Lights", load=5000))
+    plan.generate()
+    z_s = {node: node.z_s() for node in (a1, a2, a3)}
+    v_drop = a3.v_drop()
+
+    # Giving one load a power factor changes voltage drops, but not Zs on any branch
+    motor.power_factor = 0.7
+    assert {node: node.z_s() for node in (a1, a2, a3)} == z_s
+    assert a3.v_drop() != v_drop
+
+
+def test_logical_source_without_v_drop(plan):
+    source = LogicalSource("Grid A", 400 * ureg.V, None, None, 63, 3, None)
+    a1 = Distro(name="A1", type="EPS/63-3")
+    plan.add_connection(source, a1, 63, 3, length=25)
+    plan.add_connection(a1, Load(name="Load", load=10000))
+    # As for the link to an AMF in a grid, the ports are already assigned
+    plan.graph[source][a1].update(out_port=0, in_port=0, connector="IEC 60309")
+    plan.generate()
+
+    # The voltage drop at the source is taken to be zero
+    assert a1.voltage.magnitude == 400
+    assert a1.v_drop().magnitude == plan.graph[source][a1].voltage_drop > 0
@@ -1,6 +1,9 @@
+import os.path
+import shutil
 from math import sqrt
 
-from powerplan import Generator, ureg
+from powerplan import Distro, EquipmentSpec, Generator, Load, Plan, ureg
+from powerplan import spec as spec_module
 
 
 def test_zs(plan):
@@ -13,3 +16,57 @@ def test_zs(plan):
     Ifault = Ibase / spec["transient_reactance"]
     Z = (spec["voltage"] / (sqrt(3) * Ifault)).to(ureg.ohm)
     assert round(Z, 5) == round(gen.z_e(), 5)
+
+
+def test_spec_cache(tmp_path, monkeypatch):
+    fixtures = tmp_path / "spec"
+    shutil.copytree(os.path.join(os.path.dirname(__file__), "fixtures"), fixtures)
+    cache_path = str(tmp_path / "spec.cache")
+
+    spec = EquipmentSpec(str(fixtures), cache_path=cache_path)
+    assert os.path.exists(cache_path)
+
+    parsed = []
+    load = spec_module.yaml.load
+
+    def counting_load(*args, **kwargs):
+        parsed.append(args)
+        return load(*args, **kwargs)
+
+    monkeypatch.setattr(spec_module.yaml, "load", counting_load)
+
+    # Nothing has changed, so nothing is parsed
+    cached = EquipmentSpec(str(fixtures), cache_path=cache_path)
+    assert parsed == []
+    assert cached.distro.keys() == spec.distro.keys()
+    assert cached.generator["135kVA"]["power"] == spec.generator["135kVA"]["power"]
+    assert cached.cables.keys() == spec.cables.keys()
+
+    # Only the changed file is parsed
+    with open(fixtures / "amf.yml", "a") as f:
+        f.write("\n- type: distro\n  ref: NEW-DISTRO\n")
+    updated = EquipmentSpec(str(fixtures), cache_path=cache_path)
+    assert len(parsed) == 1
+    assert "NEW-DISTRO" in updated.distro
+
+
+def test_lazy_spec(spec):
+    lazy = EquipmentSpec(os.path.join(os.path.dirname(__file__), "fixtures"), lazy=True)
+    assert len(lazy) == len(spec)
+    assert lazy.distro.items_loaded == {}
+
+    results = []
+    for s in (spec, lazy):
+        plan = Plan(spec=s)
+        gen = Generator(name="A", type="135kVA")
+        a1 = Distro(name="A1", type="SPEC-7")
+        plan.add_connection(gen, a1, 400, 3, length=10)
+        a2 = Distro(name="A2", type="EPS/63-3")
+        plan.add_connection(a1, a2, 63, 3, length=52)
+        plan.add_connection(a2, Load(name="Load", load="10kW"))
+        plan.generate()
+        results.append((a2.v_drop(), plan.graph[a1][a2]["cable_lengths"]))
+
+    assert results[0] == results[1]
+    assert lazy.distro.items_loaded.keys() == {"SPEC-7", "EPS/63-3"}
+    assert lazy.distro["EPS/63-3"] == spec.distro["EPS/63-3"]
@@ -0,0 +1,24 @@
+from powerplan.data import Distro
+from powerplan.synthetic import plan_size, sized_plan, synthetic_plan
+
+
+def test_synthetic_plan(spec):
+    plan = synthetic_plan(spec, generators=4, depth=3, fanout=3, amfs=2, loads=2)
+    assert len(list(plan.nodes(include_virtual=True))) == plan_size(spec, 4, 3, 3, 2, 2)
+    assert len(plan.validate()) == 0
+
+    plan.generate()
+    assert plan.valid
+    assert len(plan.grids()) == 6
+
+    # Every distro in the tree feeds `fanout` more
+    for node in plan.nodes():
+        if isinstance(node, Distro) and node.name.count(".") < 3:
+            assert sum(1 for child, _ in node.outputs() if type(child) is Distro) == 3
+
+
+def test_sized_plan(spec):
+    for size in (10, 1000):
+        plan = sized_plan(spec, size)
+        nodes = len(list(plan.nodes(include_virtual=True)))
+        assert size * 0.8 <= nodes <= size * 1.2
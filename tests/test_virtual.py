@@ -27,3 +27,19 @@ def test_load(plan):
     assert a1.load().magnitude == 1000
 
     a4.v_drop()
+
+
+def test_load_cache_invalidation(plan):
+    gen = Generator(name="A", type="135kVA")
+    a1 = Distro(name="A1", type="SPEC-7")
+    plan.add_connection(gen, a1, 400, 3, length=10)
+    plan.add_connection(a1, Load(name="A1 Load", load="2kW"))
+
+    assert gen.load().to("W").magnitude == 2000
+
+    a2 = Distro(name="A2", type="EPS/63-4")
+    plan.add_connection(a1, a2, 63, 3, length=52)
+    plan.add_connection(a2, Load(name="A2 Load", load=500))
+
+    assert a2.load().magnitude == 500
+    assert gen.load().to("W").magnitude == 2500